@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Command line turning archived logs of Intel Power Gadget into emissions
+records:
+
+    python -m carbonai archives/ --location FR --output emissions.csv
+"""
+import argparse
+import logging
+import sys
+
+from .emissions import EmissionsFormatter
+from .power_logs import get_power_log_records
+
+LOGGER = logging.getLogger(__name__)
+
+
+def get_parser():
+    """
+    Returns the parser of the command line arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m carbonai",
+        description=(
+            "Turn archived logs of Intel Power Gadget (PwrData_*.csv, "
+            "intelPowerLog.csv) into emissions records."
+        ),
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="directories searched recursively, glob patterns or logs",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help="CSV or Excel file of the records, the standard output by "
+        "default",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of processes parsing the logs, one per CPU by default",
+    )
+    parser.add_argument("--project-name", default="")
+    parser.add_argument("--program-name", default="")
+    parser.add_argument("--client-name", default="")
+    parser.add_argument("--user-name", default="")
+    parser.add_argument(
+        "--location",
+        default="",
+        help="ISO alpha-2 code of the country of the machines, found from "
+        "the IP address when missing",
+    )
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the command line
+
+    Parameters
+    ----------
+    argv : list, optional
+        The arguments, the ones of the command line by default
+    """
+    args = get_parser().parse_args(argv)
+    # the logs come from other machines, the hardware of this one is not
+    # looked for
+    formatter = EmissionsFormatter(
+        project_name=args.project_name,
+        program_name=args.program_name,
+        client_name=args.client_name,
+        user_name=args.user_name,
+        location=args.location,
+        get_country=not args.location,
+        is_online=not args.location,
+    )
+    records = get_power_log_records(
+        args.paths, formatter, max_workers=args.workers
+    )
+    LOGGER.info("%s records were parsed", len(records))
+    if args.output == "-":
+        records.to_csv(sys.stdout, index=False)
+    elif args.output.endswith((".xls", ".xlsx")):
+        records.to_excel(args.output, index=False)
+    else:
+        records.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
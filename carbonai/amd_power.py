@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Python class monitoring the power usage of AMD GPUs through the hwmon
+interface of the amdgpu driver, without any vendor tool
+"""
+__all__ = ["AmdPower"]
+
+import glob
+import logging
+import os
+import time
+from pathlib import Path
+
+from .nvidia_power import SampledGpuPower
+
+LOGGER = logging.getLogger(__name__)
+
+DRM_PATH = Path("/sys/class/drm")
+HWMON_DIRS = "card*/device/hwmon/hwmon*"
+HWMON_NAME_FILE = "name"
+HWMON_ENERGY_FILE = "energy1_input"  # µJ
+HWMON_POWER_FILE = "power1_average"  # µW
+AMDGPU_DRIVER_NAME = "amdgpu"
+HWMON_READ_SIZE = 32
+
+
+class AmdPower(SampledGpuPower):
+    """
+    AMD-based GPU class reading the hwmon sensors of the amdgpu driver.
+
+    The GPUs are discovered under ``/sys/class/drm/card*/device/hwmon``. The
+    energy is read from ``energy1_input`` when the GPU provides it, otherwise
+    it is integrated from ``power1_average``. The sensor files are kept
+    opened and read with ``os.pread`` by the sampler. The driver does not
+    split the power between processes, the whole energy of the GPUs is
+    attributed to the process.
+
+    Parameters
+    ----------
+    interval : float, default 1
+        Time between two samples, in seconds
+    sampler : Sampler, optional
+        Sampler shared with other monitors, a dedicated one is used otherwise
+    drm_path : pathlib.Path, optional
+        Directory of the DRM devices in the sysfs
+    """
+
+    def __init__(self, interval=1, sampler=None, drm_path=DRM_PATH):
+        super().__init__(interval=interval, sampler=sampler)
+        self.drm_path = Path(drm_path)
+        self.__fds = []
+        # True for an energy counter, False for a power sensor
+        self.__energy_counters = []
+        self.__last_values = []
+
+    @staticmethod
+    def find_sensors(drm_path=DRM_PATH):
+        """
+        Returns the sensor file of each AMD GPU
+
+        Parameters
+        ----------
+        drm_path : pathlib.Path, optional
+            Directory of the DRM devices in the sysfs
+
+        Returns
+        -------
+        list
+            the path of the energy counter of each GPU, or of its power sensor
+            when it has no energy counter
+        """
+        sensors = []
+        hwmon_paths = set()
+        for hwmon_dir in sorted(glob.glob(str(Path(drm_path) / HWMON_DIRS))):
+            hwmon_path = Path(hwmon_dir)
+            # the same GPU may be listed by several cards (render nodes, ...)
+            if hwmon_path.resolve() in hwmon_paths:
+                continue
+            hwmon_paths.add(hwmon_path.resolve())
+            name_file = hwmon_path / HWMON_NAME_FILE
+            if (
+                not name_file.exists()
+                or name_file.read_text().strip() != AMDGPU_DRIVER_NAME
+            ):
+                continue
+            for sensor_file in [HWMON_ENERGY_FILE, HWMON_POWER_FILE]:
+                if (hwmon_path / sensor_file).exists():
+                    sensors.append(hwmon_path / sensor_file)
+                    break
+        return sensors
+
+    @classmethod
+    def is_available(cls, drm_path=DRM_PATH):
+        """
+        Whether an AMD GPU with a power sensor is found
+        """
+        return bool(cls.find_sensors(drm_path))
+
+    @staticmethod
+    def __read(fd):
+        return int(os.pread(fd, HWMON_READ_SIZE, 0))
+
+    def start(self):
+        """
+        Open the sensors of the GPUs and start the measure
+        """
+        LOGGER.info("starting GPU power monitoring ...")
+        self.close()
+        for sensor in self.find_sensors(self.drm_path):
+            self.__fds.append(os.open(sensor, os.O_RDONLY))
+            self.__energy_counters.append(sensor.name == HWMON_ENERGY_FILE)
+        self.__last_values = [self.__read(fd) for fd in self.__fds]
+        self.start_sampling()
+
+    def sample(self):
+        """
+        Take one sample of the power usage of every GPU
+        """
+        sample_time = time.monotonic()
+        elapsed_time = sample_time - self.last_sample_time
+        energy = 0  # µJ
+        for index, fd in enumerate(self.__fds):
+            value = self.__read(fd)
+            last_value = self.__last_values[index]
+            if self.__energy_counters[index]:
+                energy += value - last_value
+            else:
+                # trapezoidal integration of the power draws
+                energy += (value + last_value) / 2 * elapsed_time
+            self.__last_values[index] = value
+        self.last_sample_time = sample_time
+        energy /= 3.6e6  # mWh
+        self.power_draws.append((elapsed_time, energy, energy))
+
+    def stop(self):
+        """
+        Stop the measure and close the sensors
+        """
+        LOGGER.info("stopping GPU power monitoring ...")
+        self.stop_sampling()
+        self.close()
+
+    def close(self):
+        """
+        Close the opened sensor files
+        """
+        for fd in self.__fds:
+            os.close(fd)
+        self.__fds = []
+        self.__energy_counters = []
+        self.__last_values = []
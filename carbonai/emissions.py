@@ -0,0 +1,303 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Emissions records
+-----------------
+The project, the user and the location of the emissions records, turning the
+energy used by a measure into its emissions record.
+"""
+__all__ = ["EmissionsFormatter"]
+
+import datetime
+import getpass
+import json
+import logging
+import os
+import sys
+import warnings
+
+import pandas as pd  # type: ignore
+import requests
+
+from .utils import (
+    COUNTRY_CODE_COLUMN,
+    COUNTRY_NAME_COLUMN,
+    DATETIME_FORMAT,
+    ENERGY_MIX_COLUMN,
+    ENERGY_MIX_DATABASE,
+    PACKAGE_PATH,
+    TOTAL_CPU_TIME,
+    TOTAL_ENERGY_ALL,
+    TOTAL_ENERGY_CORE,
+    TOTAL_ENERGY_CPU,
+    TOTAL_ENERGY_GPU,
+    TOTAL_ENERGY_MEMORY,
+    TOTAL_ENERGY_PROCESS_CPU,
+    TOTAL_ENERGY_PROCESS_GPU,
+    TOTAL_ENERGY_PROCESS_MEMORY,
+    TOTAL_ENERGY_PSYS,
+    TOTAL_ENERGY_UNCORE,
+    TOTAL_ENERGY_WALL,
+    TOTAL_GPU_TIME,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+class EmissionsFormatter:
+    """
+    Builds the emissions records of the measures, with the project, the user
+    and the location of a PowerMeter.
+
+    It does not monitor the power usage, the records of archived logs are
+    built with it without looking for the hardware of the machine.
+
+    Parameters
+    ----------
+    project_name : str, default current_environment_name
+        Name of the project you are working on.
+    program_name : str, optional
+        Name of the program you are working on.
+    client_name : str, optional
+        Name of the client you are working for.
+    user_name : str, default computer_user_name
+        The name of the user using the tool (for logging purpose).
+    location : str, optional
+        Country ISO Code, found from the IP address when missing
+    get_country : bool, default True
+        Whether to retrieve user country location or not (uses the user IP).
+    is_online : boolean, default True
+        Whether the machine is connected to the internet or not.
+    """
+
+    LAPTOP_PUE = 1.3  # pue for my laptop
+    SERVER_PUE = 1.58  # pue for a server
+    DEFAULT_LOCATION = "FR"
+
+    def __init__(
+        self,
+        project_name="",
+        program_name="",
+        client_name="",
+        user_name="",
+        location="",
+        get_country=True,
+        is_online=True,
+    ):
+        self.user = self.__set_username(user_name)
+
+        self.project = self.__set_project_name(project_name)
+        self.program_name = self.__set_project_entity(program_name)
+        self.client_name = self.__set_project_entity(client_name)
+
+        self.is_online = is_online
+        self.location = self.__set_location(location, get_country)
+
+        self.energy_mix_db = self.__load_energy_mix_db()
+        self.energy_mix = self.__get_energy_mix()  # kgCO2e/kWh
+        self.location_name = self.__get_location_name()
+
+    @staticmethod
+    def __load_energy_mix_db():
+        return pd.read_csv(
+            PACKAGE_PATH / ENERGY_MIX_DATABASE, encoding="utf-8"
+        )
+
+    @staticmethod
+    def __extract_env_name():
+        env = "unknown"
+        try:
+            env = os.environ["CONDA_DEFAULT_ENV"]
+        except KeyError:
+            pass
+        if hasattr(sys, "base_prefix") and sys.base_prefix != sys.prefix:
+            env = sys.base_prefix.split("/")[-1]
+        return env
+
+    @staticmethod
+    def __get_country():
+        """
+        Retrieve the ISO code country
+        Beware of the encoding
+        cf. from https://stackoverflow.com/questions/40059654/python-convert-
+        a-bytes-array-into-json-format
+        """
+        request = requests.get("http://ipinfo.io/json")
+        response = request.content.decode("utf8").replace("'", '"')
+        user_info = json.loads(response)
+        return user_info["country"]
+
+    @classmethod
+    def get_pue(cls, platform):
+        """
+        Returns the PUE of a machine running on a platform
+
+        Parameters
+        ----------
+        platform : str
+            ``sys.platform`` of the machine
+
+        Returns
+        -------
+        float
+            the PUE of a laptop on Mac and Windows, of a server otherwise
+        """
+        if platform in ["darwin", "win32"]:
+            return cls.LAPTOP_PUE  # pue for my laptop
+        return cls.SERVER_PUE  # pue for a server
+
+    def __set_username(self, user_name):
+        if user_name:
+            return user_name
+        return getpass.getuser()
+
+    def __set_project_name(self, project_name):
+        if project_name:
+            return project_name
+        return self.__extract_env_name()
+
+    def __set_project_entity(self, entity_name):
+        if entity_name:
+            return entity_name
+        return "--"
+
+    def __set_location(self, provided_location, get_country):
+        # Set the location used to convert energy usage to carbon emissions
+        # if the location is provided, we use it
+        # if it's not and we can use the internet and the user authorize us to
+        # #do so then we retrieve it from the IP address
+        # otherwise set the location to default
+        if provided_location:
+            location = provided_location
+        elif self.is_online and get_country:
+            location = self.__get_country()
+        else:
+            warnings.warn(
+                "No location was set, we will fallback to \
+                the default location: {}".format(
+                    self.DEFAULT_LOCATION
+                )
+            )
+            location = self.DEFAULT_LOCATION
+        return location
+
+    def __get_energy_mix(self):
+        if not (
+            self.energy_mix_db[COUNTRY_CODE_COLUMN] == self.location
+        ).any():
+            raise NameError(
+                "The location input was not found, make sure you wrote "
+                "the isocode of your country. You used " + self.location
+            )
+        return self.energy_mix_db.loc[
+            self.energy_mix_db[COUNTRY_CODE_COLUMN] == self.location,
+            ENERGY_MIX_COLUMN,
+        ].values[0]
+
+    def __get_location_name(self):
+        return self.energy_mix_db.loc[
+            self.energy_mix_db[COUNTRY_CODE_COLUMN] == self.location,
+            COUNTRY_NAME_COLUMN,
+        ].values[0]
+
+    def get_co2_emitted(self, record, pue):
+        """
+        Implement the cO2 emission value
+
+        Parameters:
+        -----------
+        record (dict):
+            CPU and GPU's record of a measure
+        pue (float):
+            PUE of the machine measured
+
+        Returns
+        -------
+        co2_emitted (float)
+        """
+        used_energy = pue * (
+            record[TOTAL_ENERGY_PROCESS_CPU]
+            + record[TOTAL_ENERGY_PROCESS_MEMORY]
+            + record[TOTAL_ENERGY_PROCESS_GPU]
+        )  # mWh
+        co2_emitted = used_energy * self.energy_mix * 1e-3
+        LOGGER.info(
+            "This process emitted %.3fg of CO2 (using the energy mix of %s)",
+            co2_emitted,
+            self.location_name,
+        )
+
+        return co2_emitted
+
+    def get_payload(self, record, measure, record_time=None, platform=None):
+        """
+        Build the emissions record of a measure, as written in the emissions
+        file and sent to the API
+
+        Parameters
+        ----------
+        record : dict
+            the energies and times used during the measure
+        measure : Measure
+            the measure of the record
+        record_time : datetime.datetime, optional
+            the time of the record, now by default
+        platform : str, optional
+            ``sys.platform`` of the machine measured, the one of this machine
+            by default
+
+        Returns
+        -------
+        dict
+            the emissions record
+        """
+        if record_time is None:
+            record_time = datetime.datetime.now()
+        if platform is None:
+            platform = sys.platform
+        pue = self.get_pue(platform)
+        co2_emitted = self.get_co2_emitted(record, pue=pue)
+        return {
+            "Datetime": record_time.strftime(DATETIME_FORMAT),
+            "Country": self.location_name,
+            "Platform": platform,
+            "User ID": self.user,
+            "ISO": self.location,
+            "Project name": self.project,
+            "Program name": self.program_name,
+            "Client name": self.client_name,
+            "Total Elapsed CPU Time (sec)": record[TOTAL_CPU_TIME],
+            "Total Elapsed GPU Time (sec)": record[TOTAL_GPU_TIME],
+            "Cumulative Package Energy (mWh)": record[TOTAL_ENERGY_ALL],
+            "Cumulative IA Energy (mWh)": record[TOTAL_ENERGY_CPU],
+            "Cumulative GPU Energy (mWh)": record[TOTAL_ENERGY_GPU],
+            "Cumulative DRAM Energy (mWh)": record[TOTAL_ENERGY_MEMORY],
+            "Cumulative process CPU Energy (mWh)": record[
+                TOTAL_ENERGY_PROCESS_CPU
+            ],
+            "Cumulative process DRAM Energy (mWh)": record[
+                TOTAL_ENERGY_PROCESS_MEMORY
+            ],
+            "Cumulative process GPU Energy (mWh)": record[
+                TOTAL_ENERGY_PROCESS_GPU
+            ],
+            "Cumulative Core Energy (mWh)": record.get(TOTAL_ENERGY_CORE, 0),
+            "Cumulative Uncore Energy (mWh)": record.get(
+                TOTAL_ENERGY_UNCORE, 0
+            ),
+            "Cumulative Platform Energy (mWh)": record.get(
+                TOTAL_ENERGY_PSYS, 0
+            ),
+            "Cumulative Wall Energy (mWh)": record.get(TOTAL_ENERGY_WALL, 0),
+            "PUE": pue,
+            "CO2 emitted (gCO2e)": co2_emitted,
+            "Package": measure.package,
+            "Algorithm": measure.algorithm,
+            "Algorithm's parameters": measure.algorithm_params,
+            "Data type": measure.data_type,
+            "Data shape": measure.data_shape,
+            "Comment": measure.comments,
+            "Step": measure.step,
+            "Measure ID": measure.measure_id,
+            "Parent measure ID": measure.parent_id,
+        }
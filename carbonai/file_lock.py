@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Locks and appends on the files shared by several processes, such as an
+emissions file written by the workers of a node
+"""
+__all__ = ["FileLock", "append_to_file"]
+
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt  # type: ignore
+
+LOCK_SUFFIX = ".lock"
+
+
+class FileLock:
+    """
+    Exclusive lock on a file shared by several processes
+
+    The lock is held on a ``<file>.lock`` file next to the file, with
+    ``flock`` on POSIX and ``msvcrt.locking`` on Windows, and it is waited
+    for as long as it is held. The lock file is kept afterwards, removing it
+    would let two processes hold the lock. Each use of the context manager
+    opens the lock file, the threads of a process exclude each other as well.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path of the file to lock
+
+    Examples
+    --------
+    >>> with FileLock("emissions.csv"):
+    ...     write_records()
+    """
+
+    def __init__(self, path):
+        self.lock_path = Path(str(path) + LOCK_SUFFIX)
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        # LK_LOCK gives up after 10 seconds, it is retried
+                        # to wait for the lock as long as flock does
+                        msvcrt.locking(self.fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+        except BaseException:
+            os.close(self.fd)
+            self.fd = None
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        os.close(self.fd)
+        self.fd = None
+
+
+def append_to_file(path, text):
+    """
+    Append text to a file with a single write
+
+    The file is opened in append mode, the text is written at its end even
+    when other processes append to it as well.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path of the file, created if needed
+    text : str
+        The text to append
+    """
+    data = text.encode("utf-8")
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        written = os.write(fd, data)
+        # a very large write may be split
+        while written < len(data):
+            written += os.write(fd, data[written:])
+    finally:
+        os.close(fd)
@@ -0,0 +1,248 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Python class monitoring the wall power of a server with the DCMI power
+readings of its BMC, through a long running ``ipmitool shell``
+"""
+__all__ = ["IpmiPower"]
+
+import collections
+import logging
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+from .sampler import Sampler
+from .utils import TOTAL_ENERGY_WALL
+
+LOGGER = logging.getLogger(__name__)
+
+IPMI_COMMAND = ["ipmitool", "shell"]
+# the output of the shell is line buffered, it is fully buffered on a pipe
+LINE_BUFFERING_COMMAND = ["stdbuf", "-oL"]
+IPMI_REQUEST = "dcmi power reading"
+IPMI_POWER_REGEX = re.compile(
+    rb"Instantaneous power reading:\s*(\d+(?:\.\d+)?)\s*Watts"
+)
+# the BMC is not read more often
+IPMI_MIN_INTERVAL = 1  # seconds
+# a request without answer after this delay is considered lost
+IPMI_TIMEOUT = 10  # seconds
+
+
+class IpmiPower:
+    """
+    Wall power of the node read from its BMC with IPMI DCMI.
+
+    A single IPMI shell is started with the first measure and kept alive
+    until :func:`IpmiPower.close`, the sampler writes a power reading request
+    to its input at each interval and a background thread parses its output
+    as it arrives. The energy is integrated from the times at which the
+    readings were requested, the output of the shell is line buffered with
+    ``stdbuf`` when available.
+
+    Parameters
+    ----------
+    interval : float, default 1
+        Time between two power readings, in seconds
+    sampler : Sampler, optional
+        Sampler shared with other monitors, a dedicated one is used otherwise
+    command : list, optional
+        Command of the IPMI shell, ``ipmitool shell`` by default. Any command
+        reading the requests on its input and writing the DCMI readings on
+        its output may be used (for instance ipmitool with the options of a
+        remote BMC)
+    request : str, optional
+        Request written to the shell to read the power
+    """
+
+    def __init__(
+        self, interval=1, sampler=None, command=None, request=IPMI_REQUEST
+    ):
+        self.interval = interval
+        self.command = list(command) if command else IPMI_COMMAND
+        self.request = request.encode() + b"\n"
+        self.owns_sampler = sampler is None
+        if sampler is None:
+            sampler = Sampler(interval=interval)
+        self.sampler = sampler
+        self.sampler.add(self.__request_reading)
+        self.lock = threading.Lock()
+        self.process = None
+        self.reader_thread = None
+        self.sampling = False
+        self.last_request_time = None
+        self.pending_request = False
+        # times of the requests waiting for their reading
+        self.request_times = collections.deque()
+        self.energy = 0  # mWh
+        self.last_reading = None  # (monotonic time, power in W)
+        self.record = {TOTAL_ENERGY_WALL: 0}
+
+    @staticmethod
+    def is_available(command=None):
+        """
+        Whether the program of the IPMI shell is installed
+        """
+        command = list(command) if command else IPMI_COMMAND
+        return shutil.which(command[0]) is not None
+
+    @property
+    def running(self):
+        """
+        Whether the IPMI shell is running
+        """
+        return self.process is not None and self.process.poll() is None
+
+    def __start_process(self):
+        LOGGER.info("starting the IPMI shell ...")
+        command = self.command
+        if shutil.which(LINE_BUFFERING_COMMAND[0]):
+            command = LINE_BUFFERING_COMMAND + command
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.pending_request = False
+        self.request_times.clear()
+        self.reader_thread = threading.Thread(
+            target=self.__read_stream,
+            args=(self.process.stdout,),
+            name="carbonai-ipmi",
+            daemon=True,
+        )
+        self.reader_thread.start()
+
+    def __read_stream(self, stream):
+        for line in stream:
+            match = IPMI_POWER_REGEX.search(line)
+            if match:
+                with self.lock:
+                    if self.request_times:
+                        reading_time = self.request_times.popleft()
+                    else:
+                        reading_time = time.monotonic()
+                self.add_reading(float(match.group(1)), reading_time)
+
+    def add_reading(self, power, reading_time):
+        """
+        Integrate a power reading
+
+        Parameters
+        ----------
+        power : float
+            the power read (W)
+        reading_time : float
+            time of the reading, on the monotonic clock
+        """
+        with self.lock:
+            self.pending_request = False
+            if self.last_reading is not None:
+                last_time, last_power = self.last_reading
+                # the energy up to a snapshot taken after the reading was
+                # requested is already counted
+                if reading_time < last_time:
+                    reading_time = last_time
+                elif self.sampling:
+                    # trapezoidal integration, from W.s to mWh
+                    self.energy += (
+                        (power + last_power)
+                        / 2
+                        * (reading_time - last_time)
+                        / 3.6
+                    )
+            self.last_reading = (reading_time, power)
+
+    def __request_reading(self):
+        if not self.sampling or not self.running:
+            return
+        now = time.monotonic()
+        if self.last_request_time is not None and (
+            now - self.last_request_time < self.interval
+            or (
+                self.pending_request
+                and now - self.last_request_time < IPMI_TIMEOUT
+            )
+        ):
+            return
+        with self.lock:
+            if self.pending_request:
+                # the request was lost
+                self.request_times.clear()
+            self.request_times.append(now)
+            self.pending_request = True
+        self.last_request_time = now
+        try:
+            self.process.stdin.write(self.request)
+            self.process.stdin.flush()
+        except OSError:
+            LOGGER.error("* the IPMI shell has stopped *")
+
+    def start(self):
+        """
+        Start the IPMI shell if needed and reset the energy
+        """
+        if not self.running:
+            self.__start_process()
+        with self.lock:
+            self.energy = 0
+            self.last_reading = None
+            self.request_times.clear()
+            self.sampling = True
+        self.last_request_time = None
+        self.__request_reading()
+        if self.owns_sampler:
+            self.sampler.start()
+
+    def snapshot(self):
+        """
+        Returns the cumulative wall energy since the start, extrapolated up to
+        now with the last power reading
+
+        The extrapolated energy is counted, the next reading is integrated
+        from now on so that the cumulative energy never decreases.
+        """
+        with self.lock:
+            if self.last_reading is not None and self.sampling:
+                last_time, last_power = self.last_reading
+                now = time.monotonic()
+                if now > last_time:
+                    self.energy += last_power * (now - last_time) / 3.6
+                    self.last_reading = (now, last_power)
+            return {TOTAL_ENERGY_WALL: self.energy}
+
+    def stop(self):
+        """
+        Stop reading the power, the IPMI shell is kept alive for the next
+        measures
+        """
+        if self.owns_sampler:
+            self.sampler.stop(final_sample=False)
+        self.record = self.snapshot()
+        with self.lock:
+            self.sampling = False
+
+    def close(self):
+        """
+        Stop the IPMI shell
+        """
+        if self.process is None:
+            return
+        LOGGER.info("stopping the IPMI shell ...")
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=IPMI_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.reader_thread.join()
+        self.process.stdout.close()
+        self.process = None
+        self.reader_thread = None
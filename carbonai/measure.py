@@ -0,0 +1,396 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Measure
+-------
+A measure delimits a sample of code in the stream of samples collected by a
+PowerMeter. Measures may be nested, a parent measure includes the energy used
+by its children.
+"""
+__all__ = ["Measure", "MeasureContext", "TaskClock", "get_task_clock"]
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import uuid
+import weakref
+
+from .utils import (
+    AVAILABLE_STEPS,
+    TOTAL_ENERGY_CPU,
+    TOTAL_ENERGY_PROCESS_CPU,
+    TOTAL_ENERGY_PROCESS_MEMORY,
+    match,
+    normalize,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+# clock of the asyncio task running, inherited by the tasks it creates
+TASK_CLOCK = contextvars.ContextVar("carbonai_task_clock", default=None)
+# event loops counting the CPU time of the steps of the tasks
+COUNTED_LOOPS: "weakref.WeakSet[asyncio.AbstractEventLoop]" = (
+    weakref.WeakSet()
+)
+# whether a counted step runs in the thread
+COUNTED_STEP = threading.local()
+
+
+class Measure:
+    """
+    A measure of the power usage of a sample of code.
+
+    Its record is the difference between the cumulative energies and times
+    read at its start and at its stop. When the CPU times are given, the
+    process energy is attributed to the thread which started the measure, or
+    to its asyncio task when it follows the clock of the task.
+
+    Parameters
+    ----------
+    package : str
+        A string describing the package used by the code measured
+    algorithm : str
+        A string describing the algorithm used in the code measured
+    step : str, optional
+        A string to provide useful information on the current stage
+        of the algorithm
+    data_type : str, optional
+        A string describing the type of data used
+    data_shape : str or tuple, optional
+        A string or tuple describing the quantity of data used
+    algorithm_params : str, optional
+        A string describing the parameters used by the algorithm
+    comments : str, optional
+        A string to provide any useful information
+    parent : Measure, optional
+        The measure in which this one is nested
+    """
+
+    def __init__(
+        self,
+        package,
+        algorithm,
+        step="other",
+        data_type="",
+        data_shape="",
+        algorithm_params="",
+        comments="",
+        parent=None,
+    ):
+        self.measure_id = uuid.uuid4().hex
+        self.package = normalize(package)
+        self.algorithm = normalize(algorithm)
+        self.step = normalize(match(step, AVAILABLE_STEPS))
+        self.data_type = normalize(data_type)
+        self.data_shape = normalize(data_shape)
+        self.algorithm_params = normalize(algorithm_params)
+        self.comments = normalize(comments)
+        self.parent = parent
+        self.children = []
+        if parent is not None:
+            parent.children.append(self)
+        self.thread_id = threading.get_native_id()
+        self.start_snapshot = None
+        self.start_cpu_times = None
+        # whether the process energy is attributed to the thread whatever the
+        # attribution of the PowerMeter
+        self.follows_thread = False
+        # clock of the asyncio task of the measure, None when the measure
+        # does not follow a task
+        self.task_clock = None
+        self.start_task_time = None
+        # CPU time used while the task of the measure was running
+        self.task_time = None
+        self.record = None
+
+    @property
+    def parent_id(self):
+        """
+        Id of the parent measure, empty for a top level measure
+        """
+        return self.parent.measure_id if self.parent is not None else ""
+
+    def follow_task(self, clock):
+        """
+        Attribute the process energy with the CPU time used by the steps of
+        an asyncio task, instead of the CPU time of the thread
+
+        It is called from the task, before the start and the stop of the
+        measure.
+
+        Parameters
+        ----------
+        clock : TaskClock
+            the clock of the task running the measure
+        """
+        if self.start_task_time is None:
+            self.task_clock = clock
+            self.start_task_time = clock.read()
+        else:
+            self.task_time = clock.read() - self.start_task_time
+
+    @property
+    def running(self):
+        """
+        Whether the measure has started and is not stopped yet
+        """
+        return self.start_snapshot is not None and self.record is None
+
+    def start(self, snapshot, cpu_times=None):
+        """
+        Start the measure
+
+        Parameters
+        ----------
+        snapshot : dict
+            the cumulative energies and times at the start of the measure
+        cpu_times : tuple, optional
+            the busy time of the machine, the CPU time of the process and of
+            the thread at the start of the measure
+        """
+        self.start_snapshot = snapshot
+        self.start_cpu_times = cpu_times
+
+    def stop(self, snapshot, cpu_times=None):
+        """
+        Stop the measure and compute its record
+
+        Parameters
+        ----------
+        snapshot : dict
+            the cumulative energies and times at the stop of the measure
+        cpu_times : tuple, optional
+            the busy time of the machine, the CPU time of the process and of
+            the thread at the stop of the measure, the CPU time of the thread
+            is None when it has exited
+
+        Returns
+        -------
+        dict
+            the energies and times used during the measure
+        """
+        record = {
+            key: value - self.start_snapshot.get(key, 0)
+            for key, value in snapshot.items()
+        }
+        thread_time = None
+        if self.start_cpu_times is not None and cpu_times is not None:
+            busy_time, process_time = (
+                end - start
+                for end, start in zip(cpu_times[:2], self.start_cpu_times)
+            )
+            if self.task_time is not None:
+                thread_time = self.task_time
+            elif None not in (cpu_times[2], self.start_cpu_times[2]):
+                thread_time = cpu_times[2] - self.start_cpu_times[2]
+        # the energy stays attributed to the process when the thread of the
+        # measure has exited before its stop
+        if thread_time is not None:
+            cpu_share = min(thread_time / busy_time, 1) if busy_time else 0
+            process_share = (
+                min(thread_time / process_time, 1) if process_time else 0
+            )
+            record[TOTAL_ENERGY_PROCESS_CPU] = (
+                record[TOTAL_ENERGY_CPU] * cpu_share
+            )
+            # threads share the memory of the process, it is split with the
+            # share of the process CPU time used by the thread
+            record[TOTAL_ENERGY_PROCESS_MEMORY] *= process_share
+        self.record = record
+        return self.record
+
+
+class MeasureContext:
+    """
+    Context manager measuring the power usage of a block of code with a
+    PowerMeter.
+
+    A new measure is started each time the context is entered, so that
+    several threads or asyncio tasks can measure their code with the same
+    PowerMeter. It may be used with a with or an async with statement.
+
+    Parameters
+    ----------
+    power_meter : PowerMeter
+        The PowerMeter recording the measure
+    **arguments
+        The arguments of :func:`PowerMeter.start_measure`
+    """
+
+    def __init__(self, power_meter, **arguments):
+        self.power_meter = power_meter
+        self.arguments = arguments
+        # the measures of the entries not exited yet, in each thread and task
+        self.__measures = contextvars.ContextVar(
+            f"carbonai_measure_context_{id(self)}", default=()
+        )
+
+    def __push_measure(self, measure):
+        self.__measures.set(self.__measures.get() + (measure,))
+        return measure
+
+    def __pop_measure(self):
+        *measures, measure = self.__measures.get()
+        self.__measures.set(tuple(measures))
+        return measure
+
+    def __enter__(self):
+        return self.__push_measure(
+            self.power_meter.start_measure(**self.arguments)
+        )
+
+    def __exit__(self, exit_type, value, traceback):
+        self.power_meter.stop_measure(self.__pop_measure())
+
+    async def __aenter__(self):
+        return self.__push_measure(
+            await self.power_meter.start_measure_async(**self.arguments)
+        )
+
+    async def __aexit__(self, exit_type, value, traceback):
+        await self.power_meter.stop_measure_async(self.__pop_measure())
+
+
+class TaskClock:
+    """
+    CPU time used by the steps of an asyncio task and of the tasks it creates
+
+    The steps are counted by the event loop once :func:`get_task_clock` is
+    called from one of its tasks. The time spent waiting for other tasks of
+    the event loop is not counted.
+
+    Parameters
+    ----------
+    task : asyncio.Task
+        The task of the clock
+    parent : TaskClock, optional
+        The clock of the task which created this one, it counts the steps of
+        this task too
+    """
+
+    def __init__(self, task, parent=None):
+        self.task = weakref.ref(task)
+        self.parent = parent
+        self.time = 0.0
+        # thread time at the start of the running step
+        self.resumed = None
+
+    def resume(self):
+        """
+        Start counting a step of the task
+        """
+        self.resumed = time.thread_time()
+
+    def suspend(self):
+        """
+        Stop counting a step of the task
+        """
+        if self.resumed is None:
+            return
+        elapsed = time.thread_time() - self.resumed
+        self.resumed = None
+        clock = self
+        while clock is not None:
+            clock.time += elapsed
+            clock = clock.parent
+
+    def read(self):
+        """
+        Returns the CPU time of the task, including the running step
+
+        Returns
+        -------
+        float
+            the CPU time in seconds
+        """
+        if self.resumed is None:
+            return self.time
+        return self.time + time.thread_time() - self.resumed
+
+
+def count_task_steps(loop):
+    """
+    Make an event loop count the CPU time of the steps of the tasks with a
+    clock
+
+    The steps of the tasks are scheduled with ``loop.call_soon`` in the
+    context of the task, it is wrapped to resume and suspend the clock of
+    this context around each callback.
+
+    Parameters
+    ----------
+    loop : asyncio.AbstractEventLoop
+        The event loop
+
+    Returns
+    -------
+    bool
+        whether the steps are counted, the call_soon of some event loops
+        (uvloop) can't be wrapped
+    """
+    if loop in COUNTED_LOOPS:
+        return True
+    call_soon = loop.call_soon
+
+    def counted_call_soon(callback, *args, context=None):
+        def step(*args):
+            clock = TASK_CLOCK.get()
+            if clock is not None:
+                clock.resume()
+            COUNTED_STEP.running = True
+            try:
+                return callback(*args)
+            finally:
+                COUNTED_STEP.running = False
+                # the step may have started the clock of its task
+                clock = TASK_CLOCK.get()
+                if clock is not None:
+                    clock.suspend()
+
+        return call_soon(step, *args, context=context)
+
+    try:
+        loop.call_soon = counted_call_soon
+        COUNTED_LOOPS.add(loop)
+    except (AttributeError, TypeError):
+        LOGGER.info(
+            "The steps of the tasks of %s can't be counted, the energy of "
+            "the measures is attributed with the CPU time of its thread",
+            type(loop).__name__,
+        )
+        return False
+    return True
+
+
+def get_task_clock():
+    """
+    Returns the clock of the running asyncio task, created on the first call
+    from the task
+
+    Returns
+    -------
+    TaskClock
+        the clock of the task, None outside of a task or when the event loop
+        can't count the steps of its tasks
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    task = asyncio.current_task(loop)
+    if task is None or not count_task_steps(loop):
+        return None
+    clock = TASK_CLOCK.get()
+    if clock is None or clock.task() is not task:
+        if clock is not None:
+            # the step was counted by the clock of the parent task so far
+            clock.suspend()
+        clock = TaskClock(task, parent=clock)
+        if getattr(COUNTED_STEP, "running", False):
+            # the current step is counted from now on, it isn't when it was
+            # scheduled before the loop counted the steps
+            clock.resume()
+        TASK_CLOCK.set(clock)
+    return clock
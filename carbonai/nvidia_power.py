@@ -4,24 +4,36 @@
 Python classes monitoring GPU's power usage
 during a time delimited between a start and a stop methods
 """
-__all__ = ["NoGpuPower", "NvidiaPower"]
+__all__ = ["NoGpuPower", "NvidiaPower", "NvmlPower", "SampledGpuPower"]
 
 import abc
+import datetime
 import logging
 import os
-import re
 import signal
 import subprocess
-from pathlib import Path
+import threading
+import time
 
-import numpy as np  # type: ignore
-import pandas as pd  # type: ignore
+from .sample_buffer import SampleBuffer
+from .sampler import Sampler
+from .utils import TOTAL_ENERGY_GPU, TOTAL_ENERGY_PROCESS_GPU, TOTAL_GPU_TIME
 
-from .utils import TOTAL_ENERGY_GPU, TOTAL_GPU_TIME
+try:
+    import pynvml  # type: ignore
+except ImportError:
+    pynvml = None
 
 LOGGER = logging.getLogger(__name__)
 
-NVIDIAPOWERLOG_FILENAME = "nvidiaPowerLog.csv"
+NVIDIA_SMI_QUERY = "--query-gpu=index,timestamp,power.draw"
+NVIDIA_SMI_FORMAT = "--format=csv,noheader,nounits"
+NVIDIA_SMI_TIMESTAMP_FORMAT = "%Y/%m/%d %H:%M:%S.%f"
+GPU_SAMPLE_COLUMNS = [
+    TOTAL_GPU_TIME,
+    TOTAL_ENERGY_GPU,
+    TOTAL_ENERGY_PROCESS_GPU,
+]
 
 
 class GpuPower(abc.ABC):
@@ -35,7 +47,11 @@ class GpuPower(abc.ABC):
     """
 
     def __init__(self):
-        self.record = {TOTAL_GPU_TIME: 0, TOTAL_ENERGY_GPU: 0}
+        self.record = {
+            TOTAL_GPU_TIME: 0,
+            TOTAL_ENERGY_GPU: 0,
+            TOTAL_ENERGY_PROCESS_GPU: 0,
+        }
 
     def start(self):
         """
@@ -52,6 +68,12 @@ class GpuPower(abc.ABC):
         Extract relevant information from the logs.
         """
 
+    def snapshot(self):
+        """
+        Returns the cumulative energy and time since the start.
+        """
+        return dict(self.record)
+
 
 class NoGpuPower(GpuPower):
     """
@@ -64,22 +86,42 @@ class NoGpuPower(GpuPower):
 
 class NvidiaPower(GpuPower):
     """
-    NVIDIA-based GPU class
+    NVIDIA-based GPU class reading the power draws streamed by nvidia-smi.
+
+    ``nvidia-smi --query-gpu`` writes one CSV line per GPU and per interval
+    to a pipe read by a background thread. The energy of each GPU is
+    integrated as the lines arrive, with the timestamps of the power draws,
+    so nothing is left to parse at the end of the measure. nvidia-smi does not
+    split the power draws between processes, the whole energy of the GPUs is
+    attributed to the process.
 
     Parameters
     ----------
-    interval (int)
-        interval to which log power in the log_path file
+    interval : float, default 1
+        Time between two power draws, in seconds (rounded to the
+        millisecond)
     """
 
     def __init__(self, interval=1):
         super().__init__()
-        self.log_file = (
-            Path(os.path.dirname(os.path.abspath(__file__)))
-            / NVIDIAPOWERLOG_FILENAME
-        )
-        self.logging_process = None
         self.interval = interval
+        self.logging_process = None
+        self.reader_thread = None
+        self.lock = threading.Lock()
+        # index of the GPU: [timestamp and power of the last draw, energy]
+        self.devices = {}
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    @property
+    def device_energies(self):
+        """
+        Energy (in mWh) used by each GPU since the start, by index
+        """
+        with self.lock:
+            return {
+                index: energy for index, (_, _, energy) in self.devices.items()
+            }
 
     def start(self):
         """
@@ -89,60 +131,350 @@ class NvidiaPower(GpuPower):
             self.stop()
 
         LOGGER.info("starting GPU power monitoring ...")
-
+        with self.lock:
+            self.devices = {}
+            self.first_timestamp = None
+            self.last_timestamp = None
         self.logging_process = subprocess.Popen(
             [
                 "nvidia-smi",
-                "-f",
-                str(self.log_file),
-                "-q",
-                "-d",
-                "POWER",
-                "-l",
-                str(self.interval),
-            ]
+                NVIDIA_SMI_QUERY,
+                NVIDIA_SMI_FORMAT,
+                "-lms",
+                str(max(1, round(self.interval * 1000))),
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        self.reader_thread = threading.Thread(
+            target=self.__read_stream,
+            args=(self.logging_process.stdout,),
+            name="carbonai-nvidia-smi",
+            daemon=True,
         )
+        self.reader_thread.start()
 
     def stop(self):
         """
         Stop the measure process if started
         """
         LOGGER.info("stopping GPU power monitoring ...")
-        self.logging_process.send_signal(signal.SIGINT)
-        self.logging_process = None
+        if self.logging_process is not None:
+            self.logging_process.send_signal(signal.SIGINT)
+            self.logging_process.wait()
+            self.reader_thread.join()
+            self.logging_process.stdout.close()
+            self.logging_process = None
+            self.reader_thread = None
+        self.record = self.snapshot()
+
+    def __read_stream(self, stream):
+        for line in stream:
+            try:
+                self.parse_line(line)
+            except ValueError:
+                LOGGER.debug("Invalid nvidia-smi line: %s", line.strip())
+
+    def parse_line(self, line):
+        """
+        Add the power draw of a line of nvidia-smi to the energy of its GPU
+
+        Parameters
+        ----------
+        line : str
+            a line with the index of the GPU, the timestamp and the power draw
+            (in W), for instance ``0, 2022/05/03 12:00:00.120, 63.50``
+        """
+        index, timestamp, power = (field.strip() for field in line.split(","))
+        timestamp = datetime.datetime.strptime(
+            timestamp, NVIDIA_SMI_TIMESTAMP_FORMAT
+        )
+        # the power draw of some GPUs is [N/A]
+        power = float(power)
+        with self.lock:
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+            if self.last_timestamp is None or timestamp > self.last_timestamp:
+                self.last_timestamp = timestamp
+            device = self.devices.setdefault(int(index), [timestamp, power, 0])
+            last_timestamp, last_power, _ = device
+            elapsed_time = (timestamp - last_timestamp).total_seconds()
+            # trapezoidal integration, from W.s to mWh
+            device[2] += (power + last_power) / 2 * elapsed_time / 3.6
+            device[0] = timestamp
+            device[1] = power
 
     def parse_log(self):
         """
-        Extract power as logged in the last measure process
-        Returns:
-        -------
-        results (pandas.DataFrame)
-            all records with associated ellapsed times
+        Set the record of the measure from the power draws read so far
+        """
+        self.record = self.snapshot()
+
+    def snapshot(self):
+        """
+        Returns the cumulative energy and time since the start, from the
+        power draws read so far.
+        """
+        with self.lock:
+            if self.first_timestamp is None:
+                return {
+                    TOTAL_GPU_TIME: 0,
+                    TOTAL_ENERGY_GPU: 0,
+                    TOTAL_ENERGY_PROCESS_GPU: 0,
+                }
+            energy = sum(energy for _, _, energy in self.devices.values())
+            return {
+                TOTAL_GPU_TIME: (
+                    self.last_timestamp - self.first_timestamp
+                ).total_seconds(),
+                TOTAL_ENERGY_GPU: energy,
+                TOTAL_ENERGY_PROCESS_GPU: energy,
+            }
+
+
+class SampledGpuPower(GpuPower):
+    """
+    Base class of the GPU monitors whose samples are taken by a sampler,
+    usually shared with the power gadget.
+
+    The subclasses implement ``sample``, which appends the time elapsed and
+    the energies since the previous sample to ``power_draws``, and call
+    ``start_sampling`` and ``stop_sampling`` from ``start`` and ``stop``.
+
+    Parameters
+    ----------
+    interval : float, default 1
+        Time between two samples, in seconds
+    sampler : Sampler, optional
+        Sampler shared with other monitors, a dedicated one is used otherwise
+    """
+
+    def __init__(self, interval=1, sampler=None):
+        super().__init__()
+        self.interval = interval
+        # a sampler shared with other monitors is started and stopped by
+        # its owner
+        self.owns_sampler = sampler is None
+        if sampler is None:
+            sampler = Sampler(interval=interval)
+        self.sampler = sampler
+        self.sampler.add(self.__locked_sample)
+        self.lock = threading.Lock()
+        self.power_draws = SampleBuffer(GPU_SAMPLE_COLUMNS)
+        self.sampling = False
+        self.last_sample_time = None
+
+    def sample(self):
+        """
+        Take one sample of the power usage, called by the sampler at each
+        interval
+        """
+
+    def __locked_sample(self):
+        with self.lock:
+            if self.sampling:
+                self.sample()
+
+    def start_sampling(self):
+        """
+        Reset the samples and start the sampler if it is not shared
+        """
+        with self.lock:
+            self.power_draws.clear()
+            self.last_sample_time = time.monotonic()
+            self.sampling = True
+        if self.owns_sampler:
+            self.sampler.start()
+
+    def stop_sampling(self):
+        """
+        Stop the sampler if it is not shared and set the record
+        """
+        if self.owns_sampler:
+            self.sampler.stop()
+        self.record = self.snapshot()
+        with self.lock:
+            self.sampling = False
+
+    def snapshot(self):
         """
-        if not self.log_file.exists():
-            raise FileNotFoundError(
-                "Logging file not found, make sure you started to \
-                    run a measure"
+        Take a sample right away and return the cumulative energy and time
+        since the start.
+        """
+        with self.lock:
+            if self.sampling:
+                self.sample()
+            return self.power_draws.get_totals()
+
+
+class NvmlPower(SampledGpuPower):
+    """
+    NVIDIA-based GPU class reading the power usage in-process with NVML
+    (``pip install nvidia-ml-py``).
+
+    The energy is read from the total energy counter of the GPUs which
+    provide it (Volta or later), it is integrated from the power draw of the
+    others. The samples are taken by the sampler, so the interval may be
+    far below one second.
+
+    The energy of each GPU is split between the processes using it with the
+    process utilization samples of NVML, like the CPU energy is split with
+    the CPU time: the process is attributed its share of the SM utilization
+    (or of the memory utilization when no SM is used). GPUs which do not
+    report the utilization of their processes are fully attributed to the
+    process.
+
+    Parameters
+    ----------
+    interval : float, default 1
+        Time between two samples, in seconds
+    sampler : Sampler, optional
+        Sampler shared with other monitors, a dedicated one is used otherwise
+    nvml : module, optional
+        NVML bindings, defaults to the ``pynvml`` module
+    process_id : int, optional
+        Id of the monitored process, defaults to the current process
+    """
+
+    def __init__(self, interval=1, sampler=None, nvml=None, process_id=None):
+        super().__init__(interval=interval, sampler=sampler)
+        self.nvml = nvml if nvml is not None else pynvml
+        if self.nvml is None:
+            raise ImportError(
+                "The NVML bindings are not installed, "
+                "install them with pip install nvidia-ml-py"
             )
-        content = self.log_file.read_text()
-        regex_power = r"Power Draw +: (.*) W"
-        regex_time = r"Timestamp +: (.*)"
-        times = re.findall(regex_time, content)
-        powers = re.findall(regex_power, content)
-        if len(times) != len(powers):
-            min_len = min(len(times), len(powers))
-            times = times[:min_len]
-            powers = powers[:min_len]
-        results = pd.DataFrame(
-            np.array([times, powers]).T, columns=["Time", "Power"]
-        )
-        results["Power"] = results["Power"].astype("float32")
-        results["Time"] = pd.to_datetime(
-            results["Time"], infer_datetime_format=True
-        )
-        results["Elapsed time"] = results["Time"] - results.loc[0, "Time"]
-        results["Elapsed time"] = results["Elapsed time"].dt.total_seconds()
-        self.record[TOTAL_GPU_TIME] = results["Elapsed time"].iloc[-1]
-        self.record[TOTAL_ENERGY_GPU] = (
-            results["Power"].sum() * self.interval * 1000 / 3600
+        self.process_id = process_id if process_id is not None else os.getpid()
+        self.handles = []
+        self.last_energies = []
+        self.last_powers = []
+        self.last_utilization_times = []
+
+    @staticmethod
+    def is_available(nvml=None):
+        """
+        Whether the NVML library can be loaded and finds a GPU
+        """
+        nvml = nvml if nvml is not None else pynvml
+        if nvml is None:
+            return False
+        try:
+            nvml.nvmlInit()
+            count = nvml.nvmlDeviceGetCount()
+            nvml.nvmlShutdown()
+        except nvml.NVMLError:
+            return False
+        return count > 0
+
+    def __read_energy(self, handle):
+        """
+        Returns the energy (in mJ) consumed by the GPU since the driver was
+        loaded, None if the GPU has no energy counter
+        """
+        try:
+            return self.nvml.nvmlDeviceGetTotalEnergyConsumption(handle)
+        except self.nvml.NVMLError:
+            return None
+
+    def __read_power(self, handle):
+        """
+        Returns the power draw (in mW) of the GPU
+        """
+        return self.nvml.nvmlDeviceGetPowerUsage(handle)
+
+    def __read_process_share(self, index, handle):
+        """
+        Returns the share of the GPU used by the process since the previous
+        sample
+        """
+        try:
+            samples = self.nvml.nvmlDeviceGetProcessUtilization(
+                handle, self.last_utilization_times[index]
+            )
+        except self.nvml.NVMLError as error:
+            if isinstance(error, getattr(self.nvml, "NVMLError_NotFound", ())):
+                # no process used the GPU since the previous sample
+                return 0
+            # the GPU does not report the utilization of its processes
+            return 1
+        total_sm = total_memory = process_sm = process_memory = 0
+        for sample in samples:
+            self.last_utilization_times[index] = max(
+                self.last_utilization_times[index], sample.timeStamp
+            )
+            total_sm += sample.smUtil
+            total_memory += sample.memUtil
+            if sample.pid == self.process_id:
+                process_sm += sample.smUtil
+                process_memory += sample.memUtil
+        if total_sm:
+            return process_sm / total_sm
+        if total_memory:
+            return process_memory / total_memory
+        return 0
+
+    def start(self):
+        """
+        Start the measure
+        """
+        LOGGER.info("starting GPU power monitoring ...")
+        self.nvml.nvmlInit()
+        self.handles = [
+            self.nvml.nvmlDeviceGetHandleByIndex(index)
+            for index in range(self.nvml.nvmlDeviceGetCount())
+        ]
+        self.last_energies = [
+            self.__read_energy(handle) for handle in self.handles
+        ]
+        self.last_powers = [
+            self.__read_power(handle) for handle in self.handles
+        ]
+        # the utilization samples are timestamped in microseconds
+        start_time = int(time.time() * 1e6)
+        self.last_utilization_times = [start_time] * len(self.handles)
+        self.start_sampling()
+
+    def sample(self):
+        """
+        Take one sample of the power usage of every GPU
+        """
+        sample_time = time.monotonic()
+        elapsed_time = sample_time - self.last_sample_time
+        energy = 0  # mJ
+        process_energy = 0  # mJ
+        for index, handle in enumerate(self.handles):
+            last_energy = self.last_energies[index]
+            if last_energy is not None:
+                current_energy = self.__read_energy(handle)
+                device_energy = current_energy - last_energy
+                self.last_energies[index] = current_energy
+            else:
+                power = self.__read_power(handle)
+                # trapezoidal integration of the power draws
+                device_energy = (
+                    (power + self.last_powers[index]) / 2 * elapsed_time
+                )
+                self.last_powers[index] = power
+            energy += device_energy
+            process_energy += device_energy * self.__read_process_share(
+                index, handle
+            )
+        self.last_sample_time = sample_time
+        self.power_draws.append(
+            (elapsed_time, energy / 3600, process_energy / 3600)
         )
+
+    def stop(self):
+        """
+        Stop the measure
+        """
+        LOGGER.info("stopping GPU power monitoring ...")
+        self.stop_sampling()
+        self.handles = []
+        self.nvml.nvmlShutdown()
+
+    def parse_log(self):
+        """
+        The samples are read in-process, there is no log to parse
+        """
@@ -11,35 +11,45 @@ __all__ = [
     "PowerGadgetWin",
     "PowerGadgetLinuxRAPL",
     "PowerGadgetLinuxMSR",
+    "PowerGadgetLinuxPowerSupply",
     "NoPowerGadget",
 ]
 
 import abc
+import csv
 import datetime
 import glob
 import logging
 import os
 import re
+import signal
 import struct
 import subprocess
 import threading
 import time
 from pathlib import Path
 
+import numpy as np  # type: ignore
 import pandas as pd  # type: ignore
-import psutil  # type: ignore
 
+from .process_usage import get_usage_reader
+from .sample_buffer import SampleBuffer
+from .sampler import Sampler
 from .utils import (
     HOME_DIR,
     MAC_INTELPOWERLOG_FILENAME,
-    PACKAGE_PATH,
+    POWERLOG_PATH_LINUX,
     TOTAL_CPU_TIME,
     TOTAL_ENERGY_ALL,
+    TOTAL_ENERGY_CORE,
     TOTAL_ENERGY_CPU,
     TOTAL_ENERGY_MEMORY,
     TOTAL_ENERGY_PROCESS_CPU,
     TOTAL_ENERGY_PROCESS_MEMORY,
+    TOTAL_ENERGY_PSYS,
+    TOTAL_ENERGY_UNCORE,
     WIN_INTELPOWERLOG_FILENAME,
+    get_scratch_path,
 )
 
 LOGGER = logging.getLogger(__name__)
@@ -53,16 +63,72 @@ POWERLOG_PATH_WIN = [
     Path("/Program Files/Intel/Power Gadget 3.5"),
 ]
 POWERLOG_TOOL_WIN = "IntelPowerGadget.exe"
+# columns of the logs written by PowerLog, there is one energy column by
+# package: Cumulative Processor Energy_0(mWh), Cumulative IA Energy_1(mWh), ...
+POWERLOG_TIME_COLUMN = "System Time"
+POWERLOG_ELAPSED_COLUMN = "Elapsed Time (sec)"
+POWERLOG_ENERGY_COLUMNS = {
+    TOTAL_ENERGY_ALL: re.compile(
+        r"^Cumulative (Processor|Package) Energy_\d+ ?\(mWh\)$"
+    ),
+    TOTAL_ENERGY_CPU: re.compile(r"^Cumulative IA Energy_\d+ ?\(mWh\)$"),
+    TOTAL_ENERGY_MEMORY: re.compile(r"^Cumulative DRAM Energy_\d+ ?\(mWh\)$"),
+}
+# the summary at the end of the log: "Total Elapsed Time (sec) = 2.024626"
+POWERLOG_SUMMARY_REGEX = re.compile(r"^(?P<name>.+?) = (?P<value>[\d.]+)$")
+POWERLOG_SUMMARY_ELAPSED = "Total Elapsed Time (sec)"
+POWERLOG_TIME_FORMAT = "%H:%M:%S:%f"
+POWERLOG_CHUNK_SIZE = 100000  # rows
+# PowerLog may take a while to write its summary once interrupted
+POWERLOG_STOP_TIMEOUT = 5  # seconds
 
 
 CPU_IDS_DIR = "/sys/devices/system/cpu/cpu*/topology/physical_package_id"
 READ_MSR_PATH = "/dev/cpu/{}/msr"
-READ_RAPL_PATH = (
-    "/sys/class/powercap/intel-rapl/intel-rapl:{}/"  # rapl_socket_id
-)
 RAPL_DEVICENAME_FILE = "name"
 RAPL_ENERGY_FILE = "energy_uj"
-RAPL_DRAM_PATH = "intel-rapl:{}:{}/"  # rapl_socket_id, rapl_device_id
+RAPL_MAX_ENERGY_FILE = "max_energy_range_uj"
+RAPL_READ_SIZE = 32  # energy_uj holds at most a 20 digits integer
+# powercap control types, by order of preference when several of them
+# expose the same zone
+RAPL_CONTROL_TYPES = ["intel-rapl", "amd-rapl", "intel-rapl-mmio"]
+# a zone directory is named after its control type and its ids, for instance
+# intel-rapl:0 for the first package and intel-rapl:0:1 for one of its
+# subzones
+RAPL_ZONE_DIR = re.compile(r"^(?P<control_type>[a-z-]+):(?P<ids>\d+(:\d+)*)$")
+RAPL_ZONES = ["package", "core", "uncore", "dram", "psys"]
+POWER_SUPPLY_PATH = Path("/sys/class/power_supply")
+POWER_SUPPLY_POWER_FILE = "power_now"  # uW
+POWER_SUPPLY_CURRENT_FILE = "current_now"  # uA
+POWER_SUPPLY_VOLTAGE_FILE = "voltage_now"  # uV
+POWER_SUPPLY_TYPE_FILE = "type"
+POWER_SUPPLY_STATUS_FILE = "status"
+POWER_SUPPLY_BATTERY = "Battery"
+POWER_SUPPLY_DISCHARGING = b"Discharging"
+POWER_SUPPLY_READ_SIZE = 32
+
+# values of the samples collected by the gadgets, in mWh except the time
+SAMPLE_COLUMNS = [
+    TOTAL_CPU_TIME,
+    TOTAL_ENERGY_ALL,
+    TOTAL_ENERGY_CPU,
+    TOTAL_ENERGY_MEMORY,
+    TOTAL_ENERGY_PROCESS_CPU,
+    TOTAL_ENERGY_PROCESS_MEMORY,
+]
+# values of the samples collected by the RAPL gadget on top of SAMPLE_COLUMNS
+RAPL_SAMPLE_COLUMNS = [
+    TOTAL_ENERGY_CORE,
+    TOTAL_ENERGY_UNCORE,
+    TOTAL_ENERGY_PSYS,
+]
+PROCESS_USAGE_COLUMNS = ["time", "process_cpu_usage", "process_memory_usage"]
+# the energy of a second is attributed with the process usage sampled during
+# this second, or during the previous one when no sample was taken in time
+PROCESS_USAGE_TOLERANCE = 2  # seconds
+SECONDS_PER_DAY = 24 * 3600
+# one day of process usage, the samples are averaged per second
+PROCESS_USAGE_CAPACITY = 24 * 3600
 
 
 class PowerGadget(abc.ABC):
@@ -72,7 +138,7 @@ class PowerGadget(abc.ABC):
     """
 
     @staticmethod
-    def parse_log(powerlog_file, process_usage=None):
+    def parse_log(powerlog_file, process_usage=None, wait=True):
         """
         From the file made by PowerLog, we extract relevant information.
 
@@ -80,108 +146,60 @@ class PowerGadget(abc.ABC):
         ----------
         powerlog_file
             Pathlib.Path instance
+        process_usage : list, optional
+            the time, cpu and memory usage ratios of the process samples
+        wait : bool, default True
+            Whether to wait for PowerLog to end the log when its summary is
+            not written yet, the last row gives the totals otherwise
         Returns
         -------
         results (dict)
             relevant information such as "Cumulative Package Energy (mWh)",
             "Cumulative IA Energy (mWh)" or "Cumulative GPU Energy (mWh)"
         """
-        content = powerlog_file.read_text()
-        if "Total Elapsed Time" not in content:
+        times, energies, summary = read_powerlog(powerlog_file)
+        if not summary and wait:
             LOGGER.debug(
                 "The log file does not seem to be written yet, \
                 we'll wait 2 secs."
             )
             time.sleep(2)
-            content = powerlog_file.read_text()
+            times, energies, summary = read_powerlog(powerlog_file)
         results = {
             TOTAL_CPU_TIME: 0,
             TOTAL_ENERGY_ALL: 0,
             TOTAL_ENERGY_CPU: 0,
             TOTAL_ENERGY_MEMORY: 0,
         }
-        results[TOTAL_CPU_TIME] = float(
-            re.search(
-                r"(?<=Total Elapsed Time \(sec\) = )(\d|\.)*", content
-            ).group(0)
-        )
-        results[TOTAL_ENERGY_ALL] = float(
-            re.search(
-                r"((?<=Cumulative Package Energy_0 \(mWh\) = )|"
-                r"(?<=Cumulative Processor Energy_0 \(mWh\) = ))(\d|\.)*",
-                content,
-            ).group(0)
-        )
-        results[TOTAL_ENERGY_CPU] = float(
-            re.search(
-                r"(?<=Cumulative IA Energy_0 \(mWh\) = )(\d|\.)*", content
-            ).group(0)
-        )
-        results[TOTAL_ENERGY_MEMORY] = float(
-            re.search(
-                r"(?<=Cumulative DRAM Energy_0 \(mWh\) = )(\d|\.)*", content
-            ).group(0)
-        )
+        for key in results:
+            if key in summary:
+                results[key] = summary[key]
+            elif len(times):
+                # the log was not ended, its last row holds the totals
+                results[key] = float(energies[key][-1])
         if process_usage:
             # to account for the actual algorithm energy consumption we need to
             # combine the overall mesure of the machine power usage with
             # the actual algorithm CPU and memory usage
-            process_usage = pd.DataFrame(
-                process_usage,
-                columns=["time", "process_cpu_usage", "process_memory_usage"],
-            )
-            powers = pd.read_csv(powerlog_file)
-            powers = powers.dropna(
-                subset=["Cumulative Processor Energy_0(mWh)"]
-            )
-            powers["System Time"] = pd.to_datetime(
-                powers["System Time"], format="%H:%M:%S:%f"
-            )
-            powers_sec = powers.groupby(
-                pd.Grouper(key="System Time", freq="S")
-            )[
-                [
-                    "Cumulative Processor Energy_0(mWh)",
-                    "Cumulative IA Energy_0(mWh)",
-                    "Cumulative DRAM Energy_0(mWh)",
-                ]
-            ].apply(
-                lambda x: x.iloc[-1] - x.iloc[0]
-            )
-            process_usage["time"] = process_usage["time"].dt.floor("S").dt.time
-            process_usage.set_index("time", inplace=True)
-            powers_sec.index = powers_sec.index.time
-            power_process = pd.merge(
-                powers_sec,
-                process_usage,
-                how="left",
-                left_index=True,
-                right_index=True,
+            results.update(
+                get_process_energy(times, energies, process_usage)
             )
-            # a measure is performed each second but
-            # it actually takes a little more than 1s
-            # so when merging on the timestamp there may be some empty values
-            #  that we fill with the previous one
-            power_process[
-                ["process_cpu_usage", "process_memory_usage"]
-            ] = power_process[
-                ["process_cpu_usage", "process_memory_usage"]
-            ].fillna(
-                method="ffill", limit=1
-            )
-            results[TOTAL_ENERGY_PROCESS_CPU] = (
-                power_process["Cumulative IA Energy_0(mWh)"]
-                * power_process["process_cpu_usage"]
-            ).sum()
-            results[TOTAL_ENERGY_PROCESS_MEMORY] = (
-                power_process["Cumulative DRAM Energy_0(mWh)"]
-                * power_process["process_memory_usage"]
-            ).sum()
         return results
 
-    def __init__(self):
+    def __init__(self, interval=1, sampler=None, attribution="process"):
         self.record = {}
-        self.thread = None
+        self.interval = interval
+        # a sampler shared with other monitors is started and stopped by
+        # its owner
+        self.owns_sampler = sampler is None
+        if sampler is None:
+            sampler = Sampler(interval=interval)
+        self.sampler = sampler
+        self.sampler.add(self.__locked_sample)
+        self.lock = threading.Lock()
+        self.power_draws = SampleBuffer(SAMPLE_COLUMNS)
+        self.last_sample_time = None
+        self.usage_reader = get_usage_reader(attribution)
 
     def __get_powerlog_file(self):
         """
@@ -193,36 +211,42 @@ class PowerGadget(abc.ABC):
         Starts the recording processus with Intel Power Gadget
         """
 
-    def stop_thread(self):
-        self.thread.do_run = False
-        self.thread.join()
+    def sample(self):
+        """
+        Take one sample of the power usage, called by the sampler at each
+        interval
+        """
 
-    def get_computer_usage(self, process, interval=1):
-        """Compute the ratio of cpu and memory used by the current process
+    def __locked_sample(self):
+        with self.lock:
+            self.sample()
 
-        Parameters
-        ----------
-        process : psutil.Process
-            the current process
-        interval : int
-            interval at which measure ratios
+    def start_sampling(self):
+        """
+        Start the sampler if it is not shared
+        """
+        if self.owns_sampler:
+            self.sampler.start()
+
+    def stop_sampling(self, final_sample=True):
+        """
+        Stop the sampler if it is not shared
+        """
+        if self.owns_sampler:
+            self.sampler.stop(final_sample=final_sample)
+
+    def snapshot(self):
+        """
+        Take a sample right away and return the totals since the start.
 
         Returns
         -------
-        Tuple
-            time of execution, ratio of cpu used, ration of memory used
+        dict
+            the cumulative energies and time since the start
         """
-        with process.oneshot():
-            process_cpu_usage = process.cpu_percent(interval=interval)
-            cpu_usage = psutil.cpu_percent()
-            process_cpu_usage = process_cpu_usage / (
-                cpu_usage * psutil.cpu_count()
-            )
-            memory_global = psutil.virtual_memory()
-            memory_usage = process.memory_full_info().rss / (
-                memory_global.total - memory_global.available
-            )
-        return datetime.datetime.now(), process_cpu_usage, memory_usage
+        with self.lock:
+            self.sample()
+            return self.power_draws.get_totals()
 
     def stop(self):
         """
@@ -236,30 +260,302 @@ class NoPowerGadget(PowerGadget):
     is available. It will return empty consumption
     """
 
-    def __init__(self):
-        super().__init__()
-        self.start_time = 0
+    def __init__(self, interval=1, sampler=None, attribution="process"):
+        super().__init__(
+            interval=interval, sampler=sampler, attribution=attribution
+        )
+
+    def sample(self):
+        sample_time = time.monotonic()
+        self.power_draws.append(
+            (sample_time - self.last_sample_time, 0, 0, 0, 0, 0)
+        )
+        self.last_sample_time = sample_time
 
     def start(self):
-        self.start_time = time.time()
+        self.power_draws.clear()
+        self.last_sample_time = time.monotonic()
 
     def stop(self):
-        end_time = time.time()
-        self.record[TOTAL_ENERGY_CPU] = 0
-        self.record[TOTAL_ENERGY_PROCESS_CPU] = 0
-        self.record[TOTAL_ENERGY_PROCESS_MEMORY] = 0
-        self.record[TOTAL_ENERGY_MEMORY] = 0
-        self.record[TOTAL_CPU_TIME] = end_time - self.start_time
-        self.record[TOTAL_ENERGY_ALL] = 0
+        self.record = self.snapshot()
+
+
+def get_powerlog_columns(header):
+    """
+    Returns the indices of the columns of a PowerLog log
+
+    Parameters
+    ----------
+    header : list
+        the names of the columns of the log
+
+    Returns
+    -------
+    dict
+        the index of the elapsed time column, and the indices of the energy
+        columns of every package for the package, IA and DRAM energies
+    """
+    columns = {TOTAL_CPU_TIME: [header.index(POWERLOG_ELAPSED_COLUMN)]}
+    for key, pattern in POWERLOG_ENERGY_COLUMNS.items():
+        columns[key] = [
+            index
+            for index, name in enumerate(header)
+            if pattern.match(name.strip())
+        ]
+    return columns
+
+
+def read_powerlog(powerlog_file, chunksize=POWERLOG_CHUNK_SIZE):
+    """
+    Read the log of PowerLog in a single pass, by chunks of rows
+
+    Parameters
+    ----------
+    powerlog_file : pathlib.Path
+        Path of the log written by PowerLog
+    chunksize : int, optional
+        Number of rows parsed at once
+
+    Returns
+    -------
+    tuple
+        the time of the day of each row in seconds, the cumulative elapsed
+        time and energies (mWh) of each row, summed over the packages, and
+        the totals of the summary at the end of the log (empty when PowerLog
+        has not written it yet)
+    """
+    header = list(pd.read_csv(powerlog_file, nrows=0).columns)
+    columns = {
+        key: [header[index] for index in indices]
+        for key, indices in get_powerlog_columns(header).items()
+    }
+    numeric_columns = [name for names in columns.values() for name in names]
+    dtypes = dict.fromkeys(numeric_columns, float)
+    dtypes[POWERLOG_TIME_COLUMN] = str
+    times = []
+    values = {key: [] for key in columns}
+    summary = {}
+    for chunk in pd.read_csv(
+        powerlog_file,
+        usecols=[POWERLOG_TIME_COLUMN] + numeric_columns,
+        dtype=dtypes,
+        chunksize=chunksize,
+    ):
+        is_row = chunk[numeric_columns].notna().all(axis=1)
+        # the summary lines only fill the first column
+        for line in chunk.loc[~is_row, POWERLOG_TIME_COLUMN].dropna():
+            match = POWERLOG_SUMMARY_REGEX.match(line.strip())
+            if match:
+                add_summary_value(
+                    summary, match.group("name"), float(match.group("value"))
+                )
+        rows = chunk[is_row]
+        if rows.empty:
+            continue
+        row_times = pd.to_datetime(
+            rows[POWERLOG_TIME_COLUMN], format=POWERLOG_TIME_FORMAT
+        )
+        time_of_day = row_times - row_times.dt.normalize()
+        times.append(time_of_day.dt.total_seconds().to_numpy())
+        for key, names in columns.items():
+            values[key].append(rows[names].to_numpy().sum(axis=1))
+    times = np.concatenate(times) if times else np.empty(0)
+    energies = {
+        key: np.concatenate(arrays) if arrays else np.empty(0)
+        for key, arrays in values.items()
+    }
+    return times, energies, summary
+
+
+def add_summary_value(summary, name, value):
+    """
+    Add a value of the summary of a PowerLog log to its totals
+
+    Parameters
+    ----------
+    summary : dict
+        the totals of the summary
+    name : str
+        the name of the value, such as "Cumulative IA Energy_0 (mWh)"
+    value : float
+        the value
+    """
+    if name == POWERLOG_SUMMARY_ELAPSED:
+        summary[TOTAL_CPU_TIME] = value
+    for key, pattern in POWERLOG_ENERGY_COLUMNS.items():
+        if pattern.match(name):
+            summary[key] = summary.get(key, 0) + value
+
+
+def get_process_energy(times, energies, process_usage):
+    """
+    Attribute the energy logged by PowerLog to the process
+
+    The energy used during each second of the log is attributed with the
+    process usage sampled during this second (or the previous one), matched
+    with an as-of join on the full timestamps. The log only holds the time of
+    the day, its days are counted from the midnights it crosses and anchored
+    on the process usage samples.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        the time of the day of each row of the log, in seconds
+    energies : dict
+        the cumulative IA and DRAM energies (mWh) of each row of the log
+    process_usage : list
+        the time, cpu and memory usage ratios of the process samples
+
+    Returns
+    -------
+    dict
+        the CPU and memory energies (mWh) of the process
+    """
+    results = {TOTAL_ENERGY_PROCESS_CPU: 0, TOTAL_ENERGY_PROCESS_MEMORY: 0}
+    if not len(times):
+        return results
+    usage = pd.DataFrame(process_usage, columns=PROCESS_USAGE_COLUMNS)
+    usage_times = pd.to_datetime(usage["time"]).to_numpy()
+    midnight = usage_times[0].astype("datetime64[D]")
+    usage_seconds = (usage_times - midnight) / np.timedelta64(1, "s")
+    days = np.concatenate(
+        [[0], np.cumsum(np.diff(times) < -SECONDS_PER_DAY / 2)]
+    )
+    seconds = times + days * SECONDS_PER_DAY
+    # the log may start the day before or after the first sample
+    seconds += SECONDS_PER_DAY * np.round(
+        (usage_seconds[0] - seconds[0]) / SECONDS_PER_DAY
+    )
+    log_seconds, log_index = np.unique(
+        np.floor(seconds), return_inverse=True
+    )
+    # the mean usage of each second of the samples
+    usage_seconds, usage_index = np.unique(
+        np.floor(usage_seconds), return_inverse=True
+    )
+    sample_counts = np.bincount(usage_index)
+    positions = np.searchsorted(usage_seconds, log_seconds, side="right") - 1
+    matched = positions >= 0
+    matched[matched] = (
+        log_seconds[matched] - usage_seconds[positions[matched]]
+        < PROCESS_USAGE_TOLERANCE
+    )
+    for key, energy_key, usage_column in [
+        (TOTAL_ENERGY_PROCESS_CPU, TOTAL_ENERGY_CPU, "process_cpu_usage"),
+        (
+            TOTAL_ENERGY_PROCESS_MEMORY,
+            TOTAL_ENERGY_MEMORY,
+            "process_memory_usage",
+        ),
+    ]:
+        # the energy of each row is counted from the previous one
+        second_energies = np.bincount(
+            log_index, weights=np.diff(energies[energy_key], prepend=0)
+        )
+        second_usages = (
+            np.bincount(usage_index, weights=usage[usage_column].to_numpy())
+            / sample_counts
+        )
+        results[key] = float(
+            (
+                second_energies[matched]
+                * second_usages[positions[matched]]
+            ).sum()
+        )
+    return results
+
+
+class PowerLogReader:
+    """
+    Incremental reader of the log written by a running PowerLog.
+
+    The log is kept opened and only the bytes appended since the previous
+    read are parsed, an incomplete last line is kept for the next read.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path of the log written by PowerLog
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = None
+        self.partial_line = b""
+        self.header = None
+        self.columns = None
+        self.totals = {TOTAL_CPU_TIME: 0}
+        self.totals.update(dict.fromkeys(POWERLOG_ENERGY_COLUMNS, 0))
+
+    def __parse_row(self, row):
+        if self.columns is None:
+            if row and row[0] == POWERLOG_TIME_COLUMN:
+                self.header = row
+                self.columns = get_powerlog_columns(row)
+            return
+        # the summary written at the end of the log has a single column
+        if len(row) != len(self.header):
+            return
+        try:
+            totals = {
+                key: sum(float(row[index]) for index in indices)
+                for key, indices in self.columns.items()
+            }
+        except ValueError:
+            # PowerLog leaves the fields empty when a value is not available
+            return
+        self.totals = totals
+
+    def read(self):
+        """
+        Parse the rows appended to the log since the previous read
+
+        Returns
+        -------
+        dict
+            the elapsed time and the package, IA and DRAM energies (mWh) since
+            the start of PowerLog, as of its last row
+        """
+        if self.file is None:
+            try:
+                self.file = open(self.path, "rb")
+            except FileNotFoundError:
+                # PowerLog has not created its log yet
+                return dict(self.totals)
+        lines = (self.partial_line + self.file.read()).split(b"\n")
+        self.partial_line = lines.pop()
+        for row in csv.reader(line.decode().strip() for line in lines):
+            self.__parse_row(row)
+        return dict(self.totals)
+
+    def close(self):
+        """
+        Close the log
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
 
 
 class PowerGadgetMac(PowerGadget):
     """
     Mac OS X custom PowerGadget wrapper.
+
+    A single PowerLog runs during the whole sampling, the sampler tails its
+    log and adds the energy of the new rows to the samples.
     """
 
-    def __init__(self, powerlog_path="", powerlog_save_path=""):
-        super().__init__()
+    def __init__(
+        self,
+        powerlog_path="",
+        powerlog_save_path="",
+        interval=1,
+        sampler=None,
+        attribution="process",
+    ):
+        super().__init__(
+            interval=interval, sampler=sampler, attribution=attribution
+        )
         if powerlog_path:
             self.powerlog_path = Path(powerlog_path)
         else:
@@ -275,87 +571,96 @@ class PowerGadgetMac(PowerGadget):
                 f"{powerlog_path}, try passing the path to "
                 "the powerLog tool to the powerMeter."
             )
+        # without a save path, PowerLog writes to a scratch file of the
+        # process, removed once read
+        self.is_scratch_log = not powerlog_save_path
         if powerlog_save_path:
             self.powerlog_save_path = Path(powerlog_save_path)
         else:
-            self.powerlog_save_path = PACKAGE_PATH / MAC_INTELPOWERLOG_FILENAME
-        # self.thread = None
-        self.power_draws = []
-
-    def __get_power_consumption(self, duration=1, resolution=500):
-        """
-        Retrieve all the available power consumptions with PowerLog using the
-        following cli: PowerLog [-resolution ] -duration  [-verbose] [-file ]
+            self.powerlog_save_path = get_scratch_path(
+                MAC_INTELPOWERLOG_FILENAME
+            )
 
-        Parameters:
-        -----------
-        duration, resolution (int):
-            cli's arguments
+        self.powerlog_process = None
+        self.powerlog_reader = None
+        self.last_totals = None
 
-        Returns:
-        --------
-        consumption (dict)
+    def __start_powerlog(self):
         """
-        _ = subprocess.run(
+        Start PowerLog with the following cli:
+        PowerLog [-resolution ] [-duration ] [-verbose] [-file ], it logs
+        until it is interrupted
+        """
+        if self.powerlog_reader is not None:
+            self.powerlog_reader.close()
+        if self.powerlog_save_path.exists():
+            os.remove(self.powerlog_save_path)
+        self.powerlog_process = subprocess.Popen(
             [
-                self.powerlog_path,
+                str(self.powerlog_path),
                 "-resolution",
-                str(resolution),
-                "-duration",
-                str(duration),
+                str(max(int(self.interval * 1000), 1)),
                 "-file",
-                self.powerlog_save_path,
+                str(self.powerlog_save_path),
             ],
-            stdout=open(os.devnull, "wb"),
-            check=True,
-        )
-        consumption = self.parse_log(self.powerlog_save_path)
-        return consumption
-
-    def __append_energy_usage(self, process, interval=1):
-        energy_usage = self.__get_power_consumption(duration=interval)
-        _, cpu_usage, memory_usage = self.get_computer_usage(
-            process, interval=0
+            stdout=subprocess.DEVNULL,
         )
+        self.powerlog_reader = PowerLogReader(self.powerlog_save_path)
+        self.last_totals = self.powerlog_reader.read()
+
+    def __stop_powerlog(self):
+        if self.powerlog_process is None:
+            return
+        # PowerLog writes the end of its log when interrupted
+        self.powerlog_process.send_signal(signal.SIGINT)
+        try:
+            self.powerlog_process.wait(timeout=POWERLOG_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.powerlog_process.kill()
+            self.powerlog_process.wait()
+        self.powerlog_process = None
+
+    def sample(self):
+        totals = self.powerlog_reader.read()
+        if totals == self.last_totals:
+            return
+        energy_usage = {
+            key: value - self.last_totals[key] for key, value in totals.items()
+        }
+        self.last_totals = totals
+        cpu_usage, memory_usage = self.usage_reader.read()
         energy_usage[TOTAL_ENERGY_PROCESS_CPU] = (
             energy_usage[TOTAL_ENERGY_CPU] * cpu_usage
         )
         energy_usage[TOTAL_ENERGY_PROCESS_MEMORY] = (
             energy_usage[TOTAL_ENERGY_MEMORY] * memory_usage
         )
-        self.power_draws.append(energy_usage)
-
-    def get_power_consumption(self, interval=1):
-        """
-
-        Parameters
-        ----------
-        interval (int)
-        """
-        current_process = psutil.Process()
-        _, _, _ = self.get_computer_usage(
-            current_process, interval=0
-        )  # initialize the cpu usage
-        self.__append_energy_usage(current_process, interval=interval)
-        while getattr(self.thread, "do_run", True):
-            self.__append_energy_usage(current_process, interval=interval)
-        self.__append_energy_usage(current_process, interval=interval)
+        self.power_draws.append(
+            [energy_usage[column] for column in SAMPLE_COLUMNS]
+        )
 
     def start(self):
         LOGGER.info("starting CPU power monitoring ...")
-        if self.thread and self.thread.is_alive():
-            self.stop_thread()
-        self.power_draws = []
-        self.thread = threading.Thread(
-            target=self.get_power_consumption, args=()
-        )
-        self.thread.start()
+        self.stop_sampling(final_sample=False)
+        self.__stop_powerlog()
+        self.power_draws.clear()
+        # initialize the cpu usage
+        self.usage_reader.read()
+        self.__start_powerlog()
+        self.start_sampling()
 
     def stop(self):
         LOGGER.info("stoping CPU power monitoring ...")
-        self.stop_thread()
-        self.record = pd.DataFrame.from_records(self.power_draws)
-        self.record = self.record.sum(axis=0)
+        self.stop_sampling(final_sample=False)
+        self.__stop_powerlog()
+        if self.powerlog_reader is not None:
+            with self.lock:
+                # the rows written before PowerLog stopped
+                self.sample()
+                self.powerlog_reader.close()
+        if self.is_scratch_log and self.powerlog_save_path.exists():
+            os.remove(self.powerlog_save_path)
+        self.record = self.power_draws.get_totals()
 
 
 class PowerGadgetWin(PowerGadget):
@@ -363,8 +668,17 @@ class PowerGadgetWin(PowerGadget):
     Windows custom PowerGadget wrapper.
     """
 
-    def __init__(self, powerlog_path="", powerlog_save_path=""):
-        super().__init__()
+    def __init__(
+        self,
+        powerlog_path="",
+        powerlog_save_path="",
+        interval=1,
+        sampler=None,
+        attribution="process",
+    ):
+        super().__init__(
+            interval=interval, sampler=sampler, attribution=attribution
+        )
         if powerlog_path:
             self.powerlog_path = Path(powerlog_path)
         else:
@@ -392,8 +706,13 @@ class PowerGadgetWin(PowerGadget):
             raise FileNotFoundError(
                 "We didn't find the save path you provided."
             )
-        self.thread = None
-        self.process_usage = []
+        # the energy of the log is attributed per second, the samples of the
+        # running second are summed until the next one
+        self.process_usage = SampleBuffer(
+            PROCESS_USAGE_COLUMNS, capacity=PROCESS_USAGE_CAPACITY
+        )
+        self.usage_second = None
+        self.usage_sums = np.zeros(3)  # cpu, memory, sample count
 
     def __get_powerlog_file(self):
         file_names = glob.glob(
@@ -410,26 +729,80 @@ class PowerGadgetWin(PowerGadget):
             )
         return Path(file_names[-1])
 
-    def get_process_usage(self, interval=1):
-        current_process = psutil.Process()
-        # called once to initialize the cpu monitoring
-        psutil.cpu_percent()
-        while getattr(self.thread, "do_run", True):
+    def sample(self):
+        cpu_usage, memory_usage = self.usage_reader.read()
+        second = int(time.time())
+        if second != self.usage_second:
+            self.__add_usage_second()
+            self.usage_second = second
+        self.usage_sums += (cpu_usage, memory_usage, 1)
+
+    def __add_usage_second(self):
+        """
+        Add the mean process usage of the running second to the samples
+        """
+        if self.usage_second is not None:
+            cpu_usage, memory_usage, count = self.usage_sums
             self.process_usage.append(
-                self.get_computer_usage(current_process, interval=interval)
+                (self.usage_second, cpu_usage / count, memory_usage / count)
             )
-        else:
-            self.process_usage.append(
-                self.get_computer_usage(current_process, interval=interval)
+        self.usage_second = None
+        self.usage_sums[:] = 0
+
+    def __clear_process_usage(self):
+        self.process_usage.clear()
+        self.usage_second = None
+        self.usage_sums[:] = 0
+
+    def __get_process_usage_records(self):
+        self.__add_usage_second()
+        if self.process_usage.dropped:
+            LOGGER.warning(
+                "The %s oldest process usage samples were dropped, their "
+                "energy won't be attributed to the process.",
+                self.process_usage.dropped,
             )
+        return [
+            (datetime.datetime.fromtimestamp(timestamp), cpu, memory)
+            for timestamp, cpu, memory in self.process_usage.get_samples()
+        ]
+
+    def __run_powerlog(self, command):
+        _ = subprocess.run(
+            '"' + str(self.powerlog_path) + '" ' + command,
+            shell=True,
+            check=True,
+        )
+
+    def __collect_powerlog(self):
+        """
+        Stop the current log of IntelPowerGadget and add its energy usage to
+        the totals
+        """
+        self.__run_powerlog("-stop")
+        powerlog_file = self.__get_powerlog_file()
+        record = self.parse_log(
+            powerlog_file, process_usage=self.__get_process_usage_records()
+        )
+        self.__clear_process_usage()
+        self.power_draws.append(
+            [record.get(column, 0) for column in SAMPLE_COLUMNS]
+        )
+        os.remove(powerlog_file)
+
+    def snapshot(self):
+        # IntelPowerGadget only writes its log when stopped, the log is
+        # restarted right after being collected
+        with self.lock:
+            self.__collect_powerlog()
+            self.__run_powerlog("-start")
+            return self.power_draws.get_totals()
 
     def start(self):
         LOGGER.info("starting CPU power monitoring ...")
-        if self.thread and self.thread.is_alive():
-            LOGGER.debug(
-                "another thread is alive, we are going to close it first"
-            )
-            self.stop_thread()
+        self.stop_sampling(final_sample=False)
+        self.__clear_process_usage()
+        self.power_draws.clear()
         _ = subprocess.Popen(
             'start /MIN "" "' + str(self.powerlog_path) + '"',
             stdin=None,
@@ -438,29 +811,23 @@ class PowerGadgetWin(PowerGadget):
             shell=True,
         )
         time.sleep(1)
-        self.thread = threading.Thread(target=self.get_process_usage, args=())
-        self.thread.start()
-        _ = subprocess.run(
-            '"' + str(self.powerlog_path) + '" -start', shell=True, check=True
-        )
+        # called once to initialize the cpu monitoring
+        self.usage_reader.read()
+        self.start_sampling()
+        self.__run_powerlog("-start")
 
     def stop(self):
         LOGGER.info("stoping CPU power monitoring ...")
-        _ = subprocess.run(
-            '"' + str(self.powerlog_path) + '" -stop', shell=True, check=True
-        )
+        self.stop_sampling()
+        with self.lock:
+            self.__collect_powerlog()
         _ = subprocess.run(
             'taskkill /IM "' + POWERLOG_TOOL_WIN + '"',
             stdout=open(os.devnull, "wb"),
             shell=True,
             check=True,
         )
-        self.stop_thread()
-        powerlog_file = self.__get_powerlog_file()
-        self.record = self.parse_log(
-            powerlog_file, process_usage=self.process_usage
-        )
-        os.remove(powerlog_file)
+        self.record = self.power_draws.get_totals()
 
 
 class PowerGadgetLinux(PowerGadget):
@@ -469,159 +836,281 @@ class PowerGadgetLinux(PowerGadget):
     """
 
     @staticmethod
-    def __get_cpu_ids():
+    def __get_package_cpus():
         """
-        Returns the cpu id of this machine
+        Returns the first logical cpu of each physical package of this machine
         """
-        cpu_ids = []
+        package_cpus = {}
         for filename in glob.glob(CPU_IDS_DIR):
+            cpu = int(re.search(r"cpu(\d+)/topology", filename).group(1))
             with open(filename, "r") as f:
                 package_id = int(f.read())
-            if package_id not in cpu_ids:
-                cpu_ids.append(package_id)
-        return cpu_ids
+            if cpu < package_cpus.get(package_id, cpu + 1):
+                package_cpus[package_id] = cpu
+        return package_cpus
 
-    def __init__(self):
-        super().__init__()
-        self.cpu_ids = self.__get_cpu_ids()
+    def __init__(self, interval=1, sampler=None, attribution="process"):
+        super().__init__(
+            interval=interval, sampler=sampler, attribution=attribution
+        )
+        self.package_cpus = self.__get_package_cpus()
+        self.cpu_ids = sorted(self.package_cpus)
 
 
-class PowerGadgetLinuxRAPL(PowerGadgetLinux):
+class PowercapZone:
     """
-    RAPL Linux custom PowerGadget wrapper.
+    A RAPL zone of the powercap interface with its opened energy counter
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Directory of the zone
+    socket : int
+        Id of the top level zone (the package for most zones)
+    name : str
+        Kind of the zone: package, core, uncore, dram or psys
+    control_type : str
+        Driver exposing the zone (intel-rapl, intel-rapl-mmio, amd-rapl)
     """
 
-    @staticmethod
-    def __get_cpu_energy(cpu):
+    def __init__(self, path, socket, name, control_type):
+        self.path = Path(path)
+        self.socket = socket
+        self.name = name
+        self.control_type = control_type
+        self.max_range = int((self.path / RAPL_MAX_ENERGY_FILE).read_text())
+        self.fd = os.open(self.path / RAPL_ENERGY_FILE, os.O_RDONLY)
+
+    def read(self):
         """
-        Returns the CPU Energy figure
+        Returns the value of the energy counter (uJ)
         """
-        cpu_energy_file = Path(READ_RAPL_PATH.format(cpu)) / RAPL_ENERGY_FILE
-        energy = int(cpu_energy_file.read_text())
-        return energy
+        return int(os.pread(self.fd, RAPL_READ_SIZE, 0))
 
-    @staticmethod
-    def __get_dram_energy(cpu, dram):
+    def close(self):
         """
-        Returns the dram energy figure
+        Close the energy counter
         """
-        dram_energy_file = (
-            Path(READ_RAPL_PATH.format(cpu))
-            / (RAPL_DRAM_PATH.format(cpu, dram))
-            / RAPL_ENERGY_FILE
-        )
-        energy = int(dram_energy_file.read_text())
-        return energy
+        os.close(self.fd)
+
+
+def _walk_powercap(path, zones, visited):
+    for entry in sorted(Path(path).iterdir()):
+        real_path = entry.resolve()
+        if real_path in visited or not entry.is_dir():
+            continue
+        match = RAPL_ZONE_DIR.match(entry.name)
+        if entry.name in RAPL_CONTROL_TYPES:
+            visited.add(real_path)
+            _walk_powercap(entry, zones, visited)
+        elif match and match.group("control_type") in RAPL_CONTROL_TYPES:
+            visited.add(real_path)
+            name = (entry / RAPL_DEVICENAME_FILE).read_text().strip()
+            try:
+                zones.append(
+                    PowercapZone(
+                        entry,
+                        socket=int(match.group("ids").split(":")[0]),
+                        # package-0 is the package zone of the socket 0
+                        name=re.sub(r"-\d+$", "", name),
+                        control_type=match.group("control_type"),
+                    )
+                )
+            except PermissionError:
+                LOGGER.warning(
+                    "The RAPL zone %s can't be read, only root may read "
+                    "the energy counters on recent kernels",
+                    entry,
+                )
+            _walk_powercap(entry, zones, visited)
+
+
+def find_powercap_zones(powercap_path=POWERLOG_PATH_LINUX):
+    """
+    Walk the powercap interface once and open the energy counter of every
+    RAPL zone.
+
+    Parameters
+    ----------
+    powercap_path : pathlib.Path, optional
+        Root of the powercap interface, or of one of its control types
+
+    Returns
+    -------
+    list
+        the PowercapZone found, a zone exposed by several control types (for
+        instance by intel-rapl and intel-rapl-mmio) is only listed once
+    """
+    powercap_path = Path(powercap_path)
+    if not powercap_path.is_dir():
+        return []
+    zones = []
+    _walk_powercap(powercap_path, zones, set())
+    zones.sort(key=lambda zone: RAPL_CONTROL_TYPES.index(zone.control_type))
+    unique_zones = {}
+    for zone in zones:
+        key = (zone.socket, zone.name)
+        if key in unique_zones:
+            zone.close()
+        else:
+            unique_zones[key] = zone
+    return sorted(
+        unique_zones.values(), key=lambda zone: (zone.socket, str(zone.path))
+    )
 
-    def __init__(self):
-        super().__init__()
-        self.dram_ids = self.__get_drams_ids()
-        self.power_draws = []
-        self.record = {}
-        self.start_time = None
 
-    def __get_drams_ids(self):
+class RaplReader:
+    """
+    Reader of the RAPL energy counters exposed by the powercap interface.
+
+    Every zone (package, core, uncore, dram, psys) of every socket is
+    discovered once and its ``energy_uj`` file is kept opened, so that each
+    read only costs one ``os.pread`` per zone. The wraparound of the counters
+    is handled with their ``max_energy_range_uj``.
+
+    Parameters
+    ----------
+    cpu_ids : list, optional
+        Ids of the sockets to monitor, defaults to every socket (the psys zone
+        is always monitored)
+    rapl_path : pathlib.Path, optional
+        Root of the powercap interface
+    """
+
+    def __init__(self, cpu_ids=None, rapl_path=POWERLOG_PATH_LINUX):
+        self.zones = []
+        for zone in find_powercap_zones(rapl_path):
+            if (
+                cpu_ids is None
+                or zone.socket in cpu_ids
+                or zone.name == "psys"
+            ):
+                self.zones.append(zone)
+            else:
+                zone.close()
+        self.__last_energies = [zone.read() for zone in self.zones]
+
+    @property
+    def n_drams(self):
         """
-        Returns the drams id of this machine
+        Number of DRAM zones monitored
         """
-        dram_id_list = []
-        for cpu in self.cpu_ids:
-            dram_paths = glob.glob(
-                READ_RAPL_PATH.format(cpu)
-                + RAPL_DRAM_PATH.format(cpu, "*")
-                + RAPL_DEVICENAME_FILE
-            )
-            for i, dram_file in enumerate(dram_paths):
-                dram_file = Path(dram_file)
-                if "dram" in dram_file.read_text():
-                    dram_id_list.append((cpu, i))
-                    break
-        return dram_id_list
-
-    def collect_power_usage(self):
-        # ! not tested
-        usages = pd.DataFrame(self.power_draws)
-        usages[[TOTAL_ENERGY_CPU, TOTAL_ENERGY_MEMORY]] = (
-            usages[["energy_cpu", "energy_memory"]]
-            .diff()
-            .fillna(usages[["energy_cpu", "energy_memory"]])
-        )
-        usages[TOTAL_ENERGY_PROCESS_CPU] = (
-            usages[TOTAL_ENERGY_CPU] * usages["cpu_usage"]
-        )
-        usages[TOTAL_ENERGY_PROCESS_MEMORY] = (
-            usages[TOTAL_ENERGY_MEMORY] * usages["memory_usage"]
-        )
-        return usages
+        return sum(zone.name == "dram" for zone in self.zones)
 
-    def __append_energy_usage(self, process, interval=1):
-        # ! not tested
-        energy_usage = {}
-        energy_usage["energy_cpu"] = sum(
-            [self.__get_cpu_energy(cpu_id) for cpu_id in self.cpu_ids]
-        )
-        energy_usage["energy_memory"] = sum(
-            [
-                self.__get_dram_energy(cpu_id, dram_id)
-                for cpu_id, dram_id in self.dram_ids
-            ]
-        )
-        _, cpu_usage, memory_usage = self.get_computer_usage(
-            process, interval=interval
-        )
-        energy_usage["cpu_usage"] = cpu_usage
-        energy_usage["memory_usage"] = memory_usage
-        self.power_draws.append(energy_usage)
+    def read(self):
+        """
+        Read the energy drained since the previous read.
 
-    def get_power_consumption(self, interval=1):
-        # ! not tested
+        Returns
+        -------
+        dict
+            energy drained (uJ) by each kind of zone: package, core, uncore,
+            dram and psys
         """
+        energies = dict.fromkeys(RAPL_ZONES, 0)
+        for i, zone in enumerate(self.zones):
+            energy = zone.read()
+            delta = energy - self.__last_energies[i]
+            if delta < 0:
+                # the counter wrapped around since the last read
+                delta += zone.max_range
+            self.__last_energies[i] = energy
+            if zone.name in energies:
+                energies[zone.name] += delta
+        return energies
+
+    def close(self):
+        """
+        Close the opened energy counters
+        """
+        for zone in self.zones:
+            zone.close()
+        self.zones = []
 
-        Parameters
-        ----------
-        interval (int)
+
+class PowerGadgetLinuxRAPL(PowerGadgetLinux):
+    """
+    RAPL Linux custom PowerGadget wrapper.
+    """
+
+    def __init__(
+        self,
+        rapl_path=POWERLOG_PATH_LINUX,
+        interval=1,
+        sampler=None,
+        attribution="process",
+    ):
+        super().__init__(
+            interval=interval, sampler=sampler, attribution=attribution
+        )
+        self.rapl_reader = RaplReader(self.cpu_ids, rapl_path=rapl_path)
+        self.power_draws = SampleBuffer(SAMPLE_COLUMNS + RAPL_SAMPLE_COLUMNS)
+
+    @staticmethod
+    def is_available(rapl_path=POWERLOG_PATH_LINUX):
         """
-        current_process = psutil.Process()
-        self.__append_energy_usage(current_process, interval=interval)
-        while getattr(self.thread, "do_run", True):
-            self.__append_energy_usage(current_process, interval=interval)
-        self.__append_energy_usage(current_process, interval=interval)
+        Whether a readable RAPL zone is exposed by the powercap interface
+        """
+        zones = find_powercap_zones(rapl_path)
+        for zone in zones:
+            zone.close()
+        return bool(zones)
+
+    def sample(self):
+        cpu_usage, memory_usage = self.usage_reader.read()
+        # convert from uJ to mWh
+        energies = {
+            zone: energy / 3.6e6
+            for zone, energy in self.rapl_reader.read().items()
+        }
+        sample_time = time.monotonic()
+        self.power_draws.append(
+            (
+                sample_time - self.last_sample_time,
+                energies["package"],
+                energies["package"],
+                energies["dram"],
+                energies["package"] * cpu_usage,
+                energies["dram"] * memory_usage,
+                energies["core"],
+                energies["uncore"],
+                energies["psys"],
+            )
+        )
+        self.last_sample_time = sample_time
 
     def start(self):
         LOGGER.info("starting CPU power monitoring ...")
-        self.start_time = time.time()
-        self.power_draws = []
+        self.stop_sampling(final_sample=False)
+        self.power_draws.clear()
         self.record = {}
-        if self.thread and self.thread.is_alive():
-            self.stop_thread()
-        self.thread = threading.Thread(
-            target=self.get_power_consumption, args=()
-        )
-        self.thread.start()
+        # drop the energy drained before the start of the measure
+        self.rapl_reader.read()
+        self.usage_reader.read()
+        self.last_sample_time = time.monotonic()
+        self.start_sampling()
 
     def stop(self):
         LOGGER.info("stoping CPU power monitoring ...")
-        usages = self.collect_power_usage()
-        end_time = time.time()
-        self.record[TOTAL_ENERGY_CPU] = (
-            usages[TOTAL_ENERGY_CPU].sum() / 3600 / 1000
-        )
-        self.record[TOTAL_ENERGY_PROCESS_CPU] = (
-            usages[TOTAL_ENERGY_PROCESS_CPU].sum() / 3600 / 1000
-        )
-        self.record[TOTAL_ENERGY_PROCESS_MEMORY] = (
-            usages[TOTAL_ENERGY_PROCESS_MEMORY].sum() / 3600 / 1000
-        )
-        self.record[TOTAL_ENERGY_MEMORY] = (
-            usages[TOTAL_ENERGY_MEMORY].sum() / 3600 / 1000
-        )
-        self.record[TOTAL_CPU_TIME] = end_time - self.start_time
-        self.record[TOTAL_ENERGY_ALL] = 0
+        self.stop_sampling()
+        self.record = self.power_draws.get_totals()
 
 
-class PowerGadgetLinuxMSR(PowerGadgetLinux):
+class MsrReader:
     """
-    Mac OS X custom PowerGadget wrapper.
+    Reader of the RAPL energy status registers through the MSR interface.
+
+    The MSR device of one cpu per package is opened once and the energy units
+    are read at start, so that each read only costs one ``os.pread`` per
+    register. The energy status registers are 32 bits counters, their
+    overflows are accumulated between two reads.
+
+    Parameters
+    ----------
+    package_cpus : dict
+        A logical cpu for each package to monitor
+    msr_path : str, optional
+        Path of the MSR device, formatted with the cpu id
     """
 
     MSR_RAPL_POWER_UNIT = 0x606
@@ -632,6 +1121,7 @@ class PowerGadgetLinuxMSR(PowerGadgetLinux):
     MSR_PKG_PERF_STATUS = 0x613
     MSR_PKG_POWER_INFO = 0x614
     MSR_PP0_ENERGY_STATUS = 0x639
+    ENERGY_STATUS_MASK = 0xFFFFFFFF
 
     @staticmethod
     def __read_msr(msr_file, msr_position):
@@ -640,8 +1130,8 @@ class PowerGadgetLinuxMSR(PowerGadgetLinux):
 
         Parameters
         ----------
-        msr_file : _io.TextIOWrapper
-            An opened MSR file
+        msr_file : int
+            File descriptor of an opened MSR file
         msr_position : int
             Position at which read the MSR file
 
@@ -650,150 +1140,295 @@ class PowerGadgetLinuxMSR(PowerGadgetLinux):
         int
             The value of the given MSR
         """
-        os.lseek(msr_file, msr_position, os.SEEK_SET)
-        return struct.unpack("Q", os.read(msr_file, 8))[0]
+        return struct.unpack("Q", os.pread(msr_file, 8, msr_position))[0]
+
+    def __init__(self, package_cpus, msr_path=READ_MSR_PATH):
+        self.__fds = []
+        self.__energy_units = []
+        self.__last_cpu_energies = []
+        self.__last_dram_energies = []
+        for cpu in package_cpus.values():
+            msr_file = os.open(msr_path.format(cpu), os.O_RDONLY)
+            self.__fds.append(msr_file)
+            # Calculate the units used, they do not change while running
+            result = self.__read_msr(msr_file, self.MSR_RAPL_POWER_UNIT)
+            # the DRAM uses the same energy units as the package
+            self.__energy_units.append(0.5 ** ((result >> 8) & 0x1F))
+            self.__last_cpu_energies.append(
+                self.__read_energy(msr_file, self.MSR_PKG_ENERGY_STATUS)
+            )
+            try:
+                dram_energy = self.__read_energy(
+                    msr_file, self.MSR_DRAM_ENERGY_STATUS
+                )
+            except OSError:
+                LOGGER.debug("No DRAM energy status for cpu %s", cpu)
+                dram_energy = None
+            self.__last_dram_energies.append(dram_energy)
+
+    def __read_energy(self, msr_file, msr_position):
+        energy = self.__read_msr(msr_file, msr_position)
+        return energy & self.ENERGY_STATUS_MASK
+
+    def read(self):
+        """
+        Read the energy drained since the previous read.
+
+        Returns
+        -------
+        Tuple
+            energy drained by the CPUs (mWh), energy drained by the DRAMs (mWh)
+        """
+        cpu_energy = 0
+        dram_energy = 0
+        for i, msr_file in enumerate(self.__fds):
+            energy = self.__read_energy(msr_file, self.MSR_PKG_ENERGY_STATUS)
+            # the mask accounts for the overflow of the 32 bits counter
+            delta = (
+                energy - self.__last_cpu_energies[i]
+            ) & self.ENERGY_STATUS_MASK
+            self.__last_cpu_energies[i] = energy
+            cpu_energy += delta * self.__energy_units[i] / 3.6
+            if self.__last_dram_energies[i] is None:
+                continue
+            energy = self.__read_energy(msr_file, self.MSR_DRAM_ENERGY_STATUS)
+            delta = (
+                energy - self.__last_dram_energies[i]
+            ) & self.ENERGY_STATUS_MASK
+            self.__last_dram_energies[i] = energy
+            dram_energy += delta * self.__energy_units[i] / 3.6
+        return cpu_energy, dram_energy
+
+    def close(self):
+        """
+        Close the opened MSR devices
+        """
+        for msr_file in self.__fds:
+            os.close(msr_file)
+        self.__fds = []
+
+
+class PowerGadgetLinuxMSR(PowerGadgetLinux):
+    """
+    MSR Linux custom PowerGadget wrapper.
+    """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(
+        self,
+        msr_path=READ_MSR_PATH,
+        interval=1,
+        sampler=None,
+        attribution="process",
+    ):
+        super().__init__(
+            interval=interval, sampler=sampler, attribution=attribution
+        )
         # the user needs to execute as root
         if os.getuid() != 0:
             raise PermissionError("You need to execute this program as root")
-        self.thread = None
-        self.power_draws = {}
+        self.msr_reader = MsrReader(self.package_cpus, msr_path=msr_path)
 
-    def __get_used_units(self, cpu):
-        """
-        Get the unit used by the MSR to encode the energy usage
+    def sample(self):
+        cpu_usage, memory_usage = self.usage_reader.read()
+        cpu_power, dram_power = self.msr_reader.read()
+        sample_time = time.monotonic()
+        self.power_draws.append(
+            (
+                sample_time - self.last_sample_time,
+                0,
+                cpu_power,
+                dram_power,
+                cpu_power * cpu_usage,
+                dram_power * memory_usage,
+            )
+        )
+        self.last_sample_time = sample_time
+
+    def start(self):
+        LOGGER.info("starting CPU power monitoring ...")
+        self.stop_sampling(final_sample=False)
+        self.power_draws.clear()
+        # drop the energy drained before the start of the measure
+        self.msr_reader.read()
+        self.usage_reader.read()
+        self.last_sample_time = time.monotonic()
+        self.start_sampling()
+
+    def stop(self):
+        LOGGER.info("stoping CPU power monitoring ...")
+        self.stop_sampling()
+        self.record = self.power_draws.get_totals()
+
+
+class PowerSupplyReader:
+    """
+    Reader of the power drawn from the power supplies of the machine, exposed
+    under ``/sys/class/power_supply``.
+
+    The power of a supply is read from its ``power_now`` file, or computed
+    from its ``current_now`` and ``voltage_now`` files. Batteries are only
+    counted while they discharge, when they power the machine. The files are
+    kept opened and read with ``os.pread``.
+
+    Parameters
+    ----------
+    power_supply_path : pathlib.Path, optional
+        Directory of the power supplies in the sysfs
+    """
+
+    def __init__(self, power_supply_path=POWER_SUPPLY_PATH):
+        # name of the supply: (fd of the power or current file, fd of the
+        # voltage file or None, fd of the status file or None)
+        self.supplies = {}
+        power_supply_path = Path(power_supply_path)
+        if power_supply_path.is_dir():
+            for supply_path in sorted(power_supply_path.iterdir()):
+                self.__open_supply(supply_path)
+
+    @staticmethod
+    def __open(path):
+        return os.open(path, os.O_RDONLY) if path.exists() else None
+
+    def __open_supply(self, supply_path):
+        if (supply_path / POWER_SUPPLY_POWER_FILE).exists():
+            power_fd = self.__open(supply_path / POWER_SUPPLY_POWER_FILE)
+            voltage_fd = None
+        elif (supply_path / POWER_SUPPLY_CURRENT_FILE).exists() and (
+            supply_path / POWER_SUPPLY_VOLTAGE_FILE
+        ).exists():
+            power_fd = self.__open(supply_path / POWER_SUPPLY_CURRENT_FILE)
+            voltage_fd = self.__open(supply_path / POWER_SUPPLY_VOLTAGE_FILE)
+        else:
+            return
+        status_fd = None
+        type_file = supply_path / POWER_SUPPLY_TYPE_FILE
+        if (
+            type_file.exists()
+            and type_file.read_text().strip() == POWER_SUPPLY_BATTERY
+        ):
+            status_fd = self.__open(supply_path / POWER_SUPPLY_STATUS_FILE)
+        self.supplies[supply_path.name] = (power_fd, voltage_fd, status_fd)
+
+    @staticmethod
+    def __read(fd):
+        return os.pread(fd, POWER_SUPPLY_READ_SIZE, 0).strip()
+
+    def __is_powering(self, status_fd):
+        return (
+            status_fd is None
+            or self.__read(status_fd) == POWER_SUPPLY_DISCHARGING
+        )
+
+    def is_powering(self):
         """
-        msr_file = os.open(READ_MSR_PATH.format(cpu), os.O_RDONLY)
-        # Calculate the units used
-        result = self.__read_msr(msr_file, self.MSR_RAPL_POWER_UNIT)
-        power_units = 0.5 ** (result & 0xF)
-        cpu_energy_units = 0.5 ** ((result >> 8) & 0x1F)
-        dram_energy_units = cpu_energy_units
-        time_units = 0.5 ** ((result >> 16) & 0xF)
-        os.close(msr_file)
-        return power_units, cpu_energy_units, dram_energy_units, time_units
+        Whether a supply read powers the machine: a supply which is not a
+        battery, or a discharging battery. On AC power, the batteries are
+        charging or full and the power of the machine is not read.
 
-    def __get_cpu_energy(self, cpu, unit):
+        Returns
+        -------
+        bool
+            whether the power read is the power of the machine
         """
-        Returns the CPU Energy figure
+        return any(
+            self.__is_powering(status_fd)
+            for _, _, status_fd in self.supplies.values()
+        )
+
+    def read(self):
         """
-        msr_file = os.open(READ_MSR_PATH.format(cpu), os.O_RDONLY)
-        result = self.__read_msr(msr_file, self.MSR_PKG_ENERGY_STATUS)
-        os.close(msr_file)
-        return result * unit / 3.6
+        Read the power drawn from the power supplies.
 
-    def __get_dram_energy(self, cpu, unit):
+        Returns
+        -------
+        float
+            the power drawn (uW)
         """
-        Returns the dram energy figure
+        power = 0
+        for power_fd, voltage_fd, status_fd in self.supplies.values():
+            if not self.__is_powering(status_fd):
+                continue
+            value = int(self.__read(power_fd))
+            if voltage_fd is not None:
+                # uA x uV
+                value = value * int(self.__read(voltage_fd)) / 1e6
+            # some batteries report a negative power while discharging
+            power += abs(value)
+        return power
+
+    def close(self):
         """
-        msr_file = os.open(READ_MSR_PATH.format(cpu), os.O_RDONLY)
-        result = self.__read_msr(msr_file, self.MSR_DRAM_ENERGY_STATUS)
-        os.close(msr_file)
-        return result * unit / 3.6
-
-    def __get_computer_consumption(
-        self, prev_cpu_energies, prev_dram_energies
-    ):
+        Close the opened files
         """
-        Get the power consumption since the last measure
+        for fds in self.supplies.values():
+            for fd in fds:
+                if fd is not None:
+                    os.close(fd)
+        self.supplies = {}
 
-        Parameters
-        ----------
-        prev_cpu_energies : List
-            List of the previous measure on the CPUs
-            (One element of the list for each CPU)
-        prev_dram_energies : [type]
-            List of the previous measure on the DRAMs
-            (One element of the list for each CPU)
 
-        Returns
-        -------
-        [type]
-            [description]
-        """
-        cpu_power = 0
-        dram_power = 0
-        for i, cpu in enumerate(self.cpu_ids):
-            _, cpu_energy_units, dram_energy_units, _ = self.__get_used_units(
-                cpu
-            )
-            current_dram_energy = self.__get_dram_energy(
-                cpu, dram_energy_units
-            )
-            current_cpu_energy = self.__get_cpu_energy(cpu, cpu_energy_units)
-            if prev_cpu_energies[i] > cpu_energy_units:
-                cpu_energy_units *= 2
-            if prev_dram_energies[i] > dram_energy_units:
-                dram_energy_units *= 2
-            cpu_power += current_cpu_energy - prev_cpu_energies[i]
-            dram_power += current_dram_energy - prev_dram_energies[i]
-            prev_cpu_energies[i] = current_cpu_energy
-            prev_dram_energies[i] = current_dram_energy
-        return cpu_power, dram_power, prev_cpu_energies, prev_dram_energies
+class PowerGadgetLinuxPowerSupply(PowerGadgetLinux):
+    """
+    Linux PowerGadget integrating the power drawn from the power supplies of
+    the machine, for laptops and edge devices without RAPL.
 
-    def get_computer_consumption(self, interval=1):
-        """
+    The power of the whole machine is recorded as its package and platform
+    energy, the energy of the process is its share of the CPU.
+    """
 
-        Parameters
-        ----------
-        interval (int)
-        """
-        # ! not tested
-        process = psutil.Process()
-        self.power_draws[TOTAL_CPU_TIME] = 0
-        self.power_draws[TOTAL_ENERGY_CPU] = 0
-        self.power_draws[TOTAL_ENERGY_MEMORY] = 0
-        prev_dram_energies = []
-        prev_cpu_energies = []
-        for cpu in self.cpu_ids:
-            _, cpu_energy_units, dram_energy_units, _ = self.__get_used_units(
-                cpu
-            )
-            prev_dram_energies.append(
-                self.__get_dram_energy(cpu, dram_energy_units)
-            )
-            prev_cpu_energies.append(
-                self.__get_cpu_energy(cpu, cpu_energy_units)
-            )
-        start_time = time.time()
-        while getattr(self.thread, "do_run", True):
-            # time.sleep(interval)
-            _, cpu_usage, memory_usage = self.get_computer_usage(
-                process, interval=interval
-            )
-            (
-                cpu_power,
-                dram_power,
-                prev_cpu_energies,
-                prev_dram_energies,
-            ) = self.__get_computer_consumption(
-                prev_cpu_energies, prev_dram_energies
-            )
-            self.power_draws[TOTAL_ENERGY_CPU] += cpu_power
-            self.power_draws[TOTAL_ENERGY_MEMORY] += dram_power
-            self.power_draws[TOTAL_ENERGY_PROCESS_CPU] += cpu_power * cpu_usage
-            self.power_draws[TOTAL_ENERGY_PROCESS_MEMORY] += (
-                dram_power * memory_usage
-            )
-            end_time = time.time()
-            self.power_draws[TOTAL_CPU_TIME] += end_time - start_time
-            start_time = end_time
+    def __init__(
+        self,
+        power_supply_path=POWER_SUPPLY_PATH,
+        interval=1,
+        sampler=None,
+        attribution="process",
+    ):
+        super().__init__(
+            interval=interval, sampler=sampler, attribution=attribution
+        )
+        self.power_supply_reader = PowerSupplyReader(power_supply_path)
+        self.power_draws = SampleBuffer(SAMPLE_COLUMNS + [TOTAL_ENERGY_PSYS])
+        self.last_power = 0
+
+    @staticmethod
+    def is_available(power_supply_path=POWER_SUPPLY_PATH):
+        """
+        Whether a power supply reports the power it provides to the machine,
+        a laptop on AC power falls back to another power gadget
+        """
+        reader = PowerSupplyReader(power_supply_path)
+        available = reader.is_powering()
+        reader.close()
+        return available
+
+    def sample(self):
+        cpu_usage, _ = self.usage_reader.read()
+        power = self.power_supply_reader.read()
+        sample_time = time.monotonic()
+        elapsed_time = sample_time - self.last_sample_time
+        # trapezoidal integration, from uW.s to mWh
+        energy = (power + self.last_power) / 2 * elapsed_time / 3.6e6
+        self.power_draws.append(
+            (elapsed_time, energy, energy, 0, energy * cpu_usage, 0, energy)
+        )
+        self.last_power = power
+        self.last_sample_time = sample_time
 
     def start(self):
         LOGGER.info("starting CPU power monitoring ...")
-        if self.thread and self.thread.is_alive():
-            self.stop()
-        self.power_draws = {}
-        self.thread = threading.Thread(
-            target=self.get_computer_consumption, args=()
-        )
-        self.thread.start()
+        self.stop_sampling(final_sample=False)
+        self.power_draws.clear()
+        if not self.power_supply_reader.is_powering():
+            LOGGER.warning(
+                "The machine is on AC power, the batteries don't discharge: "
+                "no energy will be recorded"
+            )
+        self.last_power = self.power_supply_reader.read()
+        self.usage_reader.read()
+        self.last_sample_time = time.monotonic()
+        self.start_sampling()
 
     def stop(self):
         LOGGER.info("stoping CPU power monitoring ...")
-        self.thread.do_run = False
-        self.thread.join()
-        self.record = self.power_draws
-        self.record[TOTAL_ENERGY_ALL] = 0
+        self.stop_sampling()
+        self.record = self.power_draws.get_totals()
@@ -0,0 +1,211 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Batch parsing of the logs archived by Intel Power Gadget on Windows
+(PwrData_*.csv) and Mac (intelPowerLog.csv), spread over a pool of processes
+"""
+__all__ = ["find_power_logs", "parse_power_logs", "get_power_log_records"]
+
+import concurrent.futures
+import datetime
+import fnmatch
+import glob
+import logging
+import os
+import re
+from pathlib import Path
+
+import pandas as pd  # type: ignore
+
+from .measure import Measure
+from .power_gadget import PowerGadget
+from .utils import (
+    MAC_INTELPOWERLOG_FILENAME,
+    TOTAL_CPU_TIME,
+    TOTAL_ENERGY_CPU,
+    TOTAL_ENERGY_GPU,
+    TOTAL_ENERGY_MEMORY,
+    TOTAL_ENERGY_PROCESS_CPU,
+    TOTAL_ENERGY_PROCESS_GPU,
+    TOTAL_ENERGY_PROCESS_MEMORY,
+    TOTAL_GPU_TIME,
+    WIN_INTELPOWERLOG_FILENAME,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+# platform of the machines writing each kind of log
+POWER_LOG_PLATFORMS = {
+    WIN_INTELPOWERLOG_FILENAME: "win32",
+    MAC_INTELPOWERLOG_FILENAME: "darwin",
+}
+# Windows logs are named after their start: PwrData_2022-5-3-23-59-58.csv
+PWRDATA_DATETIME_REGEX = re.compile(
+    r"PwrData_(\d+)-(\d+)-(\d+)-(\d+)-(\d+)-(\d+)"
+)
+# number of chunks of logs sent to each worker, to balance their load
+CHUNKS_PER_WORKER = 4
+
+
+def find_power_logs(paths):
+    """
+    List the logs of Intel Power Gadget
+
+    Parameters
+    ----------
+    paths : str, pathlib.Path or list
+        Directories searched recursively for PwrData_*.csv and
+        intelPowerLog.csv files, glob patterns or paths of logs
+
+    Returns
+    -------
+    list
+        the paths of the logs found, sorted
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    power_logs = set()
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            for pattern in POWER_LOG_PLATFORMS:
+                power_logs.update(path.rglob(pattern))
+        elif path.is_file():
+            power_logs.add(path)
+        else:
+            power_logs.update(
+                Path(name) for name in glob.glob(str(path), recursive=True)
+            )
+    return sorted(power_logs)
+
+
+def get_log_platform(power_log):
+    """
+    Returns the platform of the machine which wrote a log, from its name
+    """
+    for pattern, platform in POWER_LOG_PLATFORMS.items():
+        if fnmatch.fnmatch(power_log.name, pattern):
+            return platform
+    # the Mac logs may be saved under any name
+    return POWER_LOG_PLATFORMS[MAC_INTELPOWERLOG_FILENAME]
+
+
+def get_log_end_time(power_log, elapsed_time):
+    """
+    Returns the end of a log, from the start in its name when it has one or
+    from its last modification
+    """
+    match = PWRDATA_DATETIME_REGEX.search(power_log.name)
+    if match:
+        start_time = datetime.datetime(*map(int, match.groups()))
+        return start_time + datetime.timedelta(seconds=elapsed_time)
+    return datetime.datetime.fromtimestamp(power_log.stat().st_mtime)
+
+
+def parse_power_log(power_log):
+    """
+    Parse a single log, in a worker of the pool
+
+    Parameters
+    ----------
+    power_log : pathlib.Path
+        Path of the log
+
+    Returns
+    -------
+    tuple
+        the path of the log, its record, its end time and the platform which
+        wrote it, or the path and the error raised while parsing it
+    """
+    try:
+        record = PowerGadget.parse_log(power_log, wait=False)
+        end_time = get_log_end_time(power_log, record[TOTAL_CPU_TIME])
+    except (OSError, ValueError) as error:
+        return power_log, None, str(error)
+    return power_log, (record, end_time, get_log_platform(power_log)), None
+
+
+def parse_power_logs(paths, max_workers=None):
+    """
+    Parse the logs of Intel Power Gadget in a pool of processes
+
+    Parameters
+    ----------
+    paths : str, pathlib.Path or list
+        Directories searched recursively for PwrData_*.csv and
+        intelPowerLog.csv files, glob patterns or paths of logs
+    max_workers : int, optional
+        Number of processes parsing the logs, one per CPU by default. The
+        logs are parsed in the current process when it is 1.
+
+    Returns
+    -------
+    list
+        the path, the record, the end time and the platform of each log, the
+        logs which can't be parsed are skipped
+    """
+    power_logs = find_power_logs(paths)
+    LOGGER.info("parsing %s power logs ...", len(power_logs))
+    if max_workers == 1 or len(power_logs) < 2:
+        results = list(map(parse_power_log, power_logs))
+    else:
+        workers = max_workers or os.cpu_count() or 1
+        chunksize = max(len(power_logs) // (workers * CHUNKS_PER_WORKER), 1)
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = list(
+                executor.map(parse_power_log, power_logs, chunksize=chunksize)
+            )
+    parsed_logs = []
+    for power_log, parsed_log, error in results:
+        if error is not None:
+            LOGGER.warning("%s was skipped: %s", power_log, error)
+            continue
+        parsed_logs.append((power_log, *parsed_log))
+    return parsed_logs
+
+
+def get_power_log_records(paths, formatter, max_workers=None):
+    """
+    Turn archived logs of Intel Power Gadget into emissions records
+
+    Each log gives one record, with the same columns as the emissions file.
+    The logs hold no process usage, the whole energy of the machine is
+    attributed to the record.
+
+    Parameters
+    ----------
+    paths : str, pathlib.Path or list
+        Directories searched recursively for the logs, glob patterns or paths
+        of logs
+    formatter : EmissionsFormatter
+        The project, user and location of the records
+    max_workers : int, optional
+        Number of processes parsing the logs, one per CPU by default
+
+    Returns
+    -------
+    pandas.DataFrame
+        the emissions records of the logs, the logs which can't be parsed are
+        skipped
+    """
+    payloads = []
+    for power_log, record, end_time, platform in parse_power_logs(
+        paths, max_workers=max_workers
+    ):
+        record = dict(record)
+        record[TOTAL_GPU_TIME] = 0
+        record[TOTAL_ENERGY_GPU] = 0
+        record[TOTAL_ENERGY_PROCESS_GPU] = 0
+        record[TOTAL_ENERGY_PROCESS_CPU] = record[TOTAL_ENERGY_CPU]
+        record[TOTAL_ENERGY_PROCESS_MEMORY] = record[TOTAL_ENERGY_MEMORY]
+        measure = Measure(
+            package="intel power gadget",
+            algorithm="",
+            comments=power_log.name,
+        )
+        payloads.append(
+            formatter.get_payload(
+                record, measure, record_time=end_time, platform=platform
+            )
+        )
+    return pd.DataFrame(payloads)
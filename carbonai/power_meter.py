@@ -9,48 +9,45 @@ an algorithm.
 
 __all__ = ["PowerMeter"]
 
-import datetime
-import getpass
+import asyncio
+import atexit
+import contextvars
+import functools
+import inspect
 import json
 import logging
 import os
 import shutil
 import sys
-import traceback
-import warnings
+import threading
 from pathlib import Path
 
 import pandas as pd  # type: ignore
 import requests
 
-from .nvidia_power import NoGpuPower, NvidiaPower
+from .amd_power import AmdPower
+from .emissions import EmissionsFormatter
+from .file_lock import FileLock
+from .ipmi_power import IPMI_MIN_INTERVAL, IpmiPower
+from .measure import Measure, MeasureContext, get_task_clock
+from .nvidia_power import NoGpuPower, NvidiaPower, NvmlPower
 from .power_gadget import (
     NoPowerGadget,
     PowerGadgetLinuxMSR,
+    PowerGadgetLinuxPowerSupply,
     PowerGadgetLinuxRAPL,
     PowerGadgetMac,
     PowerGadgetWin,
 )
+from .power_logs import get_power_log_records
+from .process_usage import CpuTimes
+from .sampler import Sampler
+from .sinks import OUTPUT_EXTENSIONS, BufferedSink, CsvSink, get_sink
 from .utils import (
-    AVAILABLE_STEPS,
-    COUNTRY_CODE_COLUMN,
-    COUNTRY_NAME_COLUMN,
-    ENERGY_MIX_COLUMN,
-    ENERGY_MIX_DATABASE,
+    DATETIME_FORMAT,
     LOGGING_FILE,
     MSR_PATH_LINUX_TEST,
     PACKAGE_PATH,
-    POWERLOG_PATH_LINUX,
-    TOTAL_CPU_TIME,
-    TOTAL_ENERGY_ALL,
-    TOTAL_ENERGY_CPU,
-    TOTAL_ENERGY_GPU,
-    TOTAL_ENERGY_MEMORY,
-    TOTAL_ENERGY_PROCESS_CPU,
-    TOTAL_ENERGY_PROCESS_MEMORY,
-    TOTAL_GPU_TIME,
-    match,
-    normalize,
 )
 
 LOGGER = logging.getLogger(__name__)
@@ -93,8 +90,12 @@ class PowerMeter:
         Whether the machine is connected to the internet or not.
     filepath : str, default .
         Path of the file where all the carbon logs will be written.
-    output_format : {'csv', 'excel'}, default 'csv'
-        Format of the carbon logs file produced.
+    output_format : {'csv', 'excel', 'parquet', 'sqlite'}, default 'csv'
+        Format of the carbon logs file produced, when the extension of
+        ``filepath`` does not tell it. The 'parquet' format writes a dataset
+        partitioned by date and project in the ``filepath`` directory, it
+        requires pyarrow. The 'sqlite' format inserts the records in the
+        ``emissions`` table of a SQLite database.
     api_endpoint : str, optional
         Endpoint of the API to upload the collected data to
 
@@ -102,6 +103,42 @@ class PowerMeter:
         community, towards greener algorithms.
         Here is the url :
         https://ngji0jx9dc.execute-api.eu-west-3.amazonaws.com/post_new_item
+    interval : float, default 1
+        Time between two samples of the power usage, in seconds. It can go
+        down to 0.01 on the platforms reading the energy counters directly
+        (RAPL, MSR).
+
+        The samples are collected by a single background sampler, started
+        with the first measure and stopped by :func:`PowerMeter.close` or at
+        the exit of the interpreter. Measures may be nested.
+    attribution : {'process', 'thread', 'process_tree', 'cgroup'}, \
+        default 'process'
+        How the energy of the machine is attributed to a measure:
+
+        - 'process': with the CPU and memory shares of the current process
+        - 'thread': with the CPU time of the thread running the measure, so
+          that concurrent measures in several threads are not double counted
+        - 'process_tree': with the CPU and memory shares of the current
+          process and all its descendants (multiprocessing pools, joblib or
+          DataLoader workers, ...)
+        - 'cgroup': with the CPU and memory usage of the cgroup v2 of the
+          current process, i.e. of the whole container
+
+        The measures of coroutines (``async with`` blocks and decorated
+        coroutine functions) are always attributed the CPU time of their
+        asyncio task, counted only while it runs.
+    ipmi : bool or list, default False
+        Whether to read the wall power of the server from its BMC with
+        ``ipmitool dcmi power reading``. A list gives the command of the IPMI
+        shell to use instead of ``ipmitool shell`` (for instance with the
+        options of a remote BMC). The power is read at most every second and
+        reported in the "Cumulative Wall Energy (mWh)" field, next to the
+        RAPL energies.
+    sink : carbonai.sinks.Sink, optional
+        Destination of the records, by default a sink appending them to
+        ``filepath``. The records are buffered and written in bulk by a
+        background thread, every 5 seconds or every 100 records, at the exit
+        of the interpreter or when :func:`PowerMeter.flush` is called.
 
     See Also
     --------
@@ -134,10 +171,11 @@ class PowerMeter:
     ), we commit to anonymize any data shared.
     """
 
-    LAPTOP_PUE = 1.3  # pue for my laptop
-    SERVER_PUE = 1.58  # pue for a server
-    DEFAULT_LOCATION = "FR"
-    DATETIME_FORMAT = "%m/%d/%Y %H:%M:%S"  # "%c"
+    LAPTOP_PUE = EmissionsFormatter.LAPTOP_PUE
+    SERVER_PUE = EmissionsFormatter.SERVER_PUE
+    DEFAULT_LOCATION = EmissionsFormatter.DEFAULT_LOCATION
+    DATETIME_FORMAT = DATETIME_FORMAT  # "%c"
+    ATTRIBUTIONS = ["process", "thread", "process_tree", "cgroup"]
 
     # ----------------------------------------------------------------------
     # Constructors
@@ -155,9 +193,28 @@ class PowerMeter:
         filepath=None,
         output_format="csv",
         api_endpoint=None,
+        interval=1,
+        attribution="process",
+        ipmi=False,
+        sink=None,
     ):
 
         self.platform = sys.platform
+        self.interval = interval
+        self.sampler = Sampler(interval=interval)
+        self.sampling = False
+        self.__running_measures = []
+        self.__lock = threading.RLock()
+        if attribution not in self.ATTRIBUTIONS:
+            raise ValueError(
+                f"Unknown attribution {attribution}, "
+                f"it should be one of {self.ATTRIBUTIONS}"
+            )
+        self.attribution = attribution
+        self.cpu_times = CpuTimes()
+        self.__current_measure = contextvars.ContextVar(
+            f"carbonai_measure_{id(self)}", default=None
+        )
         powergadget_platform = {
             "darwin": PowerGadgetMac,
             "win32": PowerGadgetWin,
@@ -168,18 +225,17 @@ class PowerMeter:
         self.power_gadget = powergadget_platform[self.platform](
             powerlog_path=cpu_power_log_path,
             powerlog_save_path=powerlog_save_path,
+            interval=interval,
+            sampler=self.sampler,
+            # the shares of the threads are computed by the measures
+            attribution="process" if attribution == "thread" else attribution,
         )
 
-        self.pue = self.__set_pue()
+        self.pue = EmissionsFormatter.get_pue(self.platform)
 
         self.cuda_available = self.__check_gpu()
         self.gpu_power = self.__set_gpu_power()
-
-        self.user = self.__set_username(user_name)
-
-        self.project = self.__set_project_name(project_name)
-        self.program_name = self.__set_project_entity(program_name)
-        self.client_name = self.__set_project_entity(client_name)
+        self.wall_power = self.__set_wall_power(ipmi)
 
         self.is_online = is_online
         if api_endpoint:
@@ -189,23 +245,21 @@ class PowerMeter:
             LOGGER.info("No current api endpoint, will save data locally")
             self.api_endpoint = ""
 
-        self.location = self.__set_location(location, get_country)
-
-        self.energy_mix_db = self.__load_energy_mix_db()
-        self.energy_mix = self.__get_energy_mix()  # kgCO2e/kWh
-        self.location_name = self.__get_location_name()
-
-        self.used_package = ""
-        self.used_algorithm = ""
-        self.used_data_type = ""
-        self.used_data_shape = ""
-        self.used_algorithm_params = ""
-        self.used_comments = ""
-        self.used_step = ""
+        self.formatter = EmissionsFormatter(
+            project_name=project_name,
+            program_name=program_name,
+            client_name=client_name,
+            user_name=user_name,
+            location=location,
+            get_country=get_country,
+            is_online=bool(is_online or self.api_endpoint),
+        )
 
         if not filepath:
             LOGGER.info("No current filepath, will use the default")
-            self.filepath = Path.cwd() / "emissions.csv"
+            self.filepath = Path.cwd() / (
+                "emissions" + OUTPUT_EXTENSIONS.get(output_format, ".csv")
+            )
         else:
             LOGGER.info("Filepath given, will save there")
             self.filepath = Path(filepath)
@@ -214,44 +268,73 @@ class PowerMeter:
 
         self.logging_filename = PACKAGE_PATH / LOGGING_FILE
 
-    @staticmethod
-    def __load_energy_mix_db():
-        return pd.read_csv(
-            PACKAGE_PATH / ENERGY_MIX_DATABASE, encoding="utf-8"
-        )
+        if sink is None:
+            sink = get_sink(self.filepath, output_format=output_format)
+        if not isinstance(sink, BufferedSink):
+            sink = BufferedSink(sink)
+        self.sink = sink
 
-    @staticmethod
-    def __extract_env_name():
-        env = "unknown"
-        try:
-            env = os.environ["CONDA_DEFAULT_ENV"]
-        except KeyError:
-            pass
-        if hasattr(sys, "base_prefix") and sys.base_prefix != sys.prefix:
-            env = sys.base_prefix.split("/")[-1]
-        return env
+        # the measures are stopped before the last records are written
+        atexit.register(self.sink.close)
+        atexit.register(self.close)
+
+    @property
+    def user(self):
+        """
+        Name of the user of the records
+        """
+        return self.formatter.user
+
+    @property
+    def project(self):
+        """
+        Name of the project of the records
+        """
+        return self.formatter.project
+
+    @property
+    def program_name(self):
+        """
+        Name of the program of the records
+        """
+        return self.formatter.program_name
+
+    @property
+    def client_name(self):
+        """
+        Name of the client of the records
+        """
+        return self.formatter.client_name
+
+    @property
+    def location(self):
+        """
+        ISO code of the country of the machine
+        """
+        return self.formatter.location
+
+    @property
+    def location_name(self):
+        """
+        Name of the country of the machine
+        """
+        return self.formatter.location_name
+
+    @property
+    def energy_mix(self):
+        """
+        Carbon intensity of the electricity of the country (kgCO2e/kWh)
+        """
+        return self.formatter.energy_mix
 
     @staticmethod
     def __check_gpu():
         cuda_available = False
-        if shutil.which("nvidia-smi"):
+        if NvmlPower.is_available() or shutil.which("nvidia-smi"):
             cuda_available = True
 
         return cuda_available
 
-    @staticmethod
-    def __get_country():
-        """
-        Retrieve the ISO code country
-        Beware of the encoding
-        cf. from https://stackoverflow.com/questions/40059654/python-convert-
-        a-bytes-array-into-json-format
-        """
-        request = requests.get("http://ipinfo.io/json")
-        response = request.content.decode("utf8").replace("'", '"')
-        user_info = json.loads(response)
-        return user_info["country"]
-
     @classmethod
     def from_config(cls, path):
         """
@@ -299,114 +382,66 @@ class PowerMeter:
             args = json.load(file)
         return cls(**args)
 
-    def __set_pue(self):
-        if self.platform in ["darwin", "win32"]:
-            return self.LAPTOP_PUE  # pue for my laptop
-        return self.SERVER_PUE  # pue for a server
-
     def __set_powergadget_linux(
-        self, powerlog_path=None, powerlog_save_path=None
+        self,
+        powerlog_path=None,
+        powerlog_save_path=None,
+        interval=1,
+        sampler=None,
+        attribution="process",
     ):
-        if POWERLOG_PATH_LINUX.exists():
-            power_gadget = PowerGadgetLinuxRAPL()
+        arguments = dict(
+            interval=interval, sampler=sampler, attribution=attribution
+        )
+        if PowerGadgetLinuxRAPL.is_available():
+            power_gadget = PowerGadgetLinuxRAPL(**arguments)
         # The user needs to be root to use MSR interface
         elif MSR_PATH_LINUX_TEST.exists() and os.getuid() == 0:
-            power_gadget = PowerGadgetLinuxMSR()
+            power_gadget = PowerGadgetLinuxMSR(**arguments)
+        elif PowerGadgetLinuxPowerSupply.is_available():
+            LOGGER.info("Using the power supplies to measure the power usage")
+            power_gadget = PowerGadgetLinuxPowerSupply(**arguments)
         else:
             LOGGER.warning("No power reading interface was found")
-            power_gadget = NoPowerGadget()
+            power_gadget = NoPowerGadget(**arguments)
         return power_gadget
 
+    def __set_wall_power(self, ipmi):
+        if not ipmi:
+            return None
+        command = None if ipmi is True else ipmi
+        if not IpmiPower.is_available(command):
+            LOGGER.warning(
+                "The IPMI shell can't be started, ipmitool was not found: "
+                "the wall power won't be recorded"
+            )
+            return None
+        wall_power = IpmiPower(
+            interval=max(self.interval, IPMI_MIN_INTERVAL),
+            sampler=self.sampler,
+            command=command,
+        )
+        # the IPMI shell is kept alive across the measures
+        atexit.register(wall_power.close)
+        return wall_power
+
     def __set_gpu_power(self):
         if self.cuda_available:
             LOGGER.info("Found a GPU")
-            gpu_power = NvidiaPower()
+            if NvmlPower.is_available():
+                gpu_power = NvmlPower(
+                    interval=self.interval, sampler=self.sampler
+                )
+            else:
+                gpu_power = NvidiaPower(interval=self.interval)
+        elif AmdPower.is_available():
+            LOGGER.info("Found an AMD GPU")
+            gpu_power = AmdPower(interval=self.interval, sampler=self.sampler)
         else:
             LOGGER.info("Found no GPU")
             gpu_power = NoGpuPower()
         return gpu_power
 
-    def __set_username(self, user_name):
-        if user_name:
-            return user_name
-        return getpass.getuser()
-
-    def __set_project_name(self, project_name):
-        if project_name:
-            return project_name
-        return self.__extract_env_name()
-
-    def __set_project_entity(self, entity_name):
-        if entity_name:
-            return entity_name
-        return "--"
-
-    def __set_location(self, provided_location, get_country):
-        # Set the location used to convert energy usage to carbon emissions
-        # if the location is provided, we use it
-        # if it's not and we can use the internet and the user authorize us to
-        # #do so then we retrieve it from the IP address
-        # otherwise set the location to default
-        if provided_location:
-            location = provided_location
-        elif (self.is_online or self.api_endpoint) and get_country:
-            location = self.__get_country()
-        else:
-            warnings.warn(
-                "No location was set, we will fallback to \
-                the default location: {}".format(
-                    self.DEFAULT_LOCATION
-                )
-            )
-            location = self.DEFAULT_LOCATION
-        return location
-
-    def __get_energy_mix(self):
-        if not (
-            self.energy_mix_db[COUNTRY_CODE_COLUMN] == self.location
-        ).any():
-            raise NameError(
-                "The location input was not found, make sure you wrote "
-                "the isocode of your country. You used " + self.location
-            )
-        return self.energy_mix_db.loc[
-            self.energy_mix_db[COUNTRY_CODE_COLUMN] == self.location,
-            ENERGY_MIX_COLUMN,
-        ].values[0]
-
-    def __get_location_name(self):
-        return self.energy_mix_db.loc[
-            self.energy_mix_db[COUNTRY_CODE_COLUMN] == self.location,
-            COUNTRY_NAME_COLUMN,
-        ].values[0]
-
-    def __aggregate_power(self, cpu_record, gpu_record):
-        """
-        Implement the cO2 emission value
-
-        Parameters:
-        -----------
-        cpu_record, gpu_record (dict):
-            Respectively CPU and GPU's records
-
-        Returns
-        -------
-        co2_emitted (float)
-        """
-        used_energy = self.pue * (
-            cpu_record[TOTAL_ENERGY_PROCESS_CPU]
-            + cpu_record[TOTAL_ENERGY_PROCESS_MEMORY]
-            + gpu_record[TOTAL_ENERGY_GPU]
-        )  # mWh
-        co2_emitted = used_energy * self.energy_mix * 1e-3
-        LOGGER.info(
-            "This process emitted %.3fg of CO2 (using the energy mix of %s)",
-            co2_emitted,
-            self.location_name,
-        )
-
-        return co2_emitted
-
     def measure_power(
         self,
         package,
@@ -473,6 +508,18 @@ class PowerMeter:
 
         >>> example_func()
         result_of_your_function
+
+        Coroutine functions may be decorated as well, the measure then covers
+        the execution of the coroutine and only the CPU time used while its
+        task is running is attributed to it.
+
+        >>> @power_meter.measure_power(
+        ...     package="fastapi",
+        ...     algorithm="prediction",
+        ...     step="inference",
+        ... )
+        ... async def predict(item):
+        ...     # do something
         """
         if not algorithm or not package:
             raise SyntaxError(
@@ -481,45 +528,39 @@ class PowerMeter:
                 "trying to monitor"
             )
 
+        arguments = dict(
+            package=package,
+            algorithm=algorithm,
+            data_type=data_type,
+            data_shape=data_shape,
+            algorithm_params=algorithm_params,
+            comments=comments,
+            step=step,
+        )
+
         def decorator(func):
+            if inspect.iscoroutinefunction(func):
+
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    async with MeasureContext(self, **arguments):
+                        return await func(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(func)
             def wrapper(*args, **kwargs):
-                self.start_measure(
-                    package,
-                    algorithm,
-                    data_type=data_type,
-                    data_shape=data_shape,
-                    algorithm_params=algorithm_params,
-                    comments=comments,
-                    step=step,
-                )
+                measure = self.start_measure(**arguments)
                 try:
                     results = func(*args, **kwargs)
                 finally:
-                    self.stop_measure()
+                    self.stop_measure(measure)
                 return results
 
             return wrapper
 
         return decorator
 
-    def __set_used_arguments(
-        self,
-        package,
-        algorithm,
-        data_type="",
-        data_shape="",
-        algorithm_params="",
-        comments="",
-        step="other",
-    ):
-        self.used_package = normalize(package)
-        self.used_algorithm = normalize(algorithm)
-        self.used_data_type = normalize(data_type)
-        self.used_data_shape = normalize(data_shape)
-        self.used_algorithm_params = normalize(algorithm_params)
-        self.used_comments = normalize(comments)
-        self.used_step = normalize(match(step, AVAILABLE_STEPS))
-
     def __call__(
         self,
         package,
@@ -581,33 +622,24 @@ class PowerMeter:
         ... ):
         ...     # do something
         result_of_your_code
+
+        In a coroutine, use an async with statement, the PowerMeter does not
+        block the event loop to start and stop the measure
+
+        >>> async with power_meter(package="aiohttp", algorithm="handler"):
+        ...     # do something
         """
-        self.__set_used_arguments(
-            package,
-            algorithm,
+        return MeasureContext(
+            self,
+            package=package,
+            algorithm=algorithm,
+            step=step,
             data_type=data_type,
             data_shape=data_shape,
             algorithm_params=algorithm_params,
             comments=comments,
-            step=step,
-        )
-        return self
-
-    def __enter__(
-        self,
-    ):
-        self.start_measure(
-            self.used_package,
-            self.used_algorithm,
-            data_type=self.used_data_type,
-            data_shape=self.used_data_shape,
-            algorithm_params=self.used_algorithm_params,
-            comments=self.used_comments,
         )
 
-    def __exit__(self, exit_type, value, traceback):
-        self.stop_measure()
-
     def start_measure(
         self,
         package,
@@ -645,6 +677,9 @@ class PowerMeter:
 
         Returns
         -------
+        Measure
+            The measure started, to pass to :func:`PowerMeter.stop_measure`
+            when several measures overlap
 
         See also
         --------
@@ -684,24 +719,80 @@ class PowerMeter:
         >>> power_meter.stop_measure()
 
         """
-        self.gpu_power.start()
-        self.power_gadget.start()
-        self.__set_used_arguments(
+        measure = self.__add_measure(
             package,
             algorithm,
+            step=step,
             data_type=data_type,
             data_shape=data_shape,
             algorithm_params=algorithm_params,
             comments=comments,
+        )
+        self.__start(measure)
+        return measure
+
+    async def start_measure_async(
+        self,
+        package,
+        algorithm,
+        step="other",
+        data_type="",
+        data_shape="",
+        algorithm_params="",
+        comments="",
+    ):
+        """
+        Starts measuring the power usage from a coroutine.
+
+        The samples are read in the default executor of the event loop, so
+        that starting the measure does not block it. The energy of the
+        process is attributed with the CPU time used by the steps of the
+        current asyncio task, and of the tasks it creates, while the measure
+        runs. The parameters are the ones of :func:`PowerMeter.start_measure`.
+
+        Returns
+        -------
+        Measure
+            The measure started, to pass to
+            :func:`PowerMeter.stop_measure_async`
+
+        See also
+        --------
+        PowerMeter.stop_measure_async : Stop the measure started with \
+            start_measure_async
+        PowerMeter.__call__ : Measure the power usage using an async with \
+            statement
+        """
+        measure = self.__add_measure(
+            package,
+            algorithm,
             step=step,
+            data_type=data_type,
+            data_shape=data_shape,
+            algorithm_params=algorithm_params,
+            comments=comments,
+        )
+        task_clock = get_task_clock()
+        if task_clock is not None:
+            measure.follow_task(task_clock)
+        else:
+            # the thread of the event loop runs the coroutine
+            measure.follows_thread = True
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.__start, measure
         )
+        return measure
 
-    def stop_measure(self):
+    def stop_measure(self, measure=None):
         """
         Stops the measure started with :func:`PowerMeter.start_measure`
 
         Parameters
         ----------
+        measure : Measure, optional
+            The measure to stop, defaults to the last one started in the
+            current thread. A measure which is no longer running, because it
+            was already stopped or the PowerMeter was closed, is not recorded
 
         See also
         --------
@@ -740,21 +831,189 @@ class PowerMeter:
 
         >>> power_meter.stop_measure()
         """
-        self.power_gadget.stop()
-        self.gpu_power.stop()
-        self.gpu_power.parse_log()
-        self.__log_records(
-            self.power_gadget.record,  # must be a dict
-            self.gpu_power.record,  # must be a dict
-            algorithm=self.used_algorithm,
-            package=self.used_package,
-            data_type=self.used_data_type,
-            data_shape=self.used_data_shape,
-            algorithm_params=self.used_algorithm_params,
-            comments=self.used_comments,
-            step=self.used_step,
+        measure = self.__remove_measure(measure)
+        if measure is not None:
+            self.__stop(measure)
+
+    async def stop_measure_async(self, measure=None):
+        """
+        Stops the measure started with :func:`PowerMeter.start_measure_async`
+
+        The samples are read and the record is written in the default
+        executor of the event loop, so that stopping the measure does not
+        block it.
+
+        Parameters
+        ----------
+        measure : Measure, optional
+            The measure to stop, defaults to the last one started in the
+            current task
+        """
+        measure = self.__remove_measure(measure)
+        if measure is None:
+            return
+        if measure.task_clock is not None:
+            measure.follow_task(measure.task_clock)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.__stop, measure
         )
 
+    def close(self):
+        """
+        Stops the sampler shared by the measures of this PowerMeter.
+
+        It is called at the exit of the interpreter, a new measure restarts
+        the sampler.
+
+        See also
+        --------
+        PowerMeter.start_measure : Starts measuring the power usage
+        """
+        with self.__lock:
+            if not self.sampling:
+                return
+            if self.__running_measures:
+                LOGGER.warning(
+                    "%s measures were not stopped, they won't be recorded",
+                    len(self.__running_measures),
+                )
+                self.__running_measures = []
+            self.sampler.stop()
+            self.power_gadget.stop()
+            self.gpu_power.stop()
+            if self.wall_power is not None:
+                self.wall_power.stop()
+            self.sampling = False
+
+    def flush(self):
+        """
+        Writes the buffered records right away.
+
+        The records are otherwise written in bulk by a background thread and
+        at the exit of the interpreter.
+
+        Examples
+        --------
+        >>> with power_meter("numpy", "my algorithm"):
+        ...     do_something()
+        >>> power_meter.flush()
+        >>> pd.read_csv(power_meter.filepath)
+        """
+        self.sink.flush()
+
+    def parse_power_logs(self, paths, max_workers=None):
+        """
+        Turns archived logs of Intel Power Gadget into emissions records.
+
+        The PwrData_*.csv logs of Windows and the intelPowerLog.csv logs of
+        Mac are parsed in a pool of processes. Each log gives one record, with
+        the same columns as the emissions file. The logs hold no process
+        usage, the whole energy of the machine is attributed to the record.
+
+        Parameters
+        ----------
+        paths : str, pathlib.Path or list
+            Directories searched recursively for the logs, glob patterns or
+            paths of logs
+        max_workers : int, optional
+            Number of processes parsing the logs, one per CPU by default
+
+        Returns
+        -------
+        pandas.DataFrame
+            the emissions records of the logs, the logs which can't be parsed
+            are skipped
+
+        Examples
+        --------
+        >>> records = power_meter.parse_power_logs("archives/**/PwrData_*.csv")
+        >>> records.to_csv("archived_emissions.csv", index=False)
+        """
+        return get_power_log_records(
+            paths, self.formatter, max_workers=max_workers
+        )
+
+    def __start_sampling(self):
+        if self.sampling:
+            return
+        self.gpu_power.start()
+        if self.wall_power is not None:
+            self.wall_power.start()
+        self.power_gadget.start()
+        self.sampler.start()
+        self.sampling = True
+
+    def __get_current_measure(self):
+        """
+        Returns the last measure started in the current context (thread or
+        asyncio task) and still running
+        """
+        measure = self.__current_measure.get()
+        while measure is not None and measure not in self.__running_measures:
+            measure = measure.parent
+        return measure
+
+    def __add_measure(self, *args, **kwargs):
+        with self.__lock:
+            measure = Measure(
+                *args, parent=self.__get_current_measure(), **kwargs
+            )
+            self.__running_measures.append(measure)
+        self.__current_measure.set(measure)
+        return measure
+
+    def __remove_measure(self, measure):
+        with self.__lock:
+            if measure is None:
+                measure = self.__get_current_measure()
+                if measure is None:
+                    raise RuntimeError("There is no running measure to stop")
+            if measure not in self.__running_measures:
+                LOGGER.warning(
+                    "The measure %s is not running, it was already stopped "
+                    "or the PowerMeter was closed, it won't be recorded",
+                    measure.measure_id,
+                )
+                return None
+            self.__running_measures.remove(measure)
+        if self.__current_measure.get() is measure:
+            self.__current_measure.set(measure.parent)
+        return measure
+
+    def __start(self, measure):
+        with self.__lock:
+            self.__start_sampling()
+        measure.start(
+            self.__snapshot(), cpu_times=self.__read_cpu_times(measure)
+        )
+
+    def __stop(self, measure):
+        record = measure.stop(
+            self.__snapshot(), cpu_times=self.__read_cpu_times(measure)
+        )
+        self.__log_records(record, measure)
+
+    def __read_cpu_times(self, measure):
+        """
+        Returns the CPU times attributing the energy to the thread or the
+        task of the measure, None when the energy is attributed to the
+        process
+        """
+        if (
+            self.attribution == "thread"
+            or measure.follows_thread
+            or measure.task_clock is not None
+        ):
+            return self.cpu_times.read(measure.thread_id)
+        return None
+
+    def __snapshot(self):
+        snapshot = self.power_gadget.snapshot()
+        snapshot.update(self.gpu_power.snapshot())
+        if self.wall_power is not None:
+            snapshot.update(self.wall_power.snapshot())
+        return snapshot
+
     def __record_data_to_server(self, info):
         headers = {"Content-Type": "application/json"}
         data = json.dumps(info)
@@ -770,103 +1029,12 @@ class PowerMeter:
         except requests.exceptions.Timeout:
             return 408
 
-    def __record_data_to_csv_file(self, info):
-        try:
-            data = pd.DataFrame(info, index=[0])
-            if Path(self.filepath).exists():
-                data.to_csv(self.filepath, mode="a", index=False, header=False)
-            else:
-                data.to_csv(self.filepath, index=False)
-            return True
-        except Exception:
-            LOGGER.error("* error during the csv writing process *")
-            LOGGER.error(traceback.format_exc())
-            return False
-
-    def __record_data_to_excel_file(self, info):
-        try:
-
-            if Path(self.filepath).exists():
-                data = pd.read_excel(self.filepath).append(
-                    info, ignore_index=True
-                )
-                data.to_excel(self.filepath, index=False)
-            else:
-                data = pd.DataFrame(info, index=[0])
-                data.to_excel(self.filepath, index=False)
-            return True
-        except Exception:
-            LOGGER.error(
-                "* error during the writing process in an excel file *"
-            )
-            LOGGER.error(traceback.format_exc())
-            return False
-
-    def __record_data_to_file(self, info):
-        """
-        Only two options so far: CSV or EXCEL
-        """
-        if self.filepath.suffix == ".csv":
-            return self.__record_data_to_csv_file(info)
-        elif self.filepath.suffix == ".xls" or self.filepath.suffix == ".xlsx":
-            return self.__record_data_to_excel_file(info)
-        LOGGER.info("unknown format: it should be either .csv, .xls or .xlsx")
-        return self.__record_data_to_excel_file(info)
-
-    def __log_records(
-        self,
-        cpu_recorded_power,
-        gpu_recorded_power,
-        algorithm="",
-        package="",
-        data_type="",
-        data_shape="",
-        algorithm_params="",
-        comments="",
-        step="other",
-    ):
-        co2_emitted = self.__aggregate_power(
-            self.power_gadget.record, self.gpu_power.record
+    def __log_records(self, record, measure):
+        payload = self.formatter.get_payload(
+            record, measure, platform=self.platform
         )
-        payload = {
-            "Datetime": datetime.datetime.now().strftime(self.DATETIME_FORMAT),
-            "Country": self.location_name,
-            "Platform": self.platform,
-            "User ID": self.user,
-            "ISO": self.location,
-            "Project name": self.project,
-            "Program name": self.program_name,
-            "Client name": self.client_name,
-            "Total Elapsed CPU Time (sec)": cpu_recorded_power[TOTAL_CPU_TIME],
-            "Total Elapsed GPU Time (sec)": gpu_recorded_power[TOTAL_GPU_TIME],
-            "Cumulative Package Energy (mWh)": cpu_recorded_power[
-                TOTAL_ENERGY_ALL
-            ],
-            "Cumulative IA Energy (mWh)": cpu_recorded_power[TOTAL_ENERGY_CPU],
-            "Cumulative GPU Energy (mWh)": gpu_recorded_power[
-                TOTAL_ENERGY_GPU
-            ],
-            "Cumulative DRAM Energy (mWh)": cpu_recorded_power[
-                TOTAL_ENERGY_MEMORY
-            ],
-            "Cumulative process CPU Energy (mWh)": cpu_recorded_power[
-                TOTAL_ENERGY_PROCESS_CPU
-            ],
-            "Cumulative process DRAM Energy (mWh)": cpu_recorded_power[
-                TOTAL_ENERGY_PROCESS_MEMORY
-            ],
-            "PUE": self.pue,
-            "CO2 emitted (gCO2e)": co2_emitted,
-            "Package": package,
-            "Algorithm": algorithm,
-            "Algorithm's parameters": algorithm_params,
-            "Data type": data_type,
-            "Data shape": data_shape,
-            "Comment": comments,
-            "Step": step,
-        }
-        written = self.__record_data_to_file(payload)
-        LOGGER.info("* recorded into a file? %s*", written)
+        self.sink.write([payload])
+        LOGGER.info("* record sent to the sink *")
 
         if self.is_online and self.api_endpoint:
             response_status_code = self.__record_data_to_server(payload)
@@ -876,29 +1044,34 @@ class PowerMeter:
                     "are going to record it for a later upload"
                 )
                 # can't upload we'll record the data
-                data = pd.DataFrame(payload, index=[0])
-                if self.logging_filename.exists():
-                    data.to_csv(
-                        self.logging_filename,
-                        mode="a",
-                        index=False,
-                        header=False,
-                    )
-                else:
-                    data.to_csv(self.logging_filename, index=False)
+                CsvSink(self.logging_filename).write([payload])
 
             if response_status_code == 200:
                 # we successfully uploaded,
                 # check if there are other locally recorded data
-                if self.logging_filename.exists():
-                    data = pd.read_csv(self.logging_filename, index_col=None)
-                    payloads = data.to_dict(orient="records")
-                    for i, payload in enumerate(payloads):
-                        res_status_code = self.__record_data_to_server(payload)
-                        if res_status_code != 200:
-                            data.iloc[i:].to_csv(
-                                self.logging_filename, index=False
-                            )
-                            break
-                    else:
-                        self.logging_filename.unlink()
+                self.__upload_logged_records()
+
+    def __upload_logged_records(self):
+        """
+        Upload the records logged while the server was unreachable
+
+        The log is shared by the processes using the package, it is claimed
+        by renaming it under the lock so that each record is uploaded once.
+        The records which still can't be uploaded are logged again.
+        """
+        claimed_filename = self.logging_filename.with_name(
+            f"{self.logging_filename.name}."
+            f"{os.getpid()}-{threading.get_ident()}"
+        )
+        with FileLock(self.logging_filename):
+            if not self.logging_filename.exists():
+                return
+            os.replace(self.logging_filename, claimed_filename)
+        data = pd.read_csv(claimed_filename, index_col=None)
+        payloads = data.to_dict(orient="records")
+        for i, payload in enumerate(payloads):
+            res_status_code = self.__record_data_to_server(payload)
+            if res_status_code != 200:
+                CsvSink(self.logging_filename).write(payloads[i:])
+                break
+        claimed_filename.unlink()
@@ -0,0 +1,564 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Python classes reading the share of the machine used by the current process.
+The procfs files are kept opened and read with ``os.pread`` so that the cost
+of a sample does not depend on the size of the monitored process.
+"""
+__all__ = [
+    "LinuxProcessUsage",
+    "CgroupUsage",
+    "PsutilProcessUsage",
+    "CpuTimes",
+    "get_usage_reader",
+]
+
+import glob
+import os
+import time
+from pathlib import Path
+
+import psutil  # type: ignore
+
+PROC_PATH = Path("/proc")
+PROC_STAT_FILE = "stat"
+PROC_MEMINFO_FILE = "meminfo"
+PROC_SELF_STAT_FILE = "self/stat"
+PROC_SELF_STATM_FILE = "self/statm"
+PROC_THREAD_STAT_FILE = "self/task/{}/stat"  # thread native id
+PROC_STAT_PID_FILE = "{}/stat"  # pid
+PROC_STATM_PID_FILE = "{}/statm"  # pid
+PROC_CHILDREN_FILES = "{}/task/*/children"  # pid, or self
+PROC_SELF_CGROUP_FILE = "self/cgroup"
+CGROUP_PATH = Path("/sys/fs/cgroup")
+CGROUP_HYBRID_DIR = "unified"  # mount point of the v2 hierarchy in hybrid mode
+CGROUP_CONTROLLERS_FILE = "cgroup.controllers"
+CGROUP_CPU_STAT_FILE = "cpu.stat"
+CGROUP_MEMORY_FILE = "memory.current"
+PROC_READ_SIZE = 4096
+# the descendants of the process are discovered again after this delay, the
+# processes already known are read from their opened files in between
+CHILDREN_REFRESH_INTERVAL = 1  # seconds
+ATTRIBUTIONS = ["process", "process_tree", "cgroup"]
+
+
+class ChildProcess:
+    """
+    Opened procfs files of a descendant of the current process and its CPU
+    time at the last read
+    """
+
+    def __init__(self, stat_fd, statm_fd):
+        self.stat_fd = stat_fd
+        self.statm_fd = statm_fd
+        self.last_time = 0
+
+    def close(self):
+        os.close(self.stat_fd)
+        os.close(self.statm_fd)
+
+
+class LinuxProcessUsage:
+    """
+    Share of the CPU and memory of the machine used by the current process.
+
+    The CPU share is the CPU time of the process (utime + stime of
+    ``/proc/self/stat``) over the busy time of the machine (``/proc/stat``)
+    since the previous read. The memory share is the resident memory of the
+    process (``/proc/self/statm``) over the memory used on the machine.
+
+    With ``include_children``, the CPU time and the resident memory of every
+    descendant of the process are added. The descendants are discovered with
+    the ``children`` files of the procfs (or psutil when the kernel does not
+    provide them) at most once per second, the files of the processes already
+    known are kept opened. The CPU time used by a child between the last read
+    and its exit is not counted.
+
+    Parameters
+    ----------
+    proc_path : pathlib.Path, optional
+        Mount point of the procfs
+    include_children : bool, default False
+        Whether to include the descendants of the process
+    """
+
+    def __init__(self, proc_path=PROC_PATH, include_children=False):
+        self.proc_path = Path(proc_path)
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.stat_fd = self.open(PROC_STAT_FILE)
+        self.meminfo_fd = self.open(PROC_MEMINFO_FILE)
+        self.open_usage_files()
+        self.include_children = include_children
+        self.children = {}
+        self.last_children_refresh = None
+        self.last_busy_time = self.busy_time()
+        self.last_process_time = self.process_time()
+        if include_children:
+            self.read_children()
+
+    def open(self, filename):
+        """
+        Open a file of the procfs
+        """
+        return os.open(self.proc_path / filename, os.O_RDONLY)
+
+    def open_usage_files(self):
+        """
+        Open the files of the CPU time and memory of the process
+        """
+        self.process_stat_fd = self.open(PROC_SELF_STAT_FILE)
+        self.process_statm_fd = self.open(PROC_SELF_STATM_FILE)
+
+    def close_usage_files(self):
+        """
+        Close the files opened by :func:`LinuxProcessUsage.open_usage_files`
+        """
+        os.close(self.process_stat_fd)
+        os.close(self.process_statm_fd)
+
+    @staticmethod
+    def read_file(fd):
+        """
+        Read the content of an opened procfs file
+        """
+        return os.pread(fd, PROC_READ_SIZE, 0)
+
+    @staticmethod
+    def parse_stat_times(content):
+        """
+        Extract the CPU time (in clock ticks) from the content of a stat file
+        of a process or a thread
+        """
+        # the command name may contain spaces, the fields start after it
+        fields_start = content.rindex(b")") + 2
+        fields = content[fields_start:].split()
+        # utime and stime are the 14th and 15th fields of the file
+        return int(fields[11]) + int(fields[12])
+
+    def busy_time(self):
+        """
+        Returns the time (in clock ticks) the CPUs of the machine spent working
+        """
+        content = self.read_file(self.stat_fd)
+        times = content[: content.index(b"\n")].split()[1:9]
+        # user nice system idle iowait irq softirq steal
+        return sum(map(int, times)) - int(times[3]) - int(times[4])
+
+    def process_time(self):
+        """
+        Returns the CPU time (in clock ticks) used by the process
+        """
+        return self.parse_stat_times(self.read_file(self.process_stat_fd))
+
+    def process_memory(self):
+        """
+        Returns the resident memory (in bytes) of the process
+        """
+        resident_pages = self.read_file(self.process_statm_fd).split()[1]
+        return int(resident_pages) * self.page_size
+
+    def __get_children_pids(self, pid):
+        pids = []
+        for filename in glob.glob(
+            str(self.proc_path / PROC_CHILDREN_FILES.format(pid))
+        ):
+            try:
+                with open(filename, "rb") as children_file:
+                    pids.extend(map(int, children_file.read().split()))
+            except OSError:
+                # the thread has exited
+                continue
+        return pids
+
+    def __find_children(self):
+        """
+        Returns the pids of the descendants of the process
+        """
+        self_children = self.proc_path / PROC_CHILDREN_FILES.format("self")
+        if not glob.glob(str(self_children)):
+            # the kernel was built without CONFIG_PROC_CHILDREN
+            return [child.pid for child in psutil.Process().children(True)]
+        pids = []
+        parents = ["self"]
+        while parents:
+            children = self.__get_children_pids(parents.pop())
+            pids.extend(children)
+            parents.extend(children)
+        return pids
+
+    def __refresh_children(self):
+        for pid in self.__find_children():
+            if pid in self.children:
+                continue
+            try:
+                self.children[pid] = ChildProcess(
+                    self.open(PROC_STAT_PID_FILE.format(pid)),
+                    self.open(PROC_STATM_PID_FILE.format(pid)),
+                )
+            except OSError:
+                # the child has already exited
+                continue
+        self.last_children_refresh = time.monotonic()
+
+    def read_children(self):
+        """
+        Read the descendants of the process
+
+        Returns
+        -------
+        Tuple
+            CPU time (in clock ticks) used by the descendants since the
+            previous read, their resident memory (in bytes)
+        """
+        if (
+            self.last_children_refresh is None
+            or time.monotonic() - self.last_children_refresh
+            >= CHILDREN_REFRESH_INTERVAL
+        ):
+            self.__refresh_children()
+        time_delta = 0
+        memory = 0
+        for pid, child in list(self.children.items()):
+            try:
+                stat = self.read_file(child.stat_fd)
+                statm = self.read_file(child.statm_fd)
+            except OSError:
+                # the child has exited, its opened files can't be read anymore
+                # even if its pid is reused
+                child.close()
+                del self.children[pid]
+                continue
+            child_time = self.parse_stat_times(stat)
+            time_delta += child_time - child.last_time
+            child.last_time = child_time
+            memory += int(statm.split()[1]) * self.page_size
+        return time_delta, memory
+
+    def used_memory(self):
+        """
+        Returns the memory (in bytes) used on the machine
+        """
+        meminfo = {}
+        for line in self.read_file(self.meminfo_fd).splitlines():
+            key, value = line.split(b":", 1)
+            meminfo[key] = value
+            if b"MemAvailable" in meminfo and b"MemTotal" in meminfo:
+                break
+        memory_kb = int(meminfo[b"MemTotal"].split()[0]) - int(
+            meminfo[b"MemAvailable"].split()[0]
+        )
+        return memory_kb * 1024
+
+    def read(self):
+        """
+        Read the share of the machine used since the previous read.
+
+        Returns
+        -------
+        Tuple
+            ratio of cpu used, ratio of memory used
+        """
+        busy_time = self.busy_time()
+        process_time = self.process_time()
+        busy_delta = busy_time - self.last_busy_time
+        process_delta = process_time - self.last_process_time
+        self.last_busy_time = busy_time
+        self.last_process_time = process_time
+        process_memory = self.process_memory()
+        if self.include_children:
+            children_delta, children_memory = self.read_children()
+            process_delta += children_delta
+            process_memory += children_memory
+        cpu_usage = min(process_delta / busy_delta, 1) if busy_delta else 0
+        used_memory = self.used_memory()
+        memory_usage = (
+            min(process_memory / used_memory, 1) if used_memory else 0
+        )
+        return cpu_usage, memory_usage
+
+    def close(self):
+        """
+        Close the opened procfs files
+        """
+        os.close(self.stat_fd)
+        os.close(self.meminfo_fd)
+        self.close_usage_files()
+        for child in self.children.values():
+            child.close()
+        self.children = {}
+
+
+class CgroupUsage(LinuxProcessUsage):
+    """
+    Share of the CPU and memory of the machine used by a cgroup v2, usually
+    the container running the current process.
+
+    The CPU share is the ``usage_usec`` of its ``cpu.stat`` over the busy time
+    of the machine since the previous read, the memory share is its
+    ``memory.current`` over the memory used on the machine. Each read costs
+    one read of each file, whatever the number of processes in the cgroup,
+    the files of the current process are not opened.
+
+    Parameters
+    ----------
+    cgroup_path : pathlib.Path, optional
+        Directory of the cgroup, defaults to the cgroup of the current process
+    proc_path : pathlib.Path, optional
+        Mount point of the procfs
+    cgroup_root : pathlib.Path, optional
+        Mount point of the cgroup v2 hierarchy
+    """
+
+    def __init__(
+        self, cgroup_path=None, proc_path=PROC_PATH, cgroup_root=CGROUP_PATH
+    ):
+        if cgroup_path is None:
+            cgroup_path = self.get_cgroup_path(proc_path, cgroup_root)
+        self.cgroup_path = Path(cgroup_path)
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        super().__init__(proc_path=proc_path)
+
+    def open_usage_files(self):
+        """
+        Open the ``cpu.stat`` and ``memory.current`` files of the cgroup
+        """
+        try:
+            self.cpu_stat_fd = os.open(
+                self.cgroup_path / CGROUP_CPU_STAT_FILE, os.O_RDONLY
+            )
+            self.memory_fd = os.open(
+                self.cgroup_path / CGROUP_MEMORY_FILE, os.O_RDONLY
+            )
+        except FileNotFoundError as error:
+            raise FileNotFoundError(
+                f"No cgroup v2 with CPU and memory controllers found at "
+                f"{self.cgroup_path}"
+            ) from error
+
+    def close_usage_files(self):
+        os.close(self.cpu_stat_fd)
+        os.close(self.memory_fd)
+
+    @staticmethod
+    def get_cgroup_path(proc_path=PROC_PATH, cgroup_root=CGROUP_PATH):
+        """
+        Returns the directory of the cgroup v2 of the current process
+        """
+        cgroup_root = Path(cgroup_root)
+        if not (cgroup_root / CGROUP_CONTROLLERS_FILE).exists():
+            cgroup_root = cgroup_root / CGROUP_HYBRID_DIR
+        content = (Path(proc_path) / PROC_SELF_CGROUP_FILE).read_text()
+        for line in content.splitlines():
+            # the v2 hierarchy is the only one with the id 0 and no controller
+            if line.startswith("0::"):
+                return cgroup_root / line[3:].lstrip("/")
+        raise FileNotFoundError(
+            "The current process is not in a cgroup v2 hierarchy"
+        )
+
+    def process_time(self):
+        """
+        Returns the CPU time (in clock ticks) used by the cgroup
+        """
+        content = self.read_file(self.cpu_stat_fd)
+        # usage_usec is the first line of the file
+        usage_usec = int(content[: content.index(b"\n")].split()[1])
+        return usage_usec * self.clock_ticks / 1e6
+
+    def process_memory(self):
+        """
+        Returns the memory (in bytes) used by the cgroup
+        """
+        return int(self.read_file(self.memory_fd))
+
+
+class PsutilProcessUsage:
+    """
+    Share of the CPU and memory of the machine used by the current process,
+    read with psutil where the procfs is not available.
+
+    Parameters
+    ----------
+    include_children : bool, default False
+        Whether to include the descendants of the process, they are
+        discovered at most once per second
+    """
+
+    def __init__(self, include_children=False):
+        self.process = psutil.Process()
+        self.cpu_count = psutil.cpu_count()
+        self.include_children = include_children
+        self.children = {}
+        self.last_children_refresh = None
+        self.read()
+
+    def __refresh_children(self):
+        for child in self.process.children(recursive=True):
+            # the cpu percent is computed between two calls on the same
+            # psutil.Process, the children are kept between the reads
+            self.children.setdefault(child.pid, child)
+        self.last_children_refresh = time.monotonic()
+
+    def read(self):
+        """
+        Read the share of the machine used since the previous read.
+
+        Returns
+        -------
+        Tuple
+            ratio of cpu used, ratio of memory used
+        """
+        processes = [self.process]
+        if self.include_children:
+            if (
+                self.last_children_refresh is None
+                or time.monotonic() - self.last_children_refresh
+                >= CHILDREN_REFRESH_INTERVAL
+            ):
+                self.__refresh_children()
+            processes.extend(self.children.values())
+        process_cpu_percent = 0
+        process_memory = 0
+        for process in processes:
+            try:
+                with process.oneshot():
+                    process_cpu_percent += process.cpu_percent()
+                    process_memory += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                self.children.pop(process.pid, None)
+        cpu_percent = psutil.cpu_percent()
+        cpu_usage = (
+            min(process_cpu_percent / (cpu_percent * self.cpu_count), 1)
+            if cpu_percent
+            else 0
+        )
+        memory_global = psutil.virtual_memory()
+        used_memory = memory_global.total - memory_global.available
+        memory_usage = (
+            min(process_memory / used_memory, 1) if used_memory else 0
+        )
+        return cpu_usage, memory_usage
+
+    def close(self):
+        """
+        Forget the descendants of the process
+        """
+        self.children = {}
+
+
+def get_usage_reader(attribution="process", proc_path=PROC_PATH):
+    """
+    Returns the reader of the share of the machine used by the monitored
+    processes
+
+    Parameters
+    ----------
+    attribution : {'process', 'process_tree', 'cgroup'}, default 'process'
+        Whether to monitor the current process, the current process and its
+        descendants or the cgroup of the current process
+    proc_path : pathlib.Path, optional
+        Mount point of the procfs
+
+    Returns
+    -------
+    LinuxProcessUsage, CgroupUsage or PsutilProcessUsage
+        the procfs reader when the procfs is available, the psutil one
+        otherwise
+    """
+    if attribution not in ATTRIBUTIONS:
+        raise ValueError(
+            f"Unknown attribution {attribution}, "
+            f"it should be one of {ATTRIBUTIONS}"
+        )
+    if attribution == "cgroup":
+        return CgroupUsage(proc_path=proc_path)
+    include_children = attribution == "process_tree"
+    if (Path(proc_path) / PROC_SELF_STAT_FILE).exists():
+        return LinuxProcessUsage(
+            proc_path=proc_path, include_children=include_children
+        )
+    return PsutilProcessUsage(include_children=include_children)
+
+
+class CpuTimes:
+    """
+    CPU times of the machine, of the current process and of one of its
+    threads, used to attribute energy to a thread.
+
+    On Linux they are read from the procfs (``/proc/self/task/<tid>/stat``
+    for the thread), elsewhere from psutil.
+
+    Parameters
+    ----------
+    proc_path : pathlib.Path, optional
+        Mount point of the procfs
+    """
+
+    def __init__(self, proc_path=PROC_PATH):
+        self.proc_path = Path(proc_path)
+        if (self.proc_path / PROC_SELF_STAT_FILE).exists():
+            self.process_usage = LinuxProcessUsage(proc_path=self.proc_path)
+            self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        else:
+            self.process_usage = None
+            self.process = psutil.Process()
+
+    def __read_procfs(self, thread_id):
+        try:
+            with open(
+                self.proc_path / PROC_THREAD_STAT_FILE.format(thread_id), "rb"
+            ) as stat_file:
+                thread_time = (
+                    LinuxProcessUsage.parse_stat_times(stat_file.read())
+                    / self.clock_ticks
+                )
+        except (FileNotFoundError, ProcessLookupError):
+            # the thread has exited
+            thread_time = None
+        return (
+            self.process_usage.busy_time() / self.clock_ticks,
+            self.process_usage.process_time() / self.clock_ticks,
+            thread_time,
+        )
+
+    def __read_psutil(self, thread_id):
+        cpu_times = psutil.cpu_times()
+        busy_time = (
+            sum(cpu_times)
+            - cpu_times.idle
+            - getattr(cpu_times, "iowait", 0)
+            # guest times are already accounted in the user time
+            - getattr(cpu_times, "guest", 0)
+            - getattr(cpu_times, "guest_nice", 0)
+        )
+        process_times = self.process.cpu_times()
+        thread_time = None
+        for thread in self.process.threads():
+            if thread.id == thread_id:
+                thread_time = thread.user_time + thread.system_time
+                break
+        return (
+            busy_time,
+            process_times.user + process_times.system,
+            thread_time,
+        )
+
+    def read(self, thread_id):
+        """
+        Read the CPU times.
+
+        Parameters
+        ----------
+        thread_id : int
+            Native id of the thread
+
+        Returns
+        -------
+        Tuple
+            busy time of the machine, CPU time of the process, CPU time of
+            the thread (in seconds), the CPU time of the thread is None when
+            it has exited
+        """
+        if self.process_usage is not None:
+            return self.__read_procfs(thread_id)
+        return self.__read_psutil(thread_id)
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Bounded storage of the samples collected while monitoring the power usage
+"""
+__all__ = ["SampleBuffer"]
+
+import threading
+
+import numpy as np  # type: ignore
+
+DEFAULT_CAPACITY = 3600
+
+
+class SampleBuffer:
+    """
+    Preallocated ring buffer of samples keeping the running totals of each
+    column.
+
+    Only the last ``capacity`` samples are kept, the totals are updated as the
+    samples arrive so they cover every sample appended since the last clear.
+    The memory used does not depend on the duration of the measure.
+
+    Parameters
+    ----------
+    columns : list
+        Name of the values of a sample
+    capacity : int, optional
+        Number of samples kept in memory
+    """
+
+    def __init__(self, columns, capacity=DEFAULT_CAPACITY):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.samples = np.zeros((capacity, len(self.columns)))
+        self.totals = np.zeros(len(self.columns))
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def dropped(self):
+        """
+        Number of samples overwritten since the last clear
+        """
+        return max(self.count - self.capacity, 0)
+
+    def append(self, values):
+        """
+        Append a sample and add it to the running totals
+
+        Parameters
+        ----------
+        values : tuple
+            the values of the sample, ordered like the columns
+        """
+        with self.lock:
+            row = self.samples[self.count % self.capacity]
+            row[:] = values
+            self.totals += row
+            self.count += 1
+
+    def get_totals(self):
+        """
+        Returns the sum of each column over all the samples appended
+
+        Returns
+        -------
+        dict
+            the total of each column
+        """
+        with self.lock:
+            return dict(zip(self.columns, self.totals.tolist()))
+
+    def get_samples(self):
+        """
+        Returns the samples still in memory, from the oldest to the newest
+
+        Returns
+        -------
+        numpy.ndarray
+            array of shape (number of samples, number of columns)
+        """
+        with self.lock:
+            if self.count <= self.capacity:
+                return self.samples[: self.count].copy()
+            oldest = self.count % self.capacity
+            return np.roll(self.samples, -oldest, axis=0)
+
+    def clear(self):
+        """
+        Forget every sample and reset the totals
+        """
+        with self.lock:
+            self.totals[:] = 0
+            self.count = 0
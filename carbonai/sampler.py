@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Scheduler calling the sampling functions of the power gadgets at a fixed rate
+"""
+__all__ = ["Sampler"]
+
+import logging
+import threading
+import time
+import traceback
+
+LOGGER = logging.getLogger(__name__)
+
+MIN_INTERVAL = 0.01  # seconds
+
+
+class Sampler:
+    """
+    Calls sampling functions at a fixed rate in a background thread.
+
+    The deadlines are computed on the monotonic clock from the start of the
+    sampler, so the rate does not drift with the cost of the samples. The
+    thread waits on an event, stopping the sampler wakes it immediately.
+
+    Parameters
+    ----------
+    callbacks : list, optional
+        Functions taking no argument called at each tick
+    interval : float, default 1
+        Time between two ticks, in seconds (at least 0.01)
+    """
+
+    def __init__(self, callbacks=(), interval=1):
+        if interval < MIN_INTERVAL:
+            raise ValueError(
+                f"The sampling interval must be at least {MIN_INTERVAL}s, "
+                f"got {interval}s"
+            )
+        self.callbacks = list(callbacks)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        """
+        Whether the sampling thread is running
+        """
+        return self.thread is not None and self.thread.is_alive()
+
+    def add(self, callback):
+        """
+        Add a function to call at each tick
+        """
+        self.callbacks.append(callback)
+
+    def sample(self):
+        """
+        Call every sampling function once
+        """
+        for callback in self.callbacks:
+            try:
+                callback()
+            except Exception:
+                LOGGER.error("* error while sampling the power usage *")
+                LOGGER.error(traceback.format_exc())
+
+    def __run(self):
+        deadline = time.monotonic() + self.interval
+        while not self.stop_event.wait(max(deadline - time.monotonic(), 0)):
+            self.sample()
+            deadline += self.interval
+            now = time.monotonic()
+            if deadline < now:
+                # the samples took longer than the interval, skip the ticks
+                # missed instead of catching up
+                missed = (now - deadline) // self.interval + 1
+                deadline += missed * self.interval
+
+    def start(self):
+        """
+        Start calling the sampling functions in a background thread
+        """
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self.__run, name="carbonai-sampler", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self, final_sample=True):
+        """
+        Stop the sampling thread
+
+        Parameters
+        ----------
+        final_sample : bool, default True
+            Whether to call the sampling functions one last time, so that the
+            samples cover the time up to the stop
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if final_sample:
+            self.sample()
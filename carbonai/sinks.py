@@ -0,0 +1,595 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Sinks
+-----
+The destinations of the emissions records of a PowerMeter. The records are
+buffered in memory and written in bulk by a background thread.
+"""
+
+__all__ = [
+    "Sink",
+    "CsvSink",
+    "ExcelSink",
+    "ParquetSink",
+    "SqliteSink",
+    "BufferedSink",
+    "get_sink",
+]
+
+import abc
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import traceback
+import urllib.parse
+import uuid
+import weakref
+from pathlib import Path
+
+import pandas as pd  # type: ignore
+
+from .file_lock import FileLock, append_to_file
+from .utils import DATETIME_FORMAT
+
+try:
+    import pyarrow  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    pyarrow = None
+    pq = None
+
+LOGGER = logging.getLogger(__name__)
+
+# the buffered records are written when there are this many of them
+FLUSH_SIZE = 100
+# or when the oldest of them is this old
+FLUSH_INTERVAL = 5  # seconds
+# the records of an Excel workbook are staged in a JSON lines file next to it
+EXCEL_STAGING_SUFFIX = ".staging.jsonl"
+# extension of the default file of each output format
+OUTPUT_EXTENSIONS = {
+    "csv": ".csv",
+    "excel": ".xlsx",
+    "parquet": ".parquet",
+    "sqlite": ".db",
+}
+SQLITE_EXTENSIONS = [".db", ".sqlite", ".sqlite3"]
+SQLITE_TABLE = "emissions"
+# the buffered sinks of the process, reset in the forked processes
+BUFFERED_SINKS: "weakref.WeakSet[BufferedSink]" = weakref.WeakSet()
+# the columns of the records indexed in the SQLite database
+SQLITE_INDEXED_COLUMNS = ["Project name", "Algorithm", "Step", "Datetime"]
+# the columns of the records holding numbers, the others hold strings
+NUMERIC_COLUMN_UNITS = ("(sec)", "(mWh)", "(gCO2e)")
+NUMERIC_COLUMNS = ["PUE"]
+DATETIME_COLUMN = "Datetime"
+PROJECT_COLUMN = "Project name"
+# name of the partitions of the records without value, like the entities
+# of a PowerMeter
+PARQUET_EMPTY_PARTITION = "--"
+
+
+def is_numeric_column(column):
+    """
+    Whether a column of the records holds numbers: the times, energies,
+    emissions and PUE
+    """
+    return column in NUMERIC_COLUMNS or column.endswith(NUMERIC_COLUMN_UNITS)
+
+
+class Sink(abc.ABC):
+    """
+    Abstract destination of the emissions records
+    """
+
+    @abc.abstractmethod
+    def write(self, records):
+        """
+        Write records
+
+        Parameters
+        ----------
+        records : list
+            the records, dicts mapping the columns of the emissions file to
+            their values
+        """
+
+    def flush(self):
+        """
+        Write the records kept by the sink, if any
+        """
+
+    def close(self):
+        """
+        Flush the sink and release its resources
+        """
+        self.flush()
+
+
+class CsvSink(Sink):
+    """
+    Appends the records to a CSV file
+
+    The records are aligned on the columns of the file when it exists. When
+    they have columns unknown to the file, such as the fields added by a
+    newer release, the file is rewritten once with the extended header. The
+    file may be shared by several processes: it is locked while its header
+    is checked and the records are appended with a single write.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path of the CSV file
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def write(self, records):
+        data = pd.DataFrame(records)
+        with FileLock(self.path):
+            if self.path.exists() and self.path.stat().st_size:
+                # align the records on the columns of the existing file
+                columns = list(pd.read_csv(self.path, nrows=0).columns)
+                unknown_columns = [
+                    column for column in data.columns if column not in columns
+                ]
+                if unknown_columns:
+                    self.__extend_header(columns, unknown_columns)
+                    columns += unknown_columns
+                data = data.reindex(columns=columns)
+                text = data.to_csv(index=False, header=False)
+            else:
+                text = data.to_csv(index=False)
+            append_to_file(self.path, text)
+
+    def __extend_header(self, columns, new_columns):
+        """
+        Rewrite the file with new columns, empty for the records already
+        written
+        """
+        LOGGER.warning(
+            "%s is rewritten with the new columns %s", self.path, new_columns
+        )
+        # the values are kept as they were written
+        data = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+        rewritten_path = self.path.with_name(self.path.name + ".rewrite")
+        data.reindex(columns=columns + new_columns, fill_value="").to_csv(
+            rewritten_path, index=False
+        )
+        os.replace(rewritten_path, self.path)
+
+
+class ExcelSink(Sink):
+    """
+    Appends the records to an Excel workbook
+
+    Rewriting a workbook costs as much as its size, the records are appended
+    to a staging file next to it instead, one JSON line per record. The
+    workbook is only rewritten with the staged records when the sink is
+    flushed or closed, or by :func:`ExcelSink.materialize`. The records
+    staged by a process which did not flush them are included by the next
+    flush. The workbook is locked while records are staged or added to it,
+    so that several processes may share it.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path of the Excel file
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.staging_path = self.path.with_name(
+            self.path.name + EXCEL_STAGING_SUFFIX
+        )
+
+    def write(self, records):
+        lines = "".join(
+            json.dumps(record, default=str) + "\n" for record in records
+        )
+        with FileLock(self.path):
+            append_to_file(self.staging_path, lines)
+
+    def materialize(self):
+        """
+        Add the staged records to the workbook and clear the staging file
+
+        Returns
+        -------
+        int
+            the number of records added to the workbook
+        """
+        with FileLock(self.path):
+            if not self.staging_path.exists():
+                return 0
+            with open(self.staging_path, encoding="utf-8") as file:
+                records = [json.loads(line) for line in file if line.strip()]
+            if records:
+                data = pd.DataFrame(records)
+                if self.path.exists():
+                    data = pd.concat(
+                        [pd.read_excel(self.path), data], ignore_index=True
+                    )
+                data.to_excel(self.path, index=False)
+            os.remove(self.staging_path)
+        return len(records)
+
+    def flush(self):
+        self.materialize()
+
+
+class ParquetSink(Sink):
+    """
+    Writes the records to a Parquet dataset partitioned by date and project
+
+    Each write adds one Parquet file to the partition of each date and
+    project of its records: ``<path>/date=2022-05-03/project=<project>/``.
+    The columns are typed, the datetime as a timestamp, the times, energies
+    and emissions as floats and the other columns as strings, so that the
+    dataset can be read by column and by partition, for instance with
+    ``pd.read_parquet(path, columns=[...], filters=[("project", "=", ...)])``.
+    It requires pyarrow.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Directory of the dataset
+    """
+
+    def __init__(self, path):
+        if pq is None:
+            raise ImportError(
+                "pyarrow is not installed, "
+                "install it with pip install pyarrow"
+            )
+        self.path = Path(path)
+
+    @staticmethod
+    def get_typed_records(records):
+        """
+        Returns the records with typed columns
+
+        Parameters
+        ----------
+        records : list
+            the records
+
+        Returns
+        -------
+        pandas.DataFrame
+            the records, with their datetime as a timestamp, their times,
+            energies and emissions as floats and their other columns as
+            strings
+        """
+        data = pd.DataFrame(records)
+        for column in data.columns:
+            if column == DATETIME_COLUMN:
+                data[column] = pd.to_datetime(
+                    data[column], format=DATETIME_FORMAT
+                )
+            elif is_numeric_column(column):
+                data[column] = pd.to_numeric(data[column]).astype(float)
+            else:
+                data[column] = data[column].fillna("").astype(str)
+        return data
+
+    @staticmethod
+    def __get_partition(value):
+        value = str(value)
+        if not value:
+            return PARQUET_EMPTY_PARTITION
+        return urllib.parse.quote(value, safe="")
+
+    def write(self, records):
+        data = self.get_typed_records(records)
+        dates = data[DATETIME_COLUMN].dt.strftime("%Y-%m-%d")
+        projects = data.get(PROJECT_COLUMN, pd.Series("", index=data.index))
+        file_name = f"{uuid.uuid4().hex}.parquet"
+        for (date, project), partition in data.groupby([dates, projects]):
+            partition_path = (
+                self.path
+                / f"date={date}"
+                / f"project={self.__get_partition(project)}"
+            )
+            partition_path.mkdir(parents=True, exist_ok=True)
+            pq.write_table(
+                pyarrow.Table.from_pandas(partition, preserve_index=False),
+                partition_path / file_name,
+            )
+
+
+class SqliteSink(Sink):
+    """
+    Inserts the records in a table of a SQLite database
+
+    The database runs in WAL mode, so that it can be read while records are
+    written, and each write inserts its records in a single transaction. The
+    table has the columns of the records, new columns are added when needed,
+    and it is indexed on the project, algorithm, step and datetime. The
+    datetimes are stored as ISO 8601 strings, which sort and compare in
+    time order. They are in local time, like the other outputs, for instance:
+
+    .. code-block:: sql
+
+        SELECT Algorithm, SUM("CO2 emitted (gCO2e)") FROM emissions
+        WHERE Datetime >= datetime('now', 'localtime', '-7 days')
+        GROUP BY Algorithm
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path of the database
+    table : str, default 'emissions'
+        Name of the table of the records
+    """
+
+    def __init__(self, path, table=SQLITE_TABLE):
+        self.path = Path(path)
+        self.table = table
+        self.connection = None
+        self.columns = []
+
+    @staticmethod
+    def __quote(name):
+        return '"' + name.replace('"', '""') + '"'
+
+    def __connect(self):
+        # the records are written by the thread of a BufferedSink or by the
+        # thread flushing it, one at a time
+        self.connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.__quote(self.table)} "
+            "(id INTEGER PRIMARY KEY)"
+        )
+        self.__read_columns()
+
+    def __read_columns(self):
+        self.columns = [
+            row[1]
+            for row in self.connection.execute(
+                f"PRAGMA table_info({self.__quote(self.table)})"
+            )
+        ]
+
+    def __add_columns(self, columns):
+        if set(columns).difference(self.columns):
+            # another process may have added them since the columns were
+            # read, the write transaction keeps them from changing now
+            self.__read_columns()
+        for column in columns:
+            if column in self.columns:
+                continue
+            column_type = "REAL" if is_numeric_column(column) else "TEXT"
+            self.connection.execute(
+                f"ALTER TABLE {self.__quote(self.table)} "
+                f"ADD COLUMN {self.__quote(column)} {column_type}"
+            )
+            self.columns.append(column)
+            if column in SQLITE_INDEXED_COLUMNS:
+                index = f"{self.table}_{column.split()[0].lower()}"
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self.__quote(index)} ON "
+                    f"{self.__quote(self.table)} ({self.__quote(column)})"
+                )
+
+    @staticmethod
+    def __get_value(column, value):
+        if value is None or (isinstance(value, float) and value != value):
+            return None
+        if column == DATETIME_COLUMN:
+            return datetime.datetime.strptime(
+                value, DATETIME_FORMAT
+            ).isoformat(sep=" ")
+        if is_numeric_column(column):
+            return float(value)
+        return str(value)
+
+    def write(self, records):
+        if self.connection is None:
+            self.__connect()
+        columns = list(
+            dict.fromkeys(key for record in records for key in record)
+        )
+        rows = [
+            [
+                self.__get_value(column, record.get(column))
+                for column in columns
+            ]
+            for record in records
+        ]
+        # takes the write lock before the columns are checked
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.__add_columns(columns)
+            self.connection.executemany(
+                f"INSERT INTO {self.__quote(self.table)} "
+                f"({', '.join(map(self.__quote, columns))}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                rows,
+            )
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            # the columns added by the transaction are rolled back too
+            self.connection.close()
+            self.connection = None
+            raise
+        self.connection.execute("COMMIT")
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class BufferedSink(Sink):
+    """
+    Buffers the records in memory and writes them in bulk to another sink
+
+    The records are written by a background thread, started with the first
+    record, once ``flush_size`` records are buffered or every
+    ``flush_interval`` seconds. The sink itself is only flushed by
+    :func:`BufferedSink.flush` and at the close. The errors of the sink are
+    logged, the records which could not be written are lost.
+
+    In a process forked from the one which created the sink, such as the
+    worker of a pool, nothing flushes the buffer: the records are written
+    right away.
+
+    Parameters
+    ----------
+    sink : Sink
+        The sink writing the records
+    flush_size : int, default 100
+        Number of buffered records triggering a write
+    flush_interval : float, default 5
+        Time between two writes of the buffered records, in seconds
+    """
+
+    def __init__(
+        self, sink, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL
+    ):
+        self.sink = sink
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.records = []
+        self.lock = threading.Lock()
+        # only one thread writes to the sink at a time
+        self.flush_lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.thread = None
+        self.closed = False
+        self.pid = os.getpid()
+        BUFFERED_SINKS.add(self)
+
+    def reset_after_fork(self):
+        """
+        Drop the state copied from the parent process: its locks may be
+        held by threads which don't exist anymore and its records are
+        written by the parent
+        """
+        self.records = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.thread = None
+
+    def write(self, records):
+        with self.lock:
+            if self.closed or os.getpid() != self.pid:
+                # no background writes, after the close or in a forked
+                # process, the records are written now
+                self.__write(records)
+                return
+            self.records.extend(records)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.__run, name="carbonai-sink", daemon=True
+                )
+                self.thread.start()
+            if len(self.records) >= self.flush_size:
+                self.flush_event.set()
+
+    def __run(self):
+        while not self.closed:
+            self.flush_event.wait(self.flush_interval)
+            self.flush_event.clear()
+            self.__write_buffer()
+
+    def __write(self, records):
+        with self.flush_lock:
+            try:
+                self.sink.write(records)
+            except Exception:
+                LOGGER.error(
+                    "* error while writing %s records *", len(records)
+                )
+                LOGGER.error(traceback.format_exc())
+
+    def __write_buffer(self):
+        with self.lock:
+            records, self.records = self.records, []
+        if records:
+            self.__write(records)
+
+    def __call_sink(self, method):
+        with self.flush_lock:
+            try:
+                method()
+            except Exception:
+                LOGGER.error("* error while flushing the records *")
+                LOGGER.error(traceback.format_exc())
+
+    def flush(self):
+        """
+        Write the buffered records right away and flush the sink
+        """
+        self.__write_buffer()
+        self.__call_sink(self.sink.flush)
+
+    def close(self):
+        """
+        Stop the background thread, write the buffered records and close the
+        sink. The records written afterwards are written right away.
+        """
+        with self.lock:
+            self.closed = True
+            thread, self.thread = self.thread, None
+        self.flush_event.set()
+        if thread is not None:
+            thread.join()
+        self.__write_buffer()
+        self.__call_sink(self.sink.close)
+
+
+def reset_buffered_sinks():
+    """
+    Reset the buffered sinks in a forked process
+    """
+    for sink in list(BUFFERED_SINKS):
+        sink.reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_buffered_sinks)
+
+
+def get_sink(filepath, output_format=None):
+    """
+    Returns the sink writing records to a file, from its extension
+
+    Parameters
+    ----------
+    filepath : pathlib.Path
+        Path of the file
+    output_format : {'csv', 'excel', 'parquet', 'sqlite'}, optional
+        Format of the file when its extension is not known
+
+    Returns
+    -------
+    Sink
+        a CsvSink for a .csv file, a ParquetSink for a .parquet dataset, a
+        SqliteSink for a .db, .sqlite or .sqlite3 database, an ExcelSink
+        otherwise
+    """
+    filepath = Path(filepath)
+    if filepath.suffix in [".xls", ".xlsx"]:
+        return ExcelSink(filepath)
+    if filepath.suffix == ".csv":
+        return CsvSink(filepath)
+    if filepath.suffix == ".parquet" or output_format == "parquet":
+        return ParquetSink(filepath)
+    if filepath.suffix in SQLITE_EXTENSIONS or output_format == "sqlite":
+        return SqliteSink(filepath)
+    LOGGER.info(
+        "unknown format: it should be either .csv, .xls, .xlsx, .parquet, "
+        ".db, .sqlite or .sqlite3"
+    )
+    return ExcelSink(filepath)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from fuzzywuzzy import fuzz  # type: ignore
@@ -11,12 +12,13 @@ ENERGY_MIX_COLUMN = "Energy mix (kgCO2/kWh)"
 COUNTRY_CODE_COLUMN = "ISO"
 COUNTRY_NAME_COLUMN = "Country"
 
-POWERLOG_PATH_LINUX = Path("/sys/class/powercap/intel-rapl")
+POWERLOG_PATH_LINUX = Path("/sys/class/powercap")
 MSR_PATH_LINUX_TEST = Path("/dev/cpu/0/msr")
 MAC_INTELPOWERLOG_FILENAME = "intelPowerLog.csv"
 WIN_INTELPOWERLOG_FILENAME = "PwrData_*.csv"
 
 LOGGING_FILE = "power_logs.csv"
+DATETIME_FORMAT = "%m/%d/%Y %H:%M:%S"  # format of the records datetime
 
 TOTAL_CPU_TIME = "Total Elapsed CPU Time (sec)"
 TOTAL_GPU_TIME = "Total Elapsed GPU Time (sec)"
@@ -24,8 +26,13 @@ TOTAL_ENERGY_ALL = "Cumulative Package Energy (mWh)"
 TOTAL_ENERGY_CPU = "Cumulative IA Energy (mWh)"
 TOTAL_ENERGY_PROCESS_CPU = "Cumulative process CPU Energy (mWh)"
 TOTAL_ENERGY_GPU = "Cumulative GPU Energy (mWh)"
+TOTAL_ENERGY_PROCESS_GPU = "Cumulative process GPU Energy (mWh)"
 TOTAL_ENERGY_MEMORY = "Cumulative DRAM Energy (mWh)"
 TOTAL_ENERGY_PROCESS_MEMORY = "Cumulative process DRAM Energy (mWh)"
+TOTAL_ENERGY_CORE = "Cumulative Core Energy (mWh)"
+TOTAL_ENERGY_UNCORE = "Cumulative Uncore Energy (mWh)"
+TOTAL_ENERGY_PSYS = "Cumulative Platform Energy (mWh)"
+TOTAL_ENERGY_WALL = "Cumulative Wall Energy (mWh)"
 CPU_PERCENT_USAGE = "CPU_percent_usage"
 MEMORY_PERCENT_USAGE = "memory_percent_usage"
 
@@ -39,6 +46,25 @@ AVAILABLE_STEPS = [
 ]
 
 
+def get_scratch_path(name):
+    """
+    Returns the path of a scratch file owned by the current process, in the
+    temporary directory so that processes of several users or running from a
+    shared install don't write to the same file
+
+    Parameters
+    ----------
+    name : str
+        Name of the scratch file
+
+    Returns
+    -------
+    pathlib.Path
+        ``<tmp>/carbonai-<pid>-<name>``
+    """
+    return Path(tempfile.gettempdir()) / f"carbonai-{os.getpid()}-{name}"
+
+
 def match(s, options, threshold=80):
     """Fuzzy matching function."""
 
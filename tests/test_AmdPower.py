@@ -0,0 +1,68 @@
+"""
+tests for the Python class monitoring the power usage of AMD GPUs
+"""
+import pytest
+
+from carbonai.amd_power import AmdPower
+from carbonai.sampler import Sampler
+from carbonai.utils import (
+    TOTAL_ENERGY_GPU,
+    TOTAL_ENERGY_PROCESS_GPU,
+    TOTAL_GPU_TIME,
+)
+
+
+def write_hwmon(drm_path, card, name, sensors):
+    hwmon_path = drm_path / card / "device/hwmon/hwmon0"
+    hwmon_path.mkdir(parents=True, exist_ok=True)
+    (hwmon_path / "name").write_text(f"{name}\n")
+    for sensor, value in sensors.items():
+        (hwmon_path / sensor).write_text(f"{value}\n")
+    return hwmon_path
+
+
+@pytest.fixture
+def drm_path(tmp_path):
+    """
+    A fake sysfs with an AMD GPU providing an energy counter, an AMD GPU
+    providing its average power and a GPU of another vendor
+    """
+    write_hwmon(tmp_path, "card0", "amdgpu", {"energy1_input": 10**6})
+    write_hwmon(tmp_path, "card1", "amdgpu", {"power1_average": 36 * 10**6})
+    write_hwmon(tmp_path, "card2", "nouveau", {"power1_input": 10**6})
+    (tmp_path / "card0-DP-1").mkdir()
+    return tmp_path
+
+
+def test_find_sensors(drm_path):
+    sensors = AmdPower.find_sensors(drm_path)
+    assert [sensor.name for sensor in sensors] == [
+        "energy1_input",
+        "power1_average",
+    ]
+    assert AmdPower.is_available(drm_path)
+    assert not AmdPower.is_available(drm_path / "card2")
+
+
+def test_amd_power(drm_path, monkeypatch):
+    """
+    Make sure the energy counters are used when available and the power
+    draws are integrated otherwise
+    """
+    clock = iter([0, 10])
+    monkeypatch.setattr(
+        "carbonai.amd_power.time.monotonic", lambda: next(clock)
+    )
+    monkeypatch.setattr(
+        "carbonai.nvidia_power.time.monotonic", lambda: next(clock)
+    )
+    gpu_power = AmdPower(sampler=Sampler(), drm_path=drm_path)
+    gpu_power.start()
+    # 360 J used by the first GPU, 36 W during 10 s for the second one
+    write_hwmon(drm_path, "card0", "amdgpu", {"energy1_input": 361 * 10**6})
+    gpu_power.stop()
+    assert gpu_power.record == {
+        TOTAL_GPU_TIME: 10,
+        TOTAL_ENERGY_GPU: pytest.approx(200),
+        TOTAL_ENERGY_PROCESS_GPU: pytest.approx(200),
+    }
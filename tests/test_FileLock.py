@@ -0,0 +1,94 @@
+"""
+tests for the appends of several processes to a shared file
+"""
+import multiprocessing
+import threading
+import time
+
+import pandas as pd
+
+from carbonai.file_lock import FileLock, append_to_file
+from carbonai.sinks import CsvSink
+from carbonai.utils import get_scratch_path
+
+WORKERS = 4
+BATCHES = 20
+
+
+def write_records(path, worker):
+    """
+    Append batches of records to a CSV file, as the workers of a node do
+    """
+    sink = CsvSink(path)
+    for batch in range(BATCHES):
+        sink.write(
+            [
+                {"Worker": worker, "Batch": batch, "Step": step}
+                for step in range(5)
+            ]
+        )
+
+
+def test_csv_sink_processes(tmp_path):
+    """
+    Make sure the records of concurrent processes are written under a single
+    header and without interleaved rows
+    """
+    path = tmp_path / "emissions.csv"
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=write_records, args=(path, worker))
+        for worker in range(WORKERS)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    assert path.read_text().count("Worker") == 1
+    records = pd.read_csv(path)
+    assert list(records.columns) == ["Worker", "Batch", "Step"]
+    assert len(records) == WORKERS * BATCHES * 5
+    assert records.groupby("Worker").size().to_dict() == {
+        worker: BATCHES * 5 for worker in range(WORKERS)
+    }
+
+
+def test_file_lock(tmp_path):
+    """
+    Make sure the lock is exclusive and the text is appended
+    """
+    path = tmp_path / "emissions.csv"
+    events = []
+
+    def hold_lock(name):
+        with FileLock(path):
+            events.append(f"{name} in")
+            time.sleep(0.05)
+            append_to_file(path, f"{name}\n")
+            events.append(f"{name} out")
+
+    threads = [
+        threading.Thread(target=hold_lock, args=(name,)) for name in "ab"
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert events in (
+        ["a in", "a out", "b in", "b out"],
+        ["b in", "b out", "a in", "a out"],
+    )
+    assert sorted(path.read_text().splitlines()) == ["a", "b"]
+
+
+def test_scratch_path():
+    """
+    Make sure the scratch files are owned by the process
+    """
+    path = get_scratch_path("intelPowerLog.csv")
+    assert path.name.endswith("-intelPowerLog.csv")
+    assert path != get_scratch_path("power_logs.csv")
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        assert pool.apply(get_scratch_path, ("intelPowerLog.csv",)) != path
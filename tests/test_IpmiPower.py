@@ -0,0 +1,109 @@
+"""
+tests for the Python class monitoring the wall power with IPMI
+"""
+import sys
+import time
+
+import pytest
+
+from carbonai.ipmi_power import IpmiPower
+from carbonai.utils import TOTAL_ENERGY_WALL
+
+FAKE_IPMITOOL = """#!{python}
+import sys
+import time
+for request in sys.stdin:
+    if request.strip() == "dcmi power reading":
+        time.sleep({delay})
+        print("ipmitool> ")
+        print("    Instantaneous power reading:   360 Watts")
+        print("    Minimum during sampling period: 100 Watts")
+        print("    Power reading state is:        activated")
+        print("", flush=True)
+"""
+
+
+def write_fake_ipmitool(path, delay=0):
+    """
+    A fake ipmitool shell answering the DCMI power readings after a delay
+    """
+    path.write_text(FAKE_IPMITOOL.format(python=sys.executable, delay=delay))
+    path.chmod(0o755)
+    return [str(path), "shell"]
+
+
+@pytest.fixture
+def fake_ipmitool(tmp_path):
+    return write_fake_ipmitool(tmp_path / "ipmitool")
+
+
+def test_ipmi_integration():
+    """
+    Make sure the energy is integrated with the times of the readings
+    """
+    wall_power = IpmiPower(command=["ipmitool", "shell"])
+    wall_power.sampling = True
+    wall_power.add_reading(100, 10)
+    wall_power.add_reading(300, 12)
+    wall_power.add_reading(300, 13.5)
+    # 200 W during 2 s and 300 W during 1.5 s
+    assert wall_power.energy == pytest.approx(850 / 3.6)
+
+
+def test_ipmi_snapshot():
+    """
+    Make sure the energy extrapolated by a snapshot is kept when the power
+    drops
+    """
+    wall_power = IpmiPower(command=["ipmitool", "shell"])
+    wall_power.sampling = True
+    wall_power.add_reading(300, time.monotonic() - 1)
+    energy = wall_power.snapshot()[TOTAL_ENERGY_WALL]
+    assert energy == pytest.approx(300 / 3.6, rel=0.01)
+    wall_power.add_reading(100, time.monotonic())
+    assert wall_power.snapshot()[TOTAL_ENERGY_WALL] >= energy
+    # a reading requested before the snapshot adds no energy
+    wall_power.add_reading(0, time.monotonic() - 1)
+    assert wall_power.energy >= energy
+
+
+def test_ipmi_request_time(tmp_path):
+    """
+    Make sure the readings are timestamped with the time of their request
+    """
+    command = write_fake_ipmitool(tmp_path / "ipmitool", delay=0.3)
+    wall_power = IpmiPower(interval=10, command=command)
+    start_time = time.monotonic()
+    wall_power.start()
+    time.sleep(1)
+    assert wall_power.last_reading is not None
+    assert wall_power.last_reading[0] - start_time < 0.2
+    wall_power.stop()
+    wall_power.close()
+
+
+def test_ipmi_available(fake_ipmitool, tmp_path):
+    assert IpmiPower.is_available(fake_ipmitool)
+    assert not IpmiPower.is_available([str(tmp_path / "missing"), "shell"])
+
+
+def test_ipmi_power(fake_ipmitool):
+    """
+    Make sure the IPMI shell is read and kept alive across the measures
+    """
+    wall_power = IpmiPower(interval=0.05, command=fake_ipmitool)
+    processes = set()
+    for _ in range(2):
+        start_time = time.monotonic()
+        wall_power.start()
+        processes.add(wall_power.process)
+        time.sleep(0.5)
+        wall_power.stop()
+        elapsed_time = time.monotonic() - start_time
+        assert wall_power.running
+        # 360 W is 100 mWh per second, from the first reading
+        assert 50 < wall_power.record[TOTAL_ENERGY_WALL] / elapsed_time
+        assert wall_power.record[TOTAL_ENERGY_WALL] / elapsed_time <= 100
+    assert len(processes) == 1
+    wall_power.close()
+    assert not wall_power.running
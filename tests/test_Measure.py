@@ -0,0 +1,105 @@
+"""
+tests for the Python classes of the measure module
+"""
+import asyncio
+import time
+
+import pytest
+
+from carbonai.measure import Measure, get_task_clock
+from carbonai.utils import (
+    TOTAL_ENERGY_CPU,
+    TOTAL_ENERGY_PROCESS_CPU,
+    TOTAL_ENERGY_PROCESS_MEMORY,
+)
+
+
+def busy_wait(duration):
+    end = time.thread_time() + duration
+    while time.thread_time() < end:
+        pass
+
+
+def snapshot(cpu_energy, memory_energy):
+    return {
+        TOTAL_ENERGY_CPU: cpu_energy,
+        TOTAL_ENERGY_PROCESS_CPU: cpu_energy,
+        TOTAL_ENERGY_PROCESS_MEMORY: memory_energy,
+    }
+
+
+@pytest.mark.parametrize(
+    "cpu_times, task_time, cpu_energy, memory_energy",
+    [
+        # 2s of the thread over 8s busy and 4s of the process
+        ((18, 14, 7), None, 25, 50),
+        # the task time replaces the thread time
+        ((18, 14, 9), 2, 25, 50),
+        # no busy time nor process time
+        ((10, 10, 5), None, 0, 0),
+        # the shares are at most 1 with CPU times read at different times
+        ((11, 11, 9), None, 100, 100),
+        # the thread has exited
+        ((18, 14, None), None, 100, 100),
+    ],
+)
+def test_measure_shares(cpu_times, task_time, cpu_energy, memory_energy):
+    """
+    Make sure the process energy is split with the CPU time of the thread.
+    """
+    measure = Measure("numpy", "test")
+    measure.start(snapshot(100, 100), cpu_times=(10, 10, 5))
+    measure.task_time = task_time
+    record = measure.stop(snapshot(200, 200), cpu_times=cpu_times)
+    assert record[TOTAL_ENERGY_CPU] == 100
+    assert record[TOTAL_ENERGY_PROCESS_CPU] == cpu_energy
+    assert record[TOTAL_ENERGY_PROCESS_MEMORY] == memory_energy
+
+
+def test_measure_process():
+    """
+    Make sure the process energy is kept without CPU times.
+    """
+    measure = Measure("numpy", "test")
+    measure.start(snapshot(100, 100))
+    record = measure.stop(snapshot(200, 150), cpu_times=(18, 14, 7))
+    assert record[TOTAL_ENERGY_PROCESS_CPU] == 100
+    assert record[TOTAL_ENERGY_PROCESS_MEMORY] == 50
+
+
+def test_task_clock():
+    """
+    Make sure only the CPU time of the steps of the task is counted, with the
+    steps of the tasks it creates.
+    """
+
+    async def measured():
+        clock = get_task_clock()
+        for _ in range(5):
+            busy_wait(0.01)
+            await asyncio.sleep(0)
+        return clock
+
+    async def other():
+        for _ in range(5):
+            busy_wait(0.02)
+            await asyncio.sleep(0)
+
+    async def main():
+        clock = get_task_clock()
+        # the steps are counted from the next one
+        await asyncio.sleep(0)
+        busy_wait(0.01)
+        return clock, await asyncio.gather(measured(), other())
+
+    main_clock, (clock, _) = asyncio.run(main())
+    assert clock.parent is main_clock
+    assert 0.05 <= clock.read() < 0.08
+    assert 0.16 <= main_clock.read() < 0.2
+
+
+def test_task_clock_outside_task():
+    """
+    Make sure no clock is returned outside of a task.
+    """
+    assert get_task_clock() is None
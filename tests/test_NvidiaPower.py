@@ -0,0 +1,151 @@
+"""
+tests for the Python classes monitoring the GPU power usage
+"""
+import os
+import sys
+import time
+import types
+
+import pytest
+
+from carbonai.nvidia_power import NvidiaPower, NvmlPower
+from carbonai.sampler import Sampler
+from carbonai.utils import (
+    TOTAL_ENERGY_GPU,
+    TOTAL_ENERGY_PROCESS_GPU,
+    TOTAL_GPU_TIME,
+)
+
+
+class NVMLError(Exception):
+    pass
+
+
+class NVMLError_NotFound(NVMLError):
+    pass
+
+
+def stub_nvml(energies, powers):
+    """
+    A stub of the NVML bindings, the first GPU has an energy counter (in mJ)
+    and is shared by two processes, the second one only reports its power
+    draw (in mW) and is not used by any process
+    """
+    nvml = types.SimpleNamespace(
+        NVMLError=NVMLError, NVMLError_NotFound=NVMLError_NotFound
+    )
+    nvml.nvmlInit = lambda: None
+    nvml.nvmlShutdown = lambda: None
+    nvml.nvmlDeviceGetCount = lambda: 2
+    nvml.nvmlDeviceGetHandleByIndex = lambda index: index
+
+    def get_energy(handle):
+        if handle == 1:
+            raise NVMLError("Not Supported")
+        return energies[handle]
+
+    nvml.nvmlDeviceGetTotalEnergyConsumption = get_energy
+    nvml.nvmlDeviceGetPowerUsage = lambda handle: powers[handle]
+
+    def get_process_utilization(handle, last_seen_time):
+        if handle == 1:
+            raise NVMLError_NotFound("Not Found")
+        return [
+            types.SimpleNamespace(
+                pid=42, timeStamp=last_seen_time + 1, smUtil=30, memUtil=5
+            ),
+            types.SimpleNamespace(
+                pid=43, timeStamp=last_seen_time + 1, smUtil=10, memUtil=5
+            ),
+        ]
+
+    nvml.nvmlDeviceGetProcessUtilization = get_process_utilization
+    return nvml
+
+
+def test_nvml_power(monkeypatch):
+    """
+    Make sure the energy counters are used when available and the power
+    draws are integrated otherwise
+    """
+    energies = [1000]
+    powers = [0, 3600]
+    nvml = stub_nvml(energies, powers)
+    assert NvmlPower.is_available(nvml)
+    clock = iter([0, 10, 20])
+    monkeypatch.setattr(
+        "carbonai.nvidia_power.time.monotonic", lambda: next(clock)
+    )
+    # a shared sampler is never started by the GPU monitor
+    gpu_power = NvmlPower(sampler=Sampler(), nvml=nvml, process_id=42)
+    gpu_power.start()
+    energies[0] += 36000
+    # 3.6 W during 10 s for each GPU, the process uses 75% of the first one
+    assert gpu_power.snapshot() == {
+        TOTAL_GPU_TIME: 10,
+        TOTAL_ENERGY_GPU: pytest.approx(20),
+        TOTAL_ENERGY_PROCESS_GPU: pytest.approx(7.5),
+    }
+    gpu_power.stop()
+    assert gpu_power.record[TOTAL_GPU_TIME] == 20
+    assert gpu_power.record[TOTAL_ENERGY_GPU] == pytest.approx(30)
+    assert gpu_power.record[TOTAL_ENERGY_PROCESS_GPU] == pytest.approx(7.5)
+
+
+def test_nvml_missing():
+    assert not NvmlPower.is_available(
+        types.SimpleNamespace(
+            NVMLError=NVMLError,
+            nvmlInit=lambda: (_ for _ in ()).throw(NVMLError("no driver")),
+        )
+    )
+
+
+FAKE_NVIDIA_SMI = """#!{python}
+import time
+lines = [
+    "0, 2022/05/03 23:59:59.500, 100.00",
+    "1, 2022/05/03 23:59:59.500, 50.00",
+    "0, 2022/05/04 00:00:00.500, 200.00",
+    "1, 2022/05/04 00:00:00.500, [N/A]",
+    "1, 2022/05/04 00:00:01.500, 50.00",
+]
+for line in lines:
+    print(line, flush=True)
+time.sleep(60)
+"""
+
+
+@pytest.fixture
+def fake_nvidia_smi(tmp_path, monkeypatch):
+    """
+    A fake nvidia-smi streaming power draws of two GPUs
+    """
+    nvidia_smi = tmp_path / "nvidia-smi"
+    nvidia_smi.write_text(FAKE_NVIDIA_SMI.format(python=sys.executable))
+    nvidia_smi.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+
+def test_nvidia_power(fake_nvidia_smi):
+    """
+    Make sure the energy of each GPU is integrated with the timestamps
+    """
+    gpu_power = NvidiaPower(interval=0.5)
+    gpu_power.start()
+    deadline = time.monotonic() + 5
+    while (
+        gpu_power.snapshot()[TOTAL_GPU_TIME] < 2
+        and time.monotonic() < deadline
+    ):
+        time.sleep(0.01)
+    gpu_power.stop()
+    energies = gpu_power.device_energies
+    # the first GPU averages 150 W during 1 s, the second one 50 W during 2 s
+    assert energies[0] == pytest.approx(150 / 3.6)
+    assert energies[1] == pytest.approx(100 / 3.6)
+    assert gpu_power.record == {
+        TOTAL_GPU_TIME: 2,
+        TOTAL_ENERGY_GPU: pytest.approx(250 / 3.6),
+        TOTAL_ENERGY_PROCESS_GPU: pytest.approx(250 / 3.6),
+    }
@@ -1,17 +1,40 @@
 """
 tests for the Python class PowerGadget
 """
+
+import datetime
+import shutil
+import struct
+import sys
+import time
 from pathlib import Path
+from types import SimpleNamespace
 
 import pytest
 
 # from carbonai import PowerGadget
-from carbonai.power_gadget import PowerGadget
+import carbonai.power_gadget as power_gadget_module
+from carbonai.power_gadget import (
+    MsrReader,
+    PowerGadget,
+    PowerGadgetLinuxPowerSupply,
+    PowerGadgetLinuxRAPL,
+    PowerGadgetMac,
+    PowerGadgetWin,
+    PowerLogReader,
+    PowerSupplyReader,
+    RaplReader,
+    find_powercap_zones,
+    read_powerlog,
+)
 from carbonai.utils import (
     TOTAL_CPU_TIME,
     TOTAL_ENERGY_ALL,
     TOTAL_ENERGY_CPU,
     TOTAL_ENERGY_MEMORY,
+    TOTAL_ENERGY_PROCESS_CPU,
+    TOTAL_ENERGY_PROCESS_MEMORY,
+    TOTAL_ENERGY_PSYS,
 )
 
 
@@ -29,3 +52,363 @@ def test_parse_log(data):
     assert round(results[TOTAL_ENERGY_ALL], 2) == 1.38
     assert round(results[TOTAL_ENERGY_CPU], 2) == 1.05
     assert round(results[TOTAL_ENERGY_MEMORY], 2) == 0.38
+
+
+MIDNIGHT_POWERLOG = """\
+"System Time","Elapsed Time (sec)","Cumulative Processor Energy_0(mWh)",\
+"Cumulative IA Energy_0(mWh)","Cumulative DRAM Energy_0(mWh)"
+"23:59:58:500","   0.500","   2.000","   1.000","   1.000"
+"23:59:59:500","   1.500","   5.000","   3.000","   2.000"
+"00:00:00:500","   2.500","   9.000","   6.000","   3.000"
+"00:00:01:500","   3.500","  14.000","  10.000","   4.000"
+
+"Total Elapsed Time (sec) = 3.600000"
+"Cumulative Processor Energy_0 (mWh) = 14.000000"
+"Cumulative IA Energy_0 (mWh) = 10.000000"
+"Cumulative DRAM Energy_0 (mWh) = 4.000000"
+"""
+
+
+def test_parse_log_process_usage(tmp_path):
+    """
+    Make sure the process usage is matched with the energy of each second,
+    across midnight
+    """
+    log_file = tmp_path / "PwrData_2022-5-3-23-59-58.csv"
+    log_file.write_text(MIDNIGHT_POWERLOG)
+    process_usage = [
+        (datetime.datetime(2022, 5, 3, 23, 59, 58, 600000), 0.1, 0.5),
+        (datetime.datetime(2022, 5, 3, 23, 59, 59, 200000), 0.2, 0.5),
+        (datetime.datetime(2022, 5, 3, 23, 59, 59, 800000), 0.4, 0.5),
+        # no sample during the last second, the previous one is used
+        (datetime.datetime(2022, 5, 4, 0, 0, 0, 700000), 0.5, 0.5),
+    ]
+    results = PowerGadget.parse_log(log_file, process_usage=process_usage)
+    assert results[TOTAL_CPU_TIME] == 3.6
+    assert results[TOTAL_ENERGY_ALL] == 14
+    assert results[TOTAL_ENERGY_CPU] == 10
+    assert results[TOTAL_ENERGY_MEMORY] == 4
+    # 1 mWh at 10%, 2 mWh at 30% and 3 then 4 mWh at 50%
+    assert results[TOTAL_ENERGY_PROCESS_CPU] == pytest.approx(4.2)
+    assert results[TOTAL_ENERGY_PROCESS_MEMORY] == pytest.approx(2)
+    times, energies, summary = read_powerlog(log_file, chunksize=3)
+    assert times.tolist() == [86398.5, 86399.5, 0.5, 1.5]
+    assert energies[TOTAL_ENERGY_CPU].tolist() == [1, 3, 6, 10]
+    assert summary == {
+        TOTAL_CPU_TIME: 3.6,
+        TOTAL_ENERGY_ALL: 14,
+        TOTAL_ENERGY_CPU: 10,
+        TOTAL_ENERGY_MEMORY: 4,
+    }
+
+
+def test_powerlog_reader(data, tmp_path):
+    """
+    Make sure the rows of a log are parsed as they are appended
+    """
+    log_file = tmp_path / "intelPowerLog.csv"
+    content = data.read_bytes()
+    reader = PowerLogReader(log_file)
+    assert reader.read()[TOTAL_ENERGY_ALL] == 0
+    # the header, the first row and a part of the second one
+    cut = content.index(b"\n", content.index(b"\n") + 1) + 20
+    log_file.write_bytes(content[:cut])
+    assert reader.read() == {
+        TOTAL_CPU_TIME: 0.501,
+        TOTAL_ENERGY_ALL: 0.789,
+        TOTAL_ENERGY_CPU: 0.638,
+        TOTAL_ENERGY_MEMORY: 0.138,
+    }
+    with open(log_file, "ab") as file:
+        file.write(content[cut:])
+    # the summary at the end of the log is ignored
+    assert reader.read() == {
+        TOTAL_CPU_TIME: 2.025,
+        TOTAL_ENERGY_ALL: 1.382,
+        TOTAL_ENERGY_CPU: 1.048,
+        TOTAL_ENERGY_MEMORY: 0.383,
+    }
+    reader.close()
+
+
+FAKE_POWERLOG = """#!{python}
+import signal
+import sys
+import time
+
+log_file = open(sys.argv[sys.argv.index("-file") + 1], "w")
+signal.signal(signal.SIGINT, lambda *_: sys.exit(0))
+log_file.write(
+    '"System Time","Elapsed Time (sec)","Cumulative Processor Energy_0(mWh)",'
+    '"Cumulative IA Energy_0(mWh)","Cumulative DRAM Energy_0(mWh)"\\n'
+)
+for row in range(1, 6):
+    log_file.write(f'"10:00:0{{row}}:000","{{row}}.000","{{row * 2}}.000",')
+    log_file.flush()
+    time.sleep(0.01)
+    log_file.write(f'"{{row}}.000","{{row / 2:.3f}}"\\n')
+    log_file.flush()
+try:
+    time.sleep(60)
+finally:
+    log_file.write('\\n"Total Elapsed Time (sec) = 5.000000"\\n')
+    log_file.close()
+"""
+
+
+def test_mac_power_gadget(tmp_path):
+    """
+    Make sure the log of a single PowerLog is tailed during the measure
+    """
+    powerlog = tmp_path / "PowerLog"
+    powerlog.write_text(FAKE_POWERLOG.format(python=sys.executable))
+    powerlog.chmod(0o755)
+    power_gadget = PowerGadgetMac(
+        powerlog_path=powerlog,
+        powerlog_save_path=tmp_path / "intelPowerLog.csv",
+        interval=0.01,
+    )
+    power_gadget.start()
+    process = power_gadget.powerlog_process
+    deadline = time.monotonic() + 5
+    while (
+        power_gadget.snapshot()[TOTAL_CPU_TIME] < 5
+        and time.monotonic() < deadline
+    ):
+        time.sleep(0.01)
+    assert power_gadget.powerlog_process is process
+    power_gadget.stop()
+    assert process.returncode == 0
+    assert power_gadget.record[TOTAL_CPU_TIME] == 5
+    assert power_gadget.record[TOTAL_ENERGY_ALL] == 10
+    assert power_gadget.record[TOTAL_ENERGY_CPU] == 5
+    assert power_gadget.record[TOTAL_ENERGY_MEMORY] == 2.5
+
+
+def test_win_process_usage(tmp_path, monkeypatch):
+    """
+    Make sure the process usage is averaged per second as it is sampled
+    """
+    powerlog = tmp_path / "PowerLog3.0.exe"
+    powerlog.touch()
+    power_gadget = PowerGadgetWin(
+        powerlog_path=powerlog, powerlog_save_path=tmp_path, interval=0.01
+    )
+    start = datetime.datetime(2022, 5, 3, 23, 59, 58)
+    sample_times = iter([start.timestamp() + 0.01 * i for i in range(300)])
+    usages = iter([(i % 2, 0.5) for i in range(300)])
+    monkeypatch.setattr(
+        power_gadget_module,
+        "time",
+        SimpleNamespace(time=lambda: next(sample_times)),
+    )
+    monkeypatch.setattr(
+        power_gadget.usage_reader, "read", lambda: next(usages)
+    )
+    for _ in range(300):
+        power_gadget.sample()
+    # the running second is still summed
+    assert len(power_gadget.process_usage) == 2
+    times, cpu_usages, memory_usages = zip(
+        *power_gadget.process_usage.get_samples()
+    )
+    assert list(times) == [start.timestamp(), start.timestamp() + 1]
+    assert list(cpu_usages) == [0.5, 0.5]
+    assert list(memory_usages) == [0.5, 0.5]
+
+
+@pytest.fixture
+def rapl_path(tmp_path):
+    """
+    A fake powercap tree with one socket, its subzones, a psys zone and the
+    package zone exposed again through MMIO
+    """
+    for zone, name, energy in [
+        ("intel-rapl/intel-rapl:0", "package-0", 1000),
+        ("intel-rapl/intel-rapl:0/intel-rapl:0:0", "core", 500),
+        ("intel-rapl/intel-rapl:0/intel-rapl:0:1", "dram", 200),
+        ("intel-rapl/intel-rapl:0/intel-rapl:0:2", "uncore", 100),
+        ("intel-rapl/intel-rapl:1", "psys", 5000),
+        ("intel-rapl-mmio/intel-rapl-mmio:0", "package-0", 1000),
+    ]:
+        zone_path = tmp_path / zone
+        zone_path.mkdir(parents=True)
+        (zone_path / "name").write_text(name + "\n")
+        (zone_path / "energy_uj").write_text(f"{energy}\n")
+        (zone_path / "max_energy_range_uj").write_text("262143328850\n")
+    # the powercap class also links every zone at its root
+    (tmp_path / "intel-rapl:0").symlink_to(
+        tmp_path / "intel-rapl/intel-rapl:0"
+    )
+    return tmp_path
+
+
+def test_find_powercap_zones(rapl_path):
+    """
+    Make sure every zone is found once.
+    """
+    zones = find_powercap_zones(rapl_path)
+    assert [(zone.socket, zone.name) for zone in zones] == [
+        (0, "package"),
+        (0, "core"),
+        (0, "dram"),
+        (0, "uncore"),
+        (1, "psys"),
+    ]
+    assert {zone.control_type for zone in zones} == {"intel-rapl"}
+    for zone in zones:
+        zone.close()
+
+
+def test_rapl_reader(rapl_path):
+    """
+    Make sure the RAPL reader returns the energy drained between two reads,
+    even when a counter wraps around.
+    """
+    reader = RaplReader([0], rapl_path=rapl_path)
+    assert reader.n_drams == 1
+    (rapl_path / "intel-rapl:0/energy_uj").write_text("3000\n")
+    (rapl_path / "intel-rapl:0/intel-rapl:0:1/energy_uj").write_text("700\n")
+    (rapl_path / "intel-rapl/intel-rapl:1/energy_uj").write_text("9000\n")
+    assert reader.read() == {
+        "package": 2000,
+        "core": 0,
+        "uncore": 0,
+        "dram": 500,
+        "psys": 4000,
+    }
+    (rapl_path / "intel-rapl:0/energy_uj").write_text("1000\n")
+    assert reader.read()["package"] == 262143326850
+    reader.close()
+
+
+def write_msr(msr_file, position, value):
+    with open(msr_file, "r+b") as f:
+        f.seek(position)
+        f.write(struct.pack("Q", value))
+
+
+def test_msr_reader(tmp_path):
+    """
+    Make sure the MSR reader converts the energy status with the units read
+    at start and accumulates the overflows of the 32 bits counters.
+    """
+    msr_file = tmp_path / "msr0"
+    msr_file.write_bytes(bytes(0x640))
+    # energy status unit of 2^-14 J
+    write_msr(msr_file, MsrReader.MSR_RAPL_POWER_UNIT, 14 << 8)
+    write_msr(msr_file, MsrReader.MSR_PKG_ENERGY_STATUS, 0xFFFFC000)
+    write_msr(msr_file, MsrReader.MSR_DRAM_ENERGY_STATUS, 0)
+    reader = MsrReader({0: 0}, msr_path=str(tmp_path / "msr{}"))
+    write_msr(msr_file, MsrReader.MSR_PKG_ENERGY_STATUS, 0x10000)
+    write_msr(msr_file, MsrReader.MSR_DRAM_ENERGY_STATUS, 0x1_0000_4000)
+    cpu_energy, dram_energy = reader.read()
+    # 0x4000 before the overflow and 0x10000 after, i.e. 5 J
+    assert round(cpu_energy, 6) == round(5 / 3.6, 6)
+    assert round(dram_energy, 6) == round(1 / 3.6, 6)
+    reader.close()
+
+
+@pytest.fixture
+def cpu_ids_dir(tmp_path, monkeypatch):
+    """
+    A fake cpu topology with a single socket
+    """
+    topology_path = tmp_path / "cpu0/topology"
+    topology_path.mkdir(parents=True)
+    (topology_path / "physical_package_id").write_text("0\n")
+    monkeypatch.setattr(
+        power_gadget_module,
+        "CPU_IDS_DIR",
+        str(tmp_path / "cpu*/topology/physical_package_id"),
+    )
+
+
+def test_rapl_power_gadget(rapl_path, cpu_ids_dir):
+    """
+    Make sure the RAPL gadget sums the energy drained during the measure.
+    """
+    power_gadget = PowerGadgetLinuxRAPL(rapl_path=rapl_path, interval=0.01)
+    power_gadget.start()
+    (rapl_path / "intel-rapl:0/energy_uj").write_text("3601000\n")
+    time.sleep(0.05)
+    power_gadget.stop()
+    assert round(power_gadget.record[TOTAL_ENERGY_CPU], 6) == 1
+    assert round(power_gadget.record[TOTAL_ENERGY_ALL], 6) == 1
+    assert power_gadget.record[TOTAL_ENERGY_PSYS] == 0
+    assert power_gadget.record[TOTAL_ENERGY_MEMORY] == 0
+    assert power_gadget.record[TOTAL_CPU_TIME] > 0
+
+
+@pytest.fixture
+def power_supply_path(tmp_path):
+    """
+    A fake sysfs with a discharging battery, a charging one, an USB supply
+    and a mains adapter which does not report its power
+    """
+    for supply, files in [
+        ("AC", {"type": "Mains", "online": 0}),
+        (
+            "BAT0",
+            {"type": "Battery", "status": "Discharging", "power_now": 10**7},
+        ),
+        (
+            "BAT1",
+            {"type": "Battery", "status": "Charging", "power_now": 10**7},
+        ),
+        (
+            "usb",
+            {"type": "USB", "current_now": 10**6, "voltage_now": 5 * 10**6},
+        ),
+    ]:
+        supply_path = tmp_path / supply
+        supply_path.mkdir()
+        for filename, value in files.items():
+            (supply_path / filename).write_text(f"{value}\n")
+    return tmp_path
+
+
+def test_power_supply_reader(power_supply_path):
+    """
+    Make sure only the supplies powering the machine are read.
+    """
+    reader = PowerSupplyReader(power_supply_path)
+    assert sorted(reader.supplies) == ["BAT0", "BAT1", "usb"]
+    # 10 W from the battery and 5 W from the USB supply
+    assert reader.read() == 15 * 10**6
+    reader.close()
+
+
+def test_power_supply_on_ac(power_supply_path, caplog):
+    """
+    Make sure the power supplies are not used on AC power, when the batteries
+    are not discharging.
+    """
+    assert PowerGadgetLinuxPowerSupply.is_available(power_supply_path)
+    (power_supply_path / "BAT0/status").write_text("Full\n")
+    assert PowerGadgetLinuxPowerSupply.is_available(power_supply_path)
+    shutil.rmtree(power_supply_path / "usb")
+    assert not PowerGadgetLinuxPowerSupply.is_available(power_supply_path)
+    power_gadget = PowerGadgetLinuxPowerSupply(
+        power_supply_path=power_supply_path
+    )
+    power_gadget.start()
+    power_gadget.stop()
+    assert "AC power" in caplog.text
+
+
+def test_power_supply_power_gadget(power_supply_path, cpu_ids_dir):
+    """
+    Make sure the power gadget integrates the power of the supplies.
+    """
+    power_gadget = PowerGadgetLinuxPowerSupply(
+        power_supply_path=power_supply_path, interval=0.01
+    )
+    power_gadget.start()
+    time.sleep(0.05)
+    power_gadget.stop()
+    record = power_gadget.record
+    assert record[TOTAL_ENERGY_ALL] == pytest.approx(
+        15 * record[TOTAL_CPU_TIME] / 3.6
+    )
+    assert record[TOTAL_ENERGY_PSYS] == record[TOTAL_ENERGY_ALL]
@@ -0,0 +1,92 @@
+"""
+tests for the batch parsing of the logs of Intel Power Gadget
+"""
+import datetime
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from carbonai import PowerMeter
+from carbonai.__main__ import main
+from carbonai.power_logs import find_power_logs, parse_power_logs
+from carbonai.utils import TOTAL_ENERGY_ALL
+
+
+@pytest.fixture
+def archives(tmp_path):
+    """
+    Archived logs of a Windows and a Mac workstation, and a broken log
+    """
+    data = Path.cwd() / "tests/data/test_intel_power_log.csv"
+    (tmp_path / "windows").mkdir()
+    (tmp_path / "mac/2022").mkdir(parents=True)
+    shutil.copy(data, tmp_path / "windows/PwrData_2022-5-3-10-0-0.csv")
+    shutil.copy(data, tmp_path / "mac/2022/intelPowerLog.csv")
+    (tmp_path / "windows/PwrData_2022-5-3-11-0-0.csv").write_text("broken")
+    (tmp_path / "windows/notes.csv").write_text("not a log")
+    return tmp_path
+
+
+def test_find_power_logs(archives):
+    """
+    Make sure the logs are found in directories and with glob patterns
+    """
+    assert find_power_logs(archives) == [
+        archives / "mac/2022/intelPowerLog.csv",
+        archives / "windows/PwrData_2022-5-3-10-0-0.csv",
+        archives / "windows/PwrData_2022-5-3-11-0-0.csv",
+    ]
+    assert find_power_logs(str(archives / "**/intelPowerLog.csv")) == [
+        archives / "mac/2022/intelPowerLog.csv"
+    ]
+
+
+def test_parse_power_logs(archives):
+    """
+    Make sure the logs are parsed by a pool of processes and the broken ones
+    are skipped
+    """
+    parsed_logs = parse_power_logs(archives, max_workers=2)
+    assert [power_log.name for power_log, *_ in parsed_logs] == [
+        "intelPowerLog.csv",
+        "PwrData_2022-5-3-10-0-0.csv",
+    ]
+    _, record, end_time, platform = parsed_logs[1]
+    assert round(record[TOTAL_ENERGY_ALL], 2) == 1.38
+    assert end_time == datetime.datetime(2022, 5, 3, 10, 0, 2, 24626)
+    assert platform == "win32"
+    assert parsed_logs[0][3] == "darwin"
+
+
+def test_power_logs_command(archives, monkeypatch):
+    """
+    Make sure the command line writes the records of the logs without
+    looking for the power monitors of the machine
+    """
+
+    def no_power_meter(*args, **kwargs):
+        raise AssertionError("the command line built a PowerMeter")
+
+    monkeypatch.setattr(PowerMeter, "__init__", no_power_meter)
+    output = archives / "emissions.csv"
+    main(
+        [
+            str(archives),
+            "--output",
+            str(output),
+            "--workers",
+            "1",
+            "--location",
+            "FR",
+            "--project-name",
+            "Archives",
+        ]
+    )
+    records = pd.read_csv(output)
+    assert len(records) == 2
+    assert list(records["Project name"]) == ["Archives", "Archives"]
+    assert list(records["Platform"]) == ["darwin", "win32"]
+    assert (records["Cumulative process CPU Energy (mWh)"] > 0).all()
+    assert (records["CO2 emitted (gCO2e)"] > 0).all()
@@ -1,11 +1,23 @@
 """
 tests for the Python class PowerMeter
 """
+import asyncio
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pandas as pd
 import pytest
 
 from carbonai.power_meter import PowerMeter
+from carbonai.utils import (
+    TOTAL_CPU_TIME,
+    TOTAL_ENERGY_CPU,
+    TOTAL_ENERGY_PROCESS_CPU,
+)
 
 
 @pytest.fixture
@@ -20,3 +32,255 @@ def test_from_config(data):
     power_meter = PowerMeter.from_config(data)
     assert power_meter.project == "Project Test"
     assert power_meter.user == "customUsernameTest"
+
+
+@pytest.fixture
+def power_meter(tmp_path):
+    power_meter = PowerMeter(
+        project_name="Project Test",
+        is_online=False,
+        location="FR",
+        filepath=tmp_path / "emissions.csv",
+        interval=0.01,
+    )
+    yield power_meter
+    power_meter.close()
+
+
+def test_nested_measures(power_meter):
+    """
+    Make sure nested measures share the sampler and each get a record.
+    """
+    with power_meter("numpy", "parent"):
+        sampler_thread = power_meter.sampler.thread
+        with power_meter("numpy", "child"):
+            time.sleep(0.05)
+            assert power_meter.sampler.thread is sampler_thread
+        time.sleep(0.02)
+    power_meter.flush()
+    records = pd.read_csv(power_meter.filepath).set_index("Algorithm")
+    assert list(records.index) == ["child", "parent"]
+    assert (
+        records.loc["child", "Parent measure ID"]
+        == records.loc["parent", "Measure ID"]
+    )
+    assert (
+        records.loc["parent", TOTAL_CPU_TIME]
+        > records.loc["child", TOTAL_CPU_TIME]
+        > 0
+    )
+
+
+def test_concurrent_measures(tmp_path):
+    """
+    Make sure measures running in several threads are recorded separately.
+    """
+    power_meter = PowerMeter(
+        project_name="Project Test",
+        is_online=False,
+        location="FR",
+        filepath=tmp_path / "emissions.csv",
+        interval=0.01,
+        attribution="thread",
+    )
+
+    def work(algorithm):
+        with power_meter("numpy", algorithm):
+            end = time.monotonic() + 0.1
+            while time.monotonic() < end:
+                pass
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(work, ["first", "second"]))
+    power_meter.close()
+    power_meter.flush()
+    records = pd.read_csv(power_meter.filepath).set_index("Algorithm")
+    assert sorted(records.index) == ["first", "second"]
+    assert records["Parent measure ID"].isna().all()
+    assert (
+        records[TOTAL_ENERGY_PROCESS_CPU] <= records[TOTAL_ENERGY_CPU] + 1e-9
+    ).all()
+
+
+FORKED_POWER_METER = None
+
+
+def measure_in_fork(step):
+    """
+    A measured function called by the workers of a forked pool
+    """
+
+    @FORKED_POWER_METER.measure_power("numpy", "forked")
+    def work(step):
+        time.sleep(0.01)
+        return step
+
+    return work(step)
+
+
+@pytest.mark.skipif(
+    sys.platform == "win32", reason="processes can't be forked on Windows"
+)
+def test_forked_measures(power_meter):
+    """
+    Make sure the measures of forked processes are written, nothing flushes
+    the buffered records in those processes.
+    """
+    global FORKED_POWER_METER
+    FORKED_POWER_METER = power_meter
+    measure_in_fork(0)
+    with multiprocessing.get_context("fork").Pool(2) as pool:
+        assert pool.map(measure_in_fork, range(1, 5)) == [1, 2, 3, 4]
+    power_meter.flush()
+    records = pd.read_csv(power_meter.filepath)
+    assert len(records) == 5
+
+
+def test_shared_context(tmp_path):
+    """
+    Make sure a context shared by several threads, or entered again inside
+    itself, stops the measure of each entry.
+    """
+    power_meter = PowerMeter(
+        project_name="Project Test",
+        is_online=False,
+        location="FR",
+        filepath=tmp_path / "emissions.csv",
+        interval=0.01,
+        attribution="thread",
+    )
+    context = power_meter("numpy", "shared")
+    barrier = threading.Barrier(2)
+
+    def work():
+        with context as measure:
+            barrier.wait()
+            with context as child:
+                assert child.parent is measure
+            barrier.wait()
+
+    threads = [threading.Thread(target=work) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    async def request():
+        async with context:
+            await asyncio.sleep(0.02)
+
+    async def main():
+        await asyncio.gather(request(), request())
+
+    asyncio.run(main())
+    power_meter.close()
+    power_meter.flush()
+    records = pd.read_csv(power_meter.filepath)
+    assert len(records) == 6
+    assert records["Parent measure ID"].notna().sum() == 2
+
+
+def test_stop_after_close(power_meter, caplog):
+    """
+    Make sure a measure dropped by the close is not recorded when stopped.
+    """
+    measure = power_meter.start_measure("numpy", "dropped")
+    power_meter.close()
+    power_meter.stop_measure(measure)
+    assert "won't be recorded" in caplog.text
+    power_meter.flush()
+    assert not power_meter.filepath.exists()
+    with pytest.raises(RuntimeError):
+        power_meter.stop_measure()
+
+
+def test_missing_ipmitool(tmp_path, caplog):
+    """
+    Make sure the wall power is not recorded when ipmitool is missing.
+    """
+    power_meter = PowerMeter(
+        is_online=False,
+        location="FR",
+        ipmi=[str(tmp_path / "ipmitool"), "shell"],
+    )
+    assert power_meter.wall_power is None
+    assert "ipmitool was not found" in caplog.text
+
+
+def test_unknown_attribution():
+    with pytest.raises(ValueError):
+        PowerMeter(is_online=False, location="FR", attribution="unknown")
+
+
+def test_async_measures(power_meter):
+    """
+    Make sure the measures of concurrent tasks are not nested in each other.
+    """
+
+    @power_meter.measure_power(package="asyncio", algorithm="request")
+    async def request(name):
+        await asyncio.sleep(0.02)
+        async with power_meter("asyncio", name):
+            await asyncio.sleep(0.02)
+        return name
+
+    async def main():
+        return await asyncio.gather(request("first"), request("second"))
+
+    assert asyncio.run(main()) == ["first", "second"]
+    power_meter.flush()
+    records = pd.read_csv(power_meter.filepath)
+    requests = records[records["Algorithm"] == "request"]
+    children = records[records["Algorithm"] != "request"]
+    assert len(requests) == 2
+    assert requests["Parent measure ID"].isna().all()
+    assert set(children["Parent measure ID"]) == set(requests["Measure ID"])
+
+
+def test_async_measures_shares(power_meter, monkeypatch):
+    """
+    Make sure concurrent async with blocks are only attributed the CPU time
+    of their own task.
+    """
+
+    no_power_snapshot = power_meter.power_gadget.snapshot
+
+    def snapshot():
+        # the CPU draws 1W
+        return dict(
+            no_power_snapshot(), **{TOTAL_ENERGY_CPU: time.monotonic() / 3.6}
+        )
+
+    monkeypatch.setattr(power_meter.power_gadget, "snapshot", snapshot)
+
+    def busy_wait(duration):
+        end = time.thread_time() + duration
+        while time.thread_time() < end:
+            pass
+
+    async def work(name, duration):
+        async with power_meter("asyncio", name) as measure:
+            for _ in range(5):
+                busy_wait(duration / 5)
+                await asyncio.sleep(0.02)
+        return measure
+
+    async def other():
+        # CPU time of the process used outside of the measures
+        for _ in range(5):
+            busy_wait(0.02)
+            await asyncio.sleep(0.02)
+
+    async def main():
+        return await asyncio.gather(
+            work("first", 0.05), work("second", 0.1), other()
+        )
+
+    first, second, _ = asyncio.run(main())
+    assert 0.05 <= first.task_time < 0.1
+    assert 0.1 <= second.task_time < 0.15
+    power_meter.flush()
+    records = pd.read_csv(power_meter.filepath).set_index("Algorithm")
+    shares = records[TOTAL_ENERGY_PROCESS_CPU] / records[TOTAL_ENERGY_CPU]
+    assert 0 < shares["first"] < shares["second"]
+    assert shares.sum() <= 1
@@ -0,0 +1,145 @@
+"""
+tests for the Python classes reading the process usage
+"""
+import os
+
+import pytest
+
+from carbonai.process_usage import CgroupUsage, CpuTimes, LinuxProcessUsage
+
+MEMINFO = "MemTotal: {} kB\nMemFree: 0 kB\nMemAvailable: {} kB\n"
+
+
+def write_process(process_path, process_time, resident_pages):
+    process_path.mkdir(exist_ok=True)
+    (process_path / "stat").write_text(
+        f"42 (my (python) app) S 1 42 42 0 -1 4194304 0 0 0 0 "
+        f"{process_time} 0 0 0 20 0 1 0 0 0 0\n"
+    )
+    (process_path / "statm").write_text(f"1000 {resident_pages} 0 0 0 0 0\n")
+
+
+def write_children(process_path, thread_id, children):
+    task_path = process_path / "task" / str(thread_id)
+    task_path.mkdir(parents=True)
+    (task_path / "children").write_text(" ".join(map(str, children)) + " ")
+
+
+def write_proc(proc_path, busy, idle, process_time, resident_pages):
+    (proc_path / "stat").write_text(
+        f"cpu  {busy} 0 0 {idle} 0 0 0 0 0 0\ncpu0 {busy} 0 0 {idle}\n"
+    )
+    write_process(proc_path / "self", process_time, resident_pages)
+
+
+@pytest.fixture
+def proc_path(tmp_path):
+    """
+    A fake procfs
+    """
+    (tmp_path / "self").mkdir()
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    # 8 pages are used on the machine
+    (tmp_path / "meminfo").write_text(
+        MEMINFO.format(16 * page_size // 1024, 8 * page_size // 1024)
+    )
+    write_proc(tmp_path, busy=100, idle=100, process_time=10, resident_pages=2)
+    return tmp_path
+
+
+def test_linux_process_usage(proc_path):
+    """
+    Make sure the process shares are computed from the procfs deltas
+    """
+    reader = LinuxProcessUsage(proc_path=proc_path)
+    write_proc(
+        proc_path, busy=200, idle=500, process_time=35, resident_pages=2
+    )
+    cpu_usage, memory_usage = reader.read()
+    assert cpu_usage == 0.25
+    assert memory_usage == 0.25
+    reader.close()
+
+
+def test_linux_process_tree_usage(proc_path):
+    """
+    Make sure the descendants of the process are included
+    """
+    write_children(proc_path / "self", 42, [43])
+    write_children(proc_path / "self", 50, [44])
+    write_process(proc_path / "43", process_time=5, resident_pages=1)
+    write_children(proc_path / "43", 43, [45])
+    write_process(proc_path / "44", process_time=5, resident_pages=1)
+    write_process(proc_path / "45", process_time=5, resident_pages=1)
+    reader = LinuxProcessUsage(proc_path=proc_path, include_children=True)
+    assert sorted(reader.children) == [43, 44, 45]
+    write_proc(
+        proc_path, busy=200, idle=500, process_time=20, resident_pages=2
+    )
+    for pid in [43, 44, 45]:
+        write_process(proc_path / str(pid), process_time=10, resident_pages=1)
+    cpu_usage, memory_usage = reader.read()
+    # 10 ticks of the process and 5 ticks of each child over 100 busy ticks
+    assert cpu_usage == 0.25
+    assert memory_usage == 0.625
+    reader.close()
+    assert reader.children == {}
+
+
+def test_cgroup_usage(proc_path, tmp_path_factory):
+    """
+    Make sure the cgroup shares are computed from its cpu.stat and
+    memory.current
+    """
+    cgroup_root = tmp_path_factory.mktemp("cgroup")
+    cgroup_path = cgroup_root / "unified/kubepods/pod42"
+    cgroup_path.mkdir(parents=True)
+    (proc_path / "self/cgroup").write_text(
+        "1:cpu:/\n0::/kubepods/pod42\n"
+    )
+    assert (
+        CgroupUsage.get_cgroup_path(proc_path, cgroup_root) == cgroup_path
+    )
+    clock_ticks = os.sysconf("SC_CLK_TCK")
+    page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def write_cgroup(ticks, pages):
+        (cgroup_path / "cpu.stat").write_text(
+            f"usage_usec {ticks * 10**6 // clock_ticks}\nuser_usec 0\n"
+        )
+        (cgroup_path / "memory.current").write_text(f"{pages * page_size}\n")
+
+    write_cgroup(ticks=10, pages=2)
+    # only the cgroup files are read for the usage
+    (proc_path / "self/stat").unlink()
+    (proc_path / "self/statm").unlink()
+    reader = CgroupUsage(cgroup_path, proc_path=proc_path)
+    write_proc(
+        proc_path, busy=200, idle=500, process_time=11, resident_pages=1
+    )
+    write_cgroup(ticks=60, pages=4)
+    cpu_usage, memory_usage = reader.read()
+    assert cpu_usage == pytest.approx(0.5)
+    assert memory_usage == 0.5
+    reader.close()
+
+
+def test_cpu_times(proc_path):
+    """
+    Make sure the CPU time of an exited thread is None
+    """
+    clock_ticks = os.sysconf("SC_CLK_TCK")
+    task_path = proc_path / "self/task/50"
+    task_path.mkdir(parents=True)
+    (task_path / "stat").write_text(
+        "50 (python) S 1 42 42 0 -1 4194304 0 0 0 0 4 1 0 0 20 0 1 0 0 0 0\n"
+    )
+    cpu_times = CpuTimes(proc_path=proc_path)
+    assert cpu_times.read(50) == (
+        100 / clock_ticks,
+        10 / clock_ticks,
+        5 / clock_ticks,
+    )
+    busy_time, process_time, thread_time = cpu_times.read(51)
+    assert busy_time == 100 / clock_ticks
+    assert thread_time is None
@@ -0,0 +1,21 @@
+"""
+tests for the Python class SampleBuffer
+"""
+from carbonai.sample_buffer import SampleBuffer
+
+
+def test_sample_buffer():
+    """
+    Make sure the buffer keeps the totals of every sample but only the last
+    ones in memory.
+    """
+    buffer = SampleBuffer(["time", "energy"], capacity=3)
+    for i in range(5):
+        buffer.append((1, i))
+    assert len(buffer) == 3
+    assert buffer.dropped == 2
+    assert buffer.get_totals() == {"time": 5, "energy": 10}
+    assert buffer.get_samples()[:, 1].tolist() == [2, 3, 4]
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.get_totals() == {"time": 0, "energy": 0}
@@ -0,0 +1,35 @@
+"""
+tests for the Python class Sampler
+"""
+import time
+
+import pytest
+
+from carbonai.sampler import Sampler
+
+
+def test_sampler():
+    """
+    Make sure the sampler calls its callbacks at the given rate and stops
+    without waiting for the next tick.
+    """
+    samples = []
+    sampler = Sampler(
+        [lambda: samples.append(time.monotonic())], interval=0.02
+    )
+    sampler.start()
+    time.sleep(0.25)
+    stop_time = time.monotonic()
+    sampler.stop()
+    assert time.monotonic() - stop_time < 0.01
+    assert not sampler.running
+    # 12 ticks and the final sample
+    assert 8 <= len(samples) <= 14
+
+
+def test_sampler_interval():
+    """
+    Make sure an interval below 10ms is refused
+    """
+    with pytest.raises(ValueError):
+        Sampler(interval=0.001)
@@ -0,0 +1,251 @@
+"""
+tests for the sinks writing the emissions records
+"""
+import datetime
+import json
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import carbonai.sinks as sinks_module
+from carbonai.sinks import (
+    BufferedSink,
+    CsvSink,
+    ExcelSink,
+    ParquetSink,
+    Sink,
+    SqliteSink,
+    get_sink,
+)
+
+RECORDS = [
+    {
+        "Datetime": "05/03/2022 23:59:59",
+        "Project name": "MNIST classifier",
+        "Cumulative IA Energy (mWh)": 1,
+        "PUE": 1.58,
+        "Step": "train",
+        "Data shape": None,
+    },
+    {
+        "Datetime": "05/04/2022 00:00:01",
+        "Project name": "MNIST classifier",
+        "Cumulative IA Energy (mWh)": 2.5,
+        "PUE": 1.58,
+        "Step": "test",
+        "Data shape": "(10, 2)",
+    },
+    {
+        "Datetime": "05/04/2022 00:00:02",
+        "Project name": "",
+        "Cumulative IA Energy (mWh)": 3,
+        "PUE": 1.58,
+        "Step": "other",
+        "Data shape": "",
+    },
+]
+
+
+class ListSink(Sink):
+    """
+    A sink keeping the batches of records written
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.written = threading.Event()
+
+    def write(self, records):
+        self.batches.append(records)
+        self.written.set()
+
+
+def test_buffered_sink_size():
+    """
+    Make sure the records are written in bulk once enough are buffered
+    """
+    sink = ListSink()
+    buffered_sink = BufferedSink(sink, flush_size=3, flush_interval=60)
+    buffered_sink.write([{"Step": 1}])
+    buffered_sink.write([{"Step": 2}])
+    time.sleep(0.05)
+    assert sink.batches == []
+    buffered_sink.write([{"Step": 3}])
+    assert sink.written.wait(5)
+    assert sink.batches == [[{"Step": 1}, {"Step": 2}, {"Step": 3}]]
+    buffered_sink.close()
+    # the sink writes right away once closed
+    buffered_sink.write([{"Step": 4}])
+    assert sink.batches[-1] == [{"Step": 4}]
+
+
+def test_buffered_sink_interval():
+    """
+    Make sure the records are written periodically and at the close
+    """
+    sink = ListSink()
+    buffered_sink = BufferedSink(sink, flush_size=100, flush_interval=0.05)
+    buffered_sink.write([{"Step": 1}])
+    assert sink.written.wait(5)
+    assert sink.batches == [[{"Step": 1}]]
+    buffered_sink.flush_interval = 60
+    time.sleep(0.1)
+    buffered_sink.write([{"Step": 2}])
+    buffered_sink.close()
+    assert sink.batches == [[{"Step": 1}], [{"Step": 2}]]
+    assert not buffered_sink.thread
+
+
+def test_csv_sink(tmp_path):
+    """
+    Make sure the records are aligned on the columns of the file, extended
+    with the new columns
+    """
+    sink = get_sink(tmp_path / "emissions.csv")
+    assert isinstance(sink, CsvSink)
+    sink.write([{"Step": "train", "Algorithm": "a", "PUE": 1.5}])
+    sink.write(
+        [
+            {"Algorithm": "b", "Step": "test", "Comment": "new"},
+            {"Algorithm": "c", "Step": "test"},
+        ]
+    )
+    sink.write([{"Algorithm": "d", "Comment": "known"}])
+    assert not (tmp_path / "emissions.csv.rewrite").exists()
+    records = pd.read_csv(sink.path)
+    assert list(records.columns) == ["Step", "Algorithm", "PUE", "Comment"]
+    assert list(records["Algorithm"]) == ["a", "b", "c", "d"]
+    assert list(records["PUE"].fillna(0)) == [1.5, 0, 0, 0]
+    assert list(records["Comment"].fillna("")) == ["", "new", "", "known"]
+
+
+def test_excel_sink_staging(tmp_path):
+    """
+    Make sure the records are staged without touching the workbook
+    """
+    sink = get_sink(tmp_path / "emissions.xlsx")
+    assert isinstance(sink, ExcelSink)
+    sink.write([{"Algorithm": "a", "Step": "train"}])
+    sink.write([{"Algorithm": "b", "Step": "test"}])
+    assert not sink.path.exists()
+    lines = sink.staging_path.read_text().splitlines()
+    assert [json.loads(line)["Algorithm"] for line in lines] == ["a", "b"]
+
+
+def test_excel_sink_materialize(tmp_path):
+    """
+    Make sure the staged records are added to the workbook
+    """
+    pytest.importorskip("openpyxl")
+    sink = ExcelSink(tmp_path / "emissions.xlsx")
+    sink.write([{"Algorithm": "a", "Step": "train"}])
+    assert sink.materialize() == 1
+    sink.write([{"Algorithm": "b", "Step": "test"}])
+    sink.flush()
+    assert not sink.staging_path.exists()
+    records = pd.read_excel(sink.path)
+    assert list(records["Algorithm"]) == ["a", "b"]
+    assert sink.materialize() == 0
+
+
+def test_parquet_typed_records():
+    """
+    Make sure the columns of the records are typed
+    """
+    data = ParquetSink.get_typed_records(RECORDS)
+    assert data["Datetime"][1] == datetime.datetime(2022, 5, 4, 0, 0, 1)
+    assert data["Cumulative IA Energy (mWh)"].dtype == float
+    assert data["PUE"].dtype == float
+    assert list(data["Data shape"]) == ["", "(10, 2)", ""]
+
+
+def test_parquet_sink_missing(tmp_path, monkeypatch):
+    """
+    Make sure a clear error is raised without pyarrow
+    """
+    monkeypatch.setattr(sinks_module, "pq", None)
+    with pytest.raises(ImportError):
+        get_sink(tmp_path / "emissions.parquet")
+
+
+def test_parquet_sink(tmp_path):
+    """
+    Make sure the records are partitioned by date and project
+    """
+    pytest.importorskip("pyarrow")
+    sink = get_sink(tmp_path / "emissions", output_format="parquet")
+    assert isinstance(sink, ParquetSink)
+    sink.write(RECORDS[:2])
+    sink.write(RECORDS[2:])
+    partitions = sorted(
+        str(path.parent.relative_to(sink.path))
+        for path in sink.path.glob("*/*/*.parquet")
+    )
+    assert partitions == [
+        "date=2022-05-03/project=MNIST%20classifier",
+        "date=2022-05-04/project=--",
+        "date=2022-05-04/project=MNIST%20classifier",
+    ]
+    records = pd.read_parquet(
+        sink.path, filters=[("date", "=", "2022-05-04")]
+    )
+    assert sorted(records["Step"]) == ["other", "test"]
+
+
+def test_sqlite_sink(tmp_path):
+    """
+    Make sure the records are inserted in an indexed table, with the columns
+    added by the newer records
+    """
+    sink = get_sink(tmp_path / "emissions.db")
+    assert isinstance(sink, SqliteSink)
+    sink.write([{key: RECORDS[0][key] for key in list(RECORDS[0])[:4]}])
+    sink.write(RECORDS[1:])
+    sink.close()
+    connection = sqlite3.connect(sink.path)
+    assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    indexes = {
+        row[1] for row in connection.execute("PRAGMA index_list(emissions)")
+    }
+    assert indexes == {
+        "emissions_project",
+        "emissions_step",
+        "emissions_datetime",
+    }
+    rows = connection.execute(
+        'SELECT Datetime, "Cumulative IA Energy (mWh)", Step FROM emissions '
+        "WHERE Datetime >= '2022-05-04' ORDER BY Datetime"
+    ).fetchall()
+    assert rows == [
+        ("2022-05-04 00:00:01", 2.5, "test"),
+        ("2022-05-04 00:00:02", 3.0, "other"),
+    ]
+    connection.close()
+
+
+def test_sqlite_sink_writers(tmp_path):
+    """
+    Make sure the columns added by another writer of the database are known
+    before adding the columns of the records
+    """
+    sinks = [SqliteSink(tmp_path / "emissions.db") for _ in range(2)]
+    for sink in sinks:
+        sink.write([{"Step": "train"}])
+    for sink in sinks:
+        sink.write([{"Step": "test", "Comment": f"{sink is sinks[0]}"}])
+    for sink in sinks:
+        sink.close()
+    connection = sqlite3.connect(tmp_path / "emissions.db")
+    rows = connection.execute(
+        "SELECT Step, Comment FROM emissions ORDER BY id"
+    ).fetchall()
+    connection.close()
+    assert rows == [
+        ("train", None),
+        ("train", None),
+        ("test", "True"),
+        ("test", "False"),
+    ]